@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modulo di benchmark end-to-end per i percorsi di ingestione e interrogazione.
+
+Esegue una serie di scenari con nome contro un server Elasticsearch stand-in locale,
+salva i risultati in JSON e li confronta con una baseline applicando soglie di regressione.
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from elk_profiling import ProfileSession, add_profiling_arguments
+from es_standin import EsStandInServer
+
+
+DEFAULT_DATASET = Path(__file__).parent / "datasets" / "Cleaned_DataSet.csv"
+DEFAULT_CHUNK_SIZES = [100, 500, 2000]
+DEFAULT_THRESHOLD = 10.0
+
+
+class Scenario:
+    """Scenario di benchmark con nome, unità di misura e funzione di misura"""
+
+    def __init__(self, name: str, unit: str, run: Callable[[], float], higher_is_better: bool = True):
+        """
+        Args:
+            name: Nome univoco dello scenario
+            unit: Unità di misura del risultato (es. "docs/s", "MB/s", "s")
+            run: Funzione che esegue una misura e restituisce il valore
+            higher_is_better: True se valori più alti indicano prestazioni migliori
+        """
+        self.name = name
+        self.unit = unit
+        self.run = run
+        self.higher_is_better = higher_is_better
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Sopprime l'output su stdout degli script durante le misure"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _scale_csv(source: Path, target: Path, scale: int) -> int:
+    """
+    Crea un CSV sintetico ripetendo le righe del dataset originale.
+
+    Args:
+        source: CSV di partenza
+        target: CSV sintetico da creare
+        scale: Numero di ripetizioni delle righe
+
+    Returns:
+        Dimensione in byte del file creato
+    """
+    with open(source, "r", encoding="utf-8") as f:
+        header = f.readline()
+        body = f.read()
+    if not body.endswith("\n"):
+        body += "\n"
+    with open(target, "w", encoding="utf-8") as f:
+        f.write(header)
+        for _ in range(scale):
+            f.write(body)
+    return target.stat().st_size
+
+
+def _synthetic_aggregation_response(actors: int, films_per_actor: int) -> Dict:
+    """
+    Costruisce una risposta di aggregazione sintetica con la forma prodotta
+    da MovieElasticsearchClient.aggregate_movies_by_actor.
+    """
+    aggregations = {}
+    for field in (1, 2, 3):
+        buckets = []
+        for a in range(actors):
+            hits = [
+                {"_source": {"movie_title": f"movie-{(a + f) % (actors * 2)}",
+                             f"actor_{field}_name": f"actor-{a}"}}
+                for f in range(films_per_actor)
+            ]
+            buckets.append({
+                "key": f"actor-{a}",
+                "doc_count": films_per_actor,
+                "movies": {"hits": {"hits": hits}}
+            })
+        aggregations[f"actor_{field}_aggregation"] = {"buckets": buckets}
+    return {
+        "took": 0,
+        "timed_out": False,
+        "hits": {"total": {"value": actors * films_per_actor, "relation": "eq"}, "hits": []},
+        "aggregations": aggregations
+    }
+
+
+def build_scenarios(server: EsStandInServer, workdir: Path, args) -> List[Scenario]:
+    """
+    Prepara gli scenari di benchmark.
+
+    Args:
+        server: Server stand-in già avviato
+        workdir: Directory temporanea per i file generati
+        args: Argomenti della riga di comando
+
+    Returns:
+        Lista di scenari pronti da eseguire
+    """
+    from elk_log_simulator import ElkLogSimulator
+    from elasticsearch_movie_query import MovieElasticsearchClient
+    from csv_to_json import csv_to_json
+
+    with _quiet():
+        simulator = ElkLogSimulator(host=server.host, port=server.port)
+    logs = simulator.generate_logs(args.docs, delay=0)
+    records = simulator.generate_records(args.docs, delay=0)
+
+    def log_generation() -> float:
+        start = time.perf_counter()
+        simulator.generate_logs(args.docs, delay=0)
+        return args.docs / (time.perf_counter() - start)
+
+    def bulk_ingest(chunk_size: int) -> Callable[[], float]:
+        def run() -> float:
+            with _quiet():
+                start = time.perf_counter()
+                simulator.send_logs_bulk(logs, index_name="services-log-bench", chunk_size=chunk_size)
+                elapsed = time.perf_counter() - start
+            return len(logs) / elapsed
+        return run
+
+    def encoded_ingest(chunk_size: int) -> Callable[[], float]:
+        def run() -> float:
+            with _quiet():
+                start = time.perf_counter()
+                simulator.send_records_bulk(records, index_name="services-log-bench", chunk_size=chunk_size)
+                elapsed = time.perf_counter() - start
+            return len(records) / elapsed
+        return run
+
+    scaled_csv = workdir / "scaled.csv"
+    csv_bytes = _scale_csv(Path(args.dataset), scaled_csv, args.csv_scale)
+    output_json = workdir / "scaled.json"
+
+    def csv_conversion() -> float:
+        with _quiet():
+            start = time.perf_counter()
+            csv_to_json(str(scaled_csv), str(output_json))
+            elapsed = time.perf_counter() - start
+        return csv_bytes / (1024 * 1024) / elapsed
+
+    # Stesso CSV compresso in gzip, convertito in JSON gzip (codec in thread separati)
+    scaled_gz = workdir / "scaled.csv.gz"
+    with open(scaled_csv, "rb") as src, gzip.open(scaled_gz, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+    output_gz = workdir / "scaled.json.gz"
+
+    def csv_conversion_gzip() -> float:
+        with _quiet():
+            start = time.perf_counter()
+            csv_to_json(str(scaled_gz), str(output_gz), compression_level=6)
+            elapsed = time.perf_counter() - start
+        return csv_bytes / (1024 * 1024) / elapsed
+
+    client = MovieElasticsearchClient(host=server.host, port=server.port)
+    server.search_response = _synthetic_aggregation_response(args.actors, args.films_per_actor)
+
+    def actor_aggregation() -> float:
+        start = time.perf_counter()
+        client.get_actor_film_list()
+        return time.perf_counter() - start
+
+    scenarios = [Scenario("log_generation", "docs/s", log_generation)]
+    for chunk_size in args.chunk_sizes:
+        scenarios.append(Scenario(f"bulk_ingest_chunk_{chunk_size}", "docs/s", bulk_ingest(chunk_size)))
+    for chunk_size in args.chunk_sizes:
+        scenarios.append(Scenario(f"encoded_ingest_chunk_{chunk_size}", "docs/s", encoded_ingest(chunk_size)))
+    scenarios.append(Scenario("csv_conversion", "MB/s", csv_conversion))
+    scenarios.append(Scenario("csv_conversion_gzip", "MB/s", csv_conversion_gzip))
+    scenarios.append(Scenario("actor_aggregation", "s", actor_aggregation, higher_is_better=False))
+    return scenarios
+
+
+def run_scenarios(scenarios: List[Scenario], repeat: int = 3,
+                  only: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """
+    Esegue gli scenari e raccoglie i risultati.
+
+    Per ogni scenario viene riportata la mediana delle misure e il valore migliore.
+
+    Args:
+        scenarios: Scenari da eseguire
+        repeat: Numero di ripetizioni per scenario
+        only: Nomi degli scenari da eseguire (None = tutti)
+
+    Returns:
+        Dizionario nome scenario -> risultato
+    """
+    results = {}
+    for scenario in scenarios:
+        if only and scenario.name not in only:
+            continue
+        samples = [scenario.run() for _ in range(repeat)]
+        best = max(samples) if scenario.higher_is_better else min(samples)
+        results[scenario.name] = {
+            "value": statistics.median(samples),
+            "best": best,
+            "unit": scenario.unit,
+            "higher_is_better": scenario.higher_is_better,
+            "samples": samples
+        }
+        print(f"  {scenario.name:<28} {results[scenario.name]['value']:>14.3f} {scenario.unit}")
+    return results
+
+
+def compare_with_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict],
+                          thresholds: Dict[str, float],
+                          default_threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    Confronta i risultati con una baseline.
+
+    Args:
+        results: Risultati correnti
+        baseline: Risultati della baseline (sezione "scenarios" del JSON)
+        thresholds: Soglie percentuali di regressione per scenario
+        default_threshold: Soglia percentuale usata se lo scenario non ne ha una propria
+
+    Returns:
+        Lista di confronti, uno per ogni scenario presente in entrambi
+    """
+    comparisons = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        previous = baseline[name]["value"]
+        if not previous:
+            continue
+        change = (current["value"] - previous) / previous * 100
+        # Variazione normalizzata: negativa = peggioramento
+        delta = change if current["higher_is_better"] else -change
+        threshold = thresholds.get(name, default_threshold)
+        comparisons.append({
+            "scenario": name,
+            "baseline": previous,
+            "current": current["value"],
+            "change_pct": change,
+            "threshold_pct": threshold,
+            "regression": delta < -threshold
+        })
+    return comparisons
+
+
+def _parse_thresholds(values: List[str]) -> Dict[str, float]:
+    thresholds = {}
+    for value in values:
+        name, _, pct = value.partition("=")
+        thresholds[name] = float(pct)
+    return thresholds
+
+
+def main(argv: Optional[List[str]] = None):
+    """Funzione principale per l'esecuzione da riga di comando."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark end-to-end dei percorsi di ingestione e interrogazione',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+        Esempi d'uso:
+        python benchmark.py -o bench_results.json
+        python benchmark.py --baseline bench_baseline.json --threshold csv_conversion=15
+        python benchmark.py --only log_generation --only csv_conversion --repeat 5
+        """
+    )
+
+    parser.add_argument('-o', '--output', default='bench_results.json',
+                        help='File JSON dei risultati (default: bench_results.json)')
+    parser.add_argument('-b', '--baseline', help='File JSON di baseline da confrontare')
+    parser.add_argument('-t', '--threshold', action='append', default=[], metavar='SCENARIO=PCT',
+                        help='Soglia di regressione percentuale per uno scenario')
+    parser.add_argument('--default-threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Soglia di regressione percentuale di default (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Ripetizioni per scenario (default: 3)')
+    parser.add_argument('--only', action='append', help='Esegue solo gli scenari indicati')
+    parser.add_argument('--docs', type=int, default=20000, help='Log generati e inviati (default: 20000)')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=DEFAULT_CHUNK_SIZES,
+                        help='Chunk size da misurare per il bulk (default: 100 500 2000)')
+    parser.add_argument('--dataset', default=str(DEFAULT_DATASET), help='CSV di partenza per la conversione')
+    parser.add_argument('--csv-scale', type=int, default=10,
+                        help='Fattore di scala sintetico del CSV (default: 10)')
+    parser.add_argument('--actors', type=int, default=2000,
+                        help='Attori per campo nella risposta di aggregazione sintetica (default: 2000)')
+    parser.add_argument('--films-per-actor', type=int, default=20,
+                        help='Film per attore nella risposta sintetica (default: 20)')
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    print(f"\n{'='*60}")
+    print("Benchmark contro server Elasticsearch stand-in")
+    print(f"{'='*60}\n")
+
+    with ProfileSession(args) as profiler, EsStandInServer() as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        with profiler.phase("setup"):
+            scenarios = build_scenarios(server, Path(tmp), args)
+        with profiler.phase("scenarios"):
+            results = run_scenarios(scenarios, repeat=args.repeat, only=args.only)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": results
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        comparisons = compare_with_baseline(
+            results, baseline.get("scenarios", {}),
+            _parse_thresholds(args.threshold), args.default_threshold
+        )
+        report["baseline"] = args.baseline
+        report["comparisons"] = comparisons
+
+        print(f"\n{'='*60}")
+        print(f"Confronto con baseline: {args.baseline}")
+        print(f"{'='*60}\n")
+        for comparison in comparisons:
+            mark = "✗" if comparison["regression"] else "✓"
+            print(f"{mark} {comparison['scenario']:<28} {comparison['change_pct']:+8.2f}% "
+                  f"(soglia {comparison['threshold_pct']:.1f}%)")
+        if any(c["regression"] for c in comparisons):
+            exit_code = 1
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nRisultati salvati in {args.output}")
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
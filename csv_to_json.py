@@ -4,21 +4,212 @@
 Modulo per convertire file CSV in formato JSON
 """
 
+import bz2
 import csv
+import gzip
+import io
 import json
+import lzma
+import os
 import argparse
+import queue
+import threading
 from pathlib import Path
-from typing import List, Dict
+from typing import IO, List, Dict, Optional
 
+from elk_metrics import METRICS, MetricsExport, add_metrics_arguments
+from elk_profiling import NULL_PROFILER, PhaseProfiler, ProfileSession, add_profiling_arguments
 
-def read_csv_to_dict(csv_file: str, delimiter: str = ',', encoding: str = 'utf-8') -> List[Dict]:
+
+# Estensione -> codec; .zst richiede il pacchetto opzionale zstandard
+COMPRESSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+
+# Dimensione dei blocchi scambiati con il thread del codec
+_CHUNK_SIZE = 1024 * 1024
+_EOF = object()
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """
+    Deduce la compressione dall'estensione del file
+    
+    Args:
+        path: Percorso del file
+    
+    Returns:
+        Uno tra "gzip", "bz2", "xz" e "zstd", oppure None per un file non compresso
+    """
+    return COMPRESSIONS.get(Path(path).suffix.lower())
+
+
+def _open_codec(path: str, mode: str, compression: str, level: Optional[int] = None):
+    """Apre il file compresso in modalità binaria ('rb' o 'wb') con il codec indicato"""
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("I file .zst richiedono zstandard: pip install zstandard")
+        raw = open(path, mode)
+        if mode == 'rb':
+            return zstandard.ZstdDecompressor().stream_reader(raw)
+        return zstandard.ZstdCompressor(**({} if level is None else {"level": level})).stream_writer(raw)
+    if compression == "gzip":
+        return gzip.open(path, mode, **({} if level is None else {"compresslevel": level}))
+    if compression == "bz2":
+        return bz2.open(path, mode, **({} if level is None else {"compresslevel": level}))
+    return lzma.open(path, mode, **({} if level is None or mode == 'rb' else {"preset": level}))
+
+
+class _ThreadedReader(io.RawIOBase):
+    """Decomprime in un thread separato: il codec lavora mentre il CSV viene analizzato"""
+    
+    def __init__(self, source, depth: int = 4):
+        self._source = source
+        self._chunks = queue.Queue(maxsize=depth)
+        self._pending = memoryview(b"")
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                chunk = self._source.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self._put(chunk)
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(_EOF)
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        if not self._pending:
+            if self._eof:
+                return 0
+            item = self._chunks.get()
+            if item is _EOF:
+                self._eof = True
+                return 0
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            self._pending = memoryview(item)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+    
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
+
+
+class _ThreadedWriter(io.RawIOBase):
+    """Comprime in un thread separato: il codec lavora mentre il JSON viene serializzato"""
+    
+    def __init__(self, target, depth: int = 4):
+        self._target = target
+        self._chunks = queue.Queue(maxsize=depth)
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            item = self._chunks.get()
+            if item is _EOF:
+                return
+            if self._error is None:
+                try:
+                    self._target.write(item)
+                except Exception as e:
+                    # Continua a svuotare la coda: l'errore viene sollevato al chiamante
+                    self._error = e
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        if self._error is not None:
+            raise self._error
+        # Copia: il buffer del chiamante viene riutilizzato
+        self._chunks.put(bytes(data))
+        return len(data)
+    
+    def close(self):
+        if not self.closed:
+            self._chunks.put(_EOF)
+            self._thread.join()
+            self._target.close()
+        super().close()
+        if self._error is not None:
+            raise self._error
+
+
+def open_input(path: str, encoding: str = 'utf-8') -> IO[str]:
+    """
+    Apre un file di testo in lettura, decomprimendolo in streaming se compresso
+    
+    Args:
+        path: Percorso del file (.gz, .bz2, .xz e .zst vengono decompressi)
+        encoding: Encoding del file (default: 'utf-8')
+    
+    Returns:
+        File di testo aperto in lettura
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, 'r', encoding=encoding)
+    reader = _ThreadedReader(_open_codec(path, 'rb', compression))
+    return io.TextIOWrapper(io.BufferedReader(reader, _CHUNK_SIZE), encoding=encoding)
+
+
+def open_output(path: str, encoding: str = 'utf-8', compression_level: int = None) -> IO[str]:
+    """
+    Apre un file di testo in scrittura, comprimendolo in streaming se l'estensione lo richiede
+    
+    Args:
+        path: Percorso del file (.gz, .bz2, .xz e .zst vengono compressi)
+        encoding: Encoding del file (default: 'utf-8')
+        compression_level: Livello di compressione (default: quello del codec)
+    
+    Returns:
+        File di testo aperto in scrittura
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, 'w', encoding=encoding)
+    writer = _ThreadedWriter(_open_codec(path, 'wb', compression, compression_level))
+    return io.TextIOWrapper(io.BufferedWriter(writer, _CHUNK_SIZE), encoding=encoding)
+
+
+def read_csv_to_dict(csv_file: str, delimiter: str = ',', encoding: str = 'utf-8',
+                     raise_errors: bool = False) -> List[Dict]:
     """
     Legge un file CSV e lo converte in una lista di dizionari.
     
     Args:
-        csv_file: Percorso del file CSV
+        csv_file: Percorso del file CSV (anche compresso: .gz, .bz2, .xz, .zst)
         delimiter: Delimitatore del CSV (default: ',')
         encoding: Encoding del file (default: 'utf-8')
+        raise_errors: Se True gli errori di lettura vengono propagati invece di
+                      restituire una lista vuota
     
     Returns:
         Lista di dizionari contenente i dati del CSV
@@ -26,38 +217,48 @@ def read_csv_to_dict(csv_file: str, delimiter: str = ',', encoding: str = 'utf-8
     data = []
     
     try:
-        with open(csv_file, 'r', encoding=encoding) as file:
-            csv_reader = csv.DictReader(file, delimiter=delimiter)
-            for row in csv_reader:
-                data.append(dict(row))
+        with METRICS.csv_duration.time(phase="read"):
+            with open_input(csv_file, encoding=encoding) as file:
+                csv_reader = csv.DictReader(file, delimiter=delimiter)
+                for row in csv_reader:
+                    data.append(dict(row))
         
+        METRICS.csv_rows.inc(len(data))
+        METRICS.csv_bytes.inc(os.path.getsize(csv_file))
         print(f"Letti {len(data)} record dal file {csv_file}")
         return data
     
     except FileNotFoundError:
         print(f"Errore: File {csv_file} non trovato")
+        if raise_errors:
+            raise
         return []
     except Exception as e:
         print(f"Errore durante la lettura del CSV: {e}")
+        if raise_errors:
+            raise
         return []
 
 
-def save_to_json(data: List[Dict], output_file: str, indent: int = 2, encoding: str = 'utf-8') -> bool:
+def save_to_json(data: List[Dict], output_file: str, indent: int = 2, encoding: str = 'utf-8',
+                 compression_level: int = None) -> bool:
     """
     Salva i dati in formato JSON.
     
     Args:
         data: Lista di dizionari da salvare
-        output_file: Percorso del file JSON di output
+        output_file: Percorso del file JSON di output (compresso se .gz, .bz2, .xz, .zst)
         indent: Indentazione del JSON (default: 2)
         encoding: Encoding del file (default: 'utf-8')
+        compression_level: Livello di compressione (default: quello del codec)
     
     Returns:
         True se il salvataggio è riuscito, False altrimenti
     """
     try:
-        with open(output_file, 'w', encoding=encoding) as file:
-            json.dump(data, file, indent=indent, ensure_ascii=False)
+        with METRICS.csv_duration.time(phase="save"):
+            with open_output(output_file, encoding=encoding, compression_level=compression_level) as file:
+                json.dump(data, file, indent=indent, ensure_ascii=False)
         
         print(f"Dati salvati in {output_file}")
         return True
@@ -68,7 +269,9 @@ def save_to_json(data: List[Dict], output_file: str, indent: int = 2, encoding:
 
 
 def csv_to_json(csv_file: str, output_file: str = None, delimiter: str = ',', 
-                indent: int = 2, print_output: bool = False) -> List[Dict]:
+                indent: int = 2, print_output: bool = False,
+                profiler: PhaseProfiler = NULL_PROFILER,
+                compression_level: int = None) -> List[Dict]:
     """
     Converte un file CSV in formato JSON.
     
@@ -78,24 +281,29 @@ def csv_to_json(csv_file: str, output_file: str = None, delimiter: str = ',',
         delimiter: Delimitatore del CSV (default: ',')
         indent: Indentazione del JSON (default: 2)
         print_output: Se True, stampa il JSON su stdout (default: False)
+        profiler: Profiler delle fasi read/save/print (default: disattivato)
+        compression_level: Livello di compressione dell'output compresso (default: quello del codec)
     
     Returns:
         Lista di dizionari contenente i dati convertiti
     """
     # Legge il CSV
-    data = read_csv_to_dict(csv_file, delimiter=delimiter)
+    with profiler.phase("read"):
+        data = read_csv_to_dict(csv_file, delimiter=delimiter)
     
     if not data:
         return []
     
     # Salva in file JSON se specificato
     if output_file:
-        save_to_json(data, output_file, indent=indent)
+        with profiler.phase("save"):
+            save_to_json(data, output_file, indent=indent, compression_level=compression_level)
     
     # Stampa su stdout se richiesto
     if print_output:
-        print("\nJSON Output:")
-        print(json.dumps(data, indent=indent, ensure_ascii=False))
+        with profiler.phase("print"):
+            print("\nJSON Output:")
+            print(json.dumps(data, indent=indent, ensure_ascii=False))
     
     return data
 
@@ -112,6 +320,7 @@ def main():
         python csv_to_json.py input.csv -o output.json
         python csv_to_json.py input.csv --delimiter ";" --print
         python csv_to_json.py input.csv -o output.json --indent 4
+        python csv_to_json.py export.csv.gz -o output.json.zst --compression-level 10
         """
     )
     
@@ -122,6 +331,10 @@ def main():
     parser.add_argument('-p', '--print', action='store_true', dest='print_output',
                         help='Stampa il JSON su stdout')
     parser.add_argument('-e', '--encoding', default='utf-8', help='Encoding del file (default: utf-8)')
+    parser.add_argument('-l', '--compression-level', type=int,
+                        help='Livello di compressione per output .gz/.bz2/.xz/.zst (default: quello del codec)')
+    add_metrics_arguments(parser)
+    add_profiling_arguments(parser)
     
     args = parser.parse_args()
     
@@ -131,13 +344,16 @@ def main():
         return
     
     # Esegue la conversione
-    data = csv_to_json(
-        csv_file=args.csv_file,
-        output_file=args.output,
-        delimiter=args.delimiter,
-        indent=args.indent,
-        print_output=args.print_output
-    )
+    with MetricsExport(args), ProfileSession(args) as profiler:
+        data = csv_to_json(
+            csv_file=args.csv_file,
+            output_file=args.output,
+            delimiter=args.delimiter,
+            indent=args.indent,
+            print_output=args.print_output,
+            profiler=profiler,
+            compression_level=args.compression_level
+        )
     
     if data:
         print(f"\nConversione completata: {len(data)} record processati")
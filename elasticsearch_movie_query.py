@@ -2,24 +2,247 @@
 Modulo per interrogare Elasticsearch e aggregare i film per attore.
 """
 
-from elasticsearch import Elasticsearch
-from typing import List, Dict, Any
+from elasticsearch import Elasticsearch, NotFoundError
+from typing import List, Dict, Any, Optional, Set
+import argparse
 import json
+import os
+
+from elk_bulk import bulk_with_retry
+from elk_metrics import METRICS, MetricsExport, add_metrics_arguments, instrumented_node_class
+from elk_profiling import ProfileSession, add_profiling_arguments
+
+
+class ActorFilmsSummary:
+    """
+    Indice riepilogativo actor_films (un documento per attore, con _id = nome dell'attore)
+    mantenuto in modo incrementale a partire dai film modificati in movie_idx.
+    
+    Ad ogni aggiornamento vengono letti solo i film con updated_at successivo
+    all'ultimo checkpoint (tutti, al primo avvio); per ciascuno il film viene tolto
+    dagli attori che lo contenevano e aggiunto agli attori attuali.
+    """
+    
+    ACTOR_FIELDS = ("actor_1_name", "actor_2_name", "actor_3_name")
+    MAPPINGS = {
+        "properties": {
+            "actor_name": {"type": "keyword"},
+            "total_films": {"type": "integer"},
+            "films": {"type": "keyword"},
+            "movie_ids": {"type": "keyword"}
+        }
+    }
+    
+    def __init__(self, es: Elasticsearch, movie_index: str = "movie_idx",
+                 summary_index: str = "actor_films", updated_field: str = "updated_at",
+                 checkpoint_file: str = ".actor_films_checkpoint.json", page_size: int = 1000):
+        """
+        Inizializza il riepilogo.
+        
+        Args:
+            es: Client Elasticsearch
+            movie_index: Indice dei film (default: movie_idx)
+            summary_index: Indice riepilogativo (default: actor_films)
+            updated_field: Campo dei film con la data dell'ultima modifica (default: updated_at)
+            checkpoint_file: File con il valore di updated_at già elaborato
+            page_size: Film letti per pagina
+        """
+        self.es = es
+        self.movie_index = movie_index
+        self.summary_index = summary_index
+        self.updated_field = updated_field
+        self.checkpoint_file = checkpoint_file
+        self.page_size = page_size
+    
+    def _read_checkpoint(self) -> Optional[str]:
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get("updated_at")
+    
+    def _write_checkpoint(self, updated_at: str):
+        tmp = self.checkpoint_file + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"updated_at": updated_at}, f)
+        os.replace(tmp, self.checkpoint_file)
+    
+    def ensure_index(self):
+        """Crea l'indice riepilogativo se non esiste."""
+        if not self.es.indices.exists(index=self.summary_index):
+            self.es.indices.create(index=self.summary_index, mappings=self.MAPPINGS)
+    
+    def _actors_containing(self, movie_ids: List[str]) -> Set[str]:
+        """Restituisce gli attori del riepilogo che contengono almeno uno dei film indicati."""
+        response = self.es.search(
+            index=self.summary_index,
+            query={"terms": {"movie_ids": movie_ids}},
+            source=["actor_name"],
+            size=len(movie_ids) * len(self.ACTOR_FIELDS)
+        )
+        return {hit["_id"] for hit in response["hits"]["hits"]}
+    
+    def _load_actors(self, actor_names: Set[str]) -> Dict[str, Dict]:
+        """Legge (in tempo reale) i documenti riepilogativi degli attori indicati."""
+        if not actor_names:
+            return {}
+        response = self.es.mget(index=self.summary_index, ids=sorted(actor_names))
+        actors = {}
+        for doc in response["docs"]:
+            if doc.get("found"):
+                actors[doc["_id"]] = doc["_source"]
+            else:
+                actors[doc["_id"]] = {"actor_name": doc["_id"], "total_films": 0,
+                                      "films": [], "movie_ids": []}
+        return actors
+    
+    def apply_changes(self, movies: Dict[str, Optional[Dict]]) -> Dict[str, int]:
+        """
+        Applica al riepilogo le modifiche di un gruppo di film.
+        
+        Args:
+            movies: Dizionario _id del film -> documento del film (None se il film è stato eliminato)
+        
+        Returns:
+            Statistiche del bulk (success, failed, retried, spooled) più il numero di
+            documenti attore scritti o eliminati (actors)
+        """
+        if not movies:
+            return {"actors": 0, "success": 0, "failed": 0, "retried": 0, "spooled": 0}
+        movie_ids = list(movies)
+        new_actors = {
+            movie_id: {movie[f] for f in self.ACTOR_FIELDS if movie and movie.get(f)}
+            for movie_id, movie in movies.items()
+        }
+        touched = self._actors_containing(movie_ids)
+        for actors in new_actors.values():
+            touched.update(actors)
+        actors = self._load_actors(touched)
+        
+        for actor in actors.values():
+            # Toglie i film modificati dall'attore, poi li riaggiunge se ne fa ancora parte
+            keep = [i for i, movie_id in enumerate(actor["movie_ids"]) if movie_id not in movies]
+            actor["movie_ids"] = [actor["movie_ids"][i] for i in keep]
+            actor["films"] = [actor["films"][i] for i in keep]
+        for movie_id, names in new_actors.items():
+            if not names:
+                continue
+            title = movies[movie_id].get("movie_title", "N/A")
+            for name in names:
+                actors[name]["movie_ids"].append(movie_id)
+                actors[name]["films"].append(title)
+        
+        actions = []
+        for name, actor in actors.items():
+            actor["total_films"] = len(actor["movie_ids"])
+            if actor["movie_ids"]:
+                actions.append({"_index": self.summary_index, "_id": name, "_source": actor})
+            else:
+                actions.append({"_op_type": "delete", "_index": self.summary_index, "_id": name})
+        result = bulk_with_retry(self.es, actions)
+        result["actors"] = len(actions)
+        return result
+    
+    def remove_movies(self, movie_ids: List[str]) -> Dict[str, int]:
+        """
+        Toglie dal riepilogo i film eliminati da movie_idx.
+        
+        Args:
+            movie_ids: _id dei film eliminati
+        
+        Returns:
+            Statistiche come apply_changes
+        """
+        return self.apply_changes({movie_id: None for movie_id in movie_ids})
+    
+    def refresh(self) -> Dict[str, int]:
+        """
+        Aggiorna il riepilogo con i film modificati dall'ultimo checkpoint.
+        
+        Il checkpoint avanza solo per le pagine i cui documenti attore sono stati
+        scritti tutti; al primo errore l'aggiornamento si ferma e il prossimo riparte
+        dai film non ancora applicati.
+        
+        Returns:
+            Dizionario con il numero di film elaborati, di documenti attore aggiornati
+            e di documenti attore non scritti (failed)
+        """
+        self.ensure_index()
+        checkpoint = self._read_checkpoint()
+        query = None
+        if checkpoint is not None:
+            # gte: riapplicare un film già elaborato è idempotente
+            query = {"range": {self.updated_field: {"gte": checkpoint}}}
+        
+        stats = {"movies": 0, "actors": 0, "failed": 0}
+        pit_id = self.es.open_point_in_time(index=self.movie_index, keep_alive="2m")["id"]
+        try:
+            search_after = None
+            while True:
+                params = {
+                    "pit": {"id": pit_id, "keep_alive": "2m"},
+                    "sort": [{self.updated_field: {"order": "asc", "missing": "_first"}},
+                             {"_shard_doc": "asc"}],
+                    "size": self.page_size,
+                    "source": list(self.ACTOR_FIELDS) + ["movie_title", self.updated_field],
+                    "track_total_hits": False,
+                }
+                if query:
+                    params["query"] = query
+                if search_after is not None:
+                    params["search_after"] = search_after
+                response = self.es.search(**params)
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
+                pit_id = response.get("pit_id", pit_id)
+                search_after = hits[-1]["sort"]
+                
+                result = self.apply_changes({hit["_id"]: hit["_source"] for hit in hits})
+                if result["failed"] or result["spooled"]:
+                    stats["failed"] += result["failed"] + result["spooled"]
+                    print(f"✗ {stats['failed']} documenti attore non scritti: checkpoint fermo a "
+                          f"{checkpoint}, il prossimo aggiornamento riparte da lì")
+                    break
+                stats["actors"] += result["actors"]
+                stats["movies"] += len(hits)
+                latest = max((hit["_source"].get(self.updated_field) or "" for hit in hits), default="")
+                if latest and (checkpoint is None or latest > checkpoint):
+                    checkpoint = latest
+                    self._write_checkpoint(checkpoint)
+                if len(hits) < self.page_size:
+                    break
+        finally:
+            self.es.close_point_in_time(id=pit_id)
+        
+        print(f"✓ Riepilogo {self.summary_index} aggiornato: {stats['movies']} film, "
+              f"{stats['actors']} attori")
+        return stats
 
 
 class MovieElasticsearchClient:
     """Client per interrogare l'indice movie_idx su Elasticsearch."""
     
-    def __init__(self, host: str = "localhost", port: int = 9200):
+    def __init__(self, host: str = "localhost", port: int = 9200,
+                 username: str = None, password: str = None, api_key: str = None):
         """
         Inizializza il client Elasticsearch.
         
         Args:
             host: Host di Elasticsearch (default: localhost)
             port: Porta di Elasticsearch (default: 9200)
+            username: Username per autenticazione (opzionale)
+            password: Password per autenticazione (opzionale)
+            api_key: API Key per autenticazione (opzionale, alternativa a username/password)
         """
-        self.es = Elasticsearch([{'host': host, 'port': port}])
+        auth = {}
+        if api_key:
+            auth["api_key"] = api_key
+        elif username and password:
+            auth["basic_auth"] = (username, password)
+        self.es = Elasticsearch([{'host': host, 'port': port, 'scheme': 'http'}],
+                                node_class=instrumented_node_class(), **auth)
         self.index_name = "movie_idx"
+        self.summary = ActorFilmsSummary(self.es, movie_index=self.index_name)
     
     def verify_connection(self) -> bool:
         """
@@ -104,6 +327,11 @@ class MovieElasticsearchClient:
         Returns:
             Lista di dizionari con attore, film e totale
         """
+        with METRICS.query_latency.time(query="actor_films"):
+            return self._build_actor_film_list()
+    
+    def _build_actor_film_list(self) -> List[Dict[str, Any]]:
+        """Esegue l'aggregazione e ne combina i bucket per attore."""
         results = self.aggregate_movies_by_actor()
         
         if not results:
@@ -179,6 +407,34 @@ class MovieElasticsearchClient:
         if limit and len(actor_films) > limit:
             print(f"... e altri {len(actor_films) - limit} attori")
     
+    def refresh_actor_summary(self) -> Dict[str, int]:
+        """
+        Aggiorna l'indice riepilogativo actor_films con i film modificati.
+        
+        Returns:
+            Dizionario con il numero di film elaborati, di documenti attore aggiornati
+            e di documenti attore non scritti (failed)
+        """
+        return self.summary.refresh()
+    
+    def get_actor_films(self, actor_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Restituisce i film di un attore con una lettura per chiave dall'indice actor_films.
+        
+        Args:
+            actor_name: Nome dell'attore
+        
+        Returns:
+            Dizionario con attore, film e totale, oppure None se l'attore non è presente
+        """
+        with METRICS.query_latency.time(query="actor_summary_get"):
+            try:
+                response = self.es.get(index=self.summary.summary_index, id=actor_name,
+                                       source_excludes=["movie_ids"])
+            except NotFoundError:
+                return None
+        return response["_source"]
+    
     def export_to_json(self, filename: str = "actor_films_aggregation.json"):
         """
         Esporta i risultati in un file JSON.
@@ -196,6 +452,14 @@ class MovieElasticsearchClient:
 
 def main():
     """Funzione principale di esempio."""
+    parser = argparse.ArgumentParser(description='Aggrega i film per attore dall\'indice movie_idx')
+    parser.add_argument('--refresh-summary', action='store_true',
+                        help='Aggiorna in modo incrementale l\'indice riepilogativo actor_films')
+    parser.add_argument('--actor', help='Mostra i film di un attore leggendo l\'indice actor_films')
+    add_metrics_arguments(parser)
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    
     # Inizializza il client (modifica host e porta se necessario)
     client = MovieElasticsearchClient(host="localhost", port=9200)
     
@@ -206,11 +470,22 @@ def main():
     
     print("Connessione a Elasticsearch stabilita con successo!")
     
-    # Esegui l'aggregazione e stampa i risultati (mostra i primi 20 attori)
-    client.print_results(limit=20)
-    
-    # Esporta i risultati completi in JSON
-    client.export_to_json("json/actor_films_aggregation.json")
+    with MetricsExport(args), ProfileSession(args) as profiler:
+        if args.refresh_summary or args.actor:
+            if args.refresh_summary:
+                with profiler.phase("summary"):
+                    client.refresh_actor_summary()
+            if args.actor:
+                print(json.dumps(client.get_actor_films(args.actor), ensure_ascii=False, indent=2))
+            return
+        
+        # Esegui l'aggregazione e stampa i risultati (mostra i primi 20 attori)
+        with profiler.phase("print"):
+            client.print_results(limit=20)
+        
+        # Esporta i risultati completi in JSON
+        with profiler.phase("export"):
+            client.export_to_json("json/actor_films_aggregation.json")
 
 
 if __name__ == "__main__":
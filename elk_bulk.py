@@ -0,0 +1,419 @@
+"""
+Modulo per invii bulk affidabili a Elasticsearch: retry dei soli documenti rifiutati
+con backoff esponenziale e jitter, spool su disco (segmenti NDJSON con checkpoint)
+per i documenti che falliscono ancora, da reinviare alla prossima esecuzione, e
+regolazione automatica (AIMD) della dimensione dei blocchi.
+"""
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from elasticsearch.helpers import streaming_bulk
+
+from elk_metrics import METRICS
+
+
+# Status per cui un documento rifiutato viene ritentato (None = errore di trasporto)
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+
+def is_retryable(status: Optional[int]) -> bool:
+    """Indica se un documento fallito con lo status indicato va ritentato"""
+    return status is None or status in RETRYABLE_STATUSES
+
+
+def is_already_deleted(action, status: Optional[int]) -> bool:
+    """Indica se l'azione è una delete di un documento che non esiste già più (404)"""
+    return status == 404 and isinstance(action, dict) and action.get("_op_type") == "delete"
+
+
+def backoff_delay(attempt: int, initial_backoff: float, max_backoff: float) -> float:
+    """
+    Calcola l'attesa prima di un retry (backoff esponenziale con "full jitter")
+
+    Args:
+        attempt: Numero del tentativo (da 1)
+        initial_backoff: Attesa di base in secondi
+        max_backoff: Attesa massima in secondi
+
+    Returns:
+        Secondi da attendere, scelti a caso tra 0 e il limite del tentativo
+    """
+    return random.uniform(0, min(max_backoff, initial_backoff * 2 ** (attempt - 1)))
+
+
+class BulkSpool:
+    """
+    Spool append-only su disco per le azioni bulk non riuscite.
+
+    Le azioni vengono accodate in segmenti NDJSON numerati (segment-00000001.ndjson, ...);
+    un file di checkpoint ricorda fino a quale byte del segmento più vecchio le azioni
+    sono già state reinviate. I documenti rifiutati in modo definitivo (es. errori di
+    mapping) finiscono invece in rejected.ndjson e non vengono più reinviati.
+    """
+
+    CHECKPOINT_FILE = "checkpoint.json"
+    REJECTED_FILE = "rejected.ndjson"
+
+    def __init__(self, directory: str, segment_max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            directory: Directory dello spool (creata se non esiste)
+            segment_max_bytes: Dimensione oltre la quale si apre un nuovo segmento
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self._active: Optional[Path] = None
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.directory.glob("segment-*.ndjson"))
+
+    def _next_segment(self) -> Path:
+        segments = self._segments()
+        last = int(segments[-1].stem.split("-")[1]) if segments else 0
+        return self.directory / f"segment-{last + 1:08d}.ndjson"
+
+    def _read_checkpoint(self) -> Dict:
+        path = self.directory / self.CHECKPOINT_FILE
+        if not path.exists():
+            return {"segment": None, "offset": 0}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_checkpoint(self, segment: Optional[str], offset: int):
+        # Scrittura atomica: un crash non lascia mai un checkpoint a metà
+        path = self.directory / self.CHECKPOINT_FILE
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def append(self, actions: List[Dict]):
+        """Accoda le azioni allo spool, ruotando il segmento se troppo grande"""
+        if not actions:
+            return
+        if self._active is None or (self._active.exists()
+                                    and self._active.stat().st_size >= self.segment_max_bytes):
+            self._active = self._next_segment()
+        with open(self._active, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(action, ensure_ascii=False) + "\n" for action in actions))
+            f.flush()
+            os.fsync(f.fileno())
+        METRICS.bulk_spooled.inc(len(actions))
+
+    def reject(self, action: Dict, error):
+        """Registra un'azione rifiutata in modo definitivo"""
+        with open(self.directory / self.REJECTED_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"action": action, "error": error}, ensure_ascii=False, default=str) + "\n")
+
+    def pending(self) -> int:
+        """Restituisce il numero di azioni ancora da reinviare"""
+        checkpoint = self._read_checkpoint()
+        count = 0
+        for segment in self._segments():
+            with open(segment, 'rb') as f:
+                if segment.name == checkpoint["segment"]:
+                    f.seek(checkpoint["offset"])
+                count += sum(1 for line in f if line.strip())
+        return count
+
+    def drain(self, batch_size: int = 500) -> Iterator[List[Dict]]:
+        """
+        Restituisce le azioni in spool a blocchi, dal segmento più vecchio.
+
+        Il checkpoint avanza solo quando il chiamante chiede il blocco successivo,
+        cioè dopo aver gestito il precedente; i segmenti completati vengono eliminati.
+        Le azioni accodate durante il drain finiscono in un nuovo segmento e non
+        vengono rilette nello stesso drain.
+        """
+        segments = self._segments()
+        # Le nuove append vanno in un segmento che questo drain non legge
+        self._active = None
+        checkpoint = self._read_checkpoint()
+        for segment in segments:
+            offset = checkpoint["offset"] if segment.name == checkpoint["segment"] else 0
+            with open(segment, 'rb') as f:
+                f.seek(offset)
+                batch = []
+                for line in f:
+                    if line.strip():
+                        batch.append(json.loads(line))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                        self._write_checkpoint(segment.name, f.tell())
+                if batch:
+                    yield batch
+            segment.unlink()
+            self._write_checkpoint(None, 0)
+
+
+# Suffisso data degli indici (es. -2024-06, .2024.06.01): sostituito da * nel pattern
+_DATE_SUFFIX = re.compile(r"([-_.])\d{4}(?:[-_.]\d{2}){0,2}$")
+
+
+def index_pattern(index: str) -> str:
+    """
+    Riduce il nome di un indice al suo pattern (es. services-log-2024-06 -> services-log-*)
+
+    Args:
+        index: Nome dell'indice
+
+    Returns:
+        Il pattern con il suffisso data sostituito da *, o il nome stesso se non datato
+    """
+    return _DATE_SUFFIX.sub(r"\1*", index)
+
+
+def _action_size(action) -> int:
+    """Stima i byte di un'azione bulk (documento più riga di azione)"""
+    source = action.get("_source", action) if isinstance(action, dict) else action
+    if isinstance(source, bytes):
+        return len(source) + 64
+    if isinstance(source, str):
+        return len(source.encode("utf-8")) + 64
+    return len(json.dumps(source, ensure_ascii=False, separators=(",", ":")).encode("utf-8")) + 64
+
+
+class ChunkTuner:
+    """
+    Regolazione AIMD della dimensione dei blocchi bulk verso una latenza obiettivo.
+
+    Dopo ogni richiesta: se la latenza supera l'obiettivo o la quota di documenti
+    rifiutati supera la soglia, documenti e byte per blocco vengono moltiplicati per
+    decrease_factor; se la latenza resta sotto l'obiettivo con un margine (headroom)
+    e il blocco era pieno, crescono di un passo fisso. La media mobile del punto di
+    lavoro viene salvata per pattern di indice e usata come partenza al giro successivo.
+    """
+
+    def __init__(self, target_latency: float = 1.0, initial_docs: int = 500,
+                 initial_bytes: int = 5 * 1024 * 1024, min_docs: int = 10, max_docs: int = 50000,
+                 min_bytes: int = 64 * 1024, max_bytes: int = 100 * 1024 * 1024,
+                 docs_step: int = 250, bytes_step: int = 1024 * 1024,
+                 decrease_factor: float = 0.5, headroom: float = 0.8,
+                 rejection_threshold: float = 0.01, pattern: str = None,
+                 state_file: str = ".bulk_tuning.json"):
+        """
+        Args:
+            target_latency: Latenza obiettivo in secondi per richiesta bulk
+            initial_docs: Documenti per blocco iniziali (se non c'è uno stato salvato)
+            initial_bytes: Byte per blocco iniziali (se non c'è uno stato salvato)
+            min_docs: Documenti minimi per blocco
+            max_docs: Documenti massimi per blocco
+            min_bytes: Byte minimi per blocco
+            max_bytes: Byte massimi per blocco (default: 100MB, http.max_content_length)
+            docs_step: Incremento additivo dei documenti per blocco
+            bytes_step: Incremento additivo dei byte per blocco
+            decrease_factor: Fattore moltiplicativo di riduzione
+            headroom: Frazione dell'obiettivo sotto la quale la dimensione cresce
+            rejection_threshold: Quota di documenti rifiutati oltre la quale la dimensione cala
+            pattern: Pattern di indice con cui salvare/caricare lo stato (opzionale)
+            state_file: File JSON con gli ottimi appresi per pattern
+        """
+        self.target_latency = target_latency
+        self.min_docs = min_docs
+        self.max_docs = max_docs
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.docs_step = docs_step
+        self.bytes_step = bytes_step
+        self.decrease_factor = decrease_factor
+        self.headroom = headroom
+        self.rejection_threshold = rejection_threshold
+        self.pattern = pattern
+        self.state_file = state_file
+        self.docs = initial_docs
+        self.bytes = initial_bytes
+        self.doc_bytes: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.stats = {"requests": 0, "increases": 0, "decreases": 0}
+        saved = self._load().get(pattern) if pattern else None
+        if saved:
+            self.docs = saved["docs"]
+            self.bytes = saved["bytes"]
+            self.doc_bytes = saved.get("doc_bytes")
+        self._learned_docs = float(self.docs)
+        self._learned_bytes = float(self.bytes)
+
+    @classmethod
+    def for_index(cls, index: str, **kwargs) -> "ChunkTuner":
+        """Crea un tuner per il pattern dell'indice indicato, ripartendo dall'ottimo salvato"""
+        return cls(pattern=index_pattern(index), **kwargs)
+
+    def _load(self) -> Dict:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self):
+        """Salva l'ottimo appreso per il pattern (scrittura atomica)"""
+        if not self.pattern or not self.stats["requests"]:
+            return
+        state = self._load()
+        state[self.pattern] = {
+            "docs": int(self._learned_docs),
+            "bytes": int(self._learned_bytes),
+            "doc_bytes": self.doc_bytes,
+            "latency": self.latency,
+            "updated_at": datetime.now().isoformat()
+        }
+        tmp = self.state_file + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.state_file)
+
+    def chunk_docs(self) -> int:
+        """Documenti del prossimo blocco: il minimo tra i due limiti (documenti e byte)"""
+        if not self.doc_bytes:
+            return self.docs
+        return max(self.min_docs, min(self.docs, int(self.bytes // self.doc_bytes)))
+
+    def sample(self, size: int):
+        """Aggiorna la stima dei byte per documento con la dimensione di un documento campione"""
+        self.doc_bytes = size if self.doc_bytes is None else 0.9 * self.doc_bytes + 0.1 * size
+
+    def observe(self, docs: int, latency: float, rejected: int):
+        """
+        Registra l'esito di una richiesta bulk e regola la dimensione dei blocchi
+
+        Args:
+            docs: Documenti inviati nella richiesta
+            latency: Durata della richiesta in secondi
+            rejected: Documenti rifiutati con status ritentabile (o per errore di trasporto)
+        """
+        self.stats["requests"] += 1
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        limit = self.chunk_docs()
+        full = docs >= limit
+        if latency > self.target_latency or rejected / max(docs, 1) > self.rejection_threshold:
+            # Riduzione moltiplicativa a partire dal limite in vigore (documenti o byte)
+            self.docs = max(self.min_docs, int(limit * self.decrease_factor))
+            if self.doc_bytes:
+                self.bytes = max(self.min_bytes, int(limit * self.doc_bytes * self.decrease_factor))
+            self.stats["decreases"] += 1
+        elif full and latency < self.target_latency * self.headroom:
+            self.docs = min(self.max_docs, self.docs + self.docs_step)
+            self.bytes = min(self.max_bytes, self.bytes + self.bytes_step)
+            self.stats["increases"] += 1
+        self._learned_docs = 0.9 * self._learned_docs + 0.1 * self.docs
+        self._learned_bytes = 0.9 * self._learned_bytes + 0.1 * self.bytes
+
+    def summary(self) -> str:
+        """Descrizione breve dello stato, per i messaggi a video"""
+        latency = f"{self.latency * 1000:.0f} ms" if self.latency is not None else "n.d."
+        return (f"{self.chunk_docs()} documenti/blocco (limite {self.bytes / 1024 / 1024:.1f} MB), "
+                f"latenza media {latency}, {self.stats['increases']} aumenti, "
+                f"{self.stats['decreases']} riduzioni")
+
+
+def _send_chunk(es, chunk: List[Dict], **kwargs) -> Iterator[Tuple[Dict, bool, Optional[int], object]]:
+    """Invia un blocco di azioni e restituisce (azione, ok, status, errore) per ognuna"""
+    try:
+        results = list(streaming_bulk(
+            es, chunk, chunk_size=len(chunk), raise_on_error=False,
+            raise_on_exception=False, yield_ok=True, **kwargs
+        ))
+    except Exception as e:
+        # Errore di trasporto (connessione, timeout): tutto il blocco è ritentabile
+        for action in chunk:
+            yield action, False, None, str(e)
+        return
+    for action, (ok, item) in zip(chunk, results):
+        info = next(iter(item.values()))
+        yield action, ok, info.get("status"), info.get("error")
+
+
+def bulk_with_retry(es, actions: List[Dict], chunk_size: int = 500, max_retries: int = 3,
+                    initial_backoff: float = 0.5, max_backoff: float = 10.0,
+                    spool: Optional[BulkSpool] = None,
+                    sleep: Callable[[float], None] = time.sleep,
+                    send_chunk: Callable = _send_chunk,
+                    to_action: Optional[Callable[[object], Dict]] = None,
+                    tuner: Optional[ChunkTuner] = None, **kwargs) -> Dict:
+    """
+    Invia azioni bulk ritentando solo i documenti rifiutati.
+
+    Ad ogni tentativo vengono reinviati soltanto i documenti falliti con uno status
+    ritentabile (429, 502, 503, 504 o errore di trasporto). Quelli che falliscono
+    ancora dopo max_retries finiscono nello spool (se configurato); quelli rifiutati
+    in modo definitivo vengono contati come falliti e registrati nello spool. Una
+    delete di un documento già assente (404) conta come riuscita.
+
+    Args:
+        es: Client Elasticsearch
+        actions: Azioni bulk (dizionari con _index, _source, ...)
+        chunk_size: Numero di documenti per ogni richiesta bulk
+        max_retries: Numero massimo di retry per documento
+        initial_backoff: Attesa di base in secondi prima del primo retry
+        max_backoff: Attesa massima in secondi tra due retry
+        spool: Spool su disco per i documenti non riusciti (opzionale)
+        sleep: Funzione di attesa (sostituibile nei benchmark)
+        send_chunk: Funzione che invia un blocco e restituisce (azione, ok, status, errore)
+                    per ognuna (default: streaming_bulk sulle azioni)
+        to_action: Converte un elemento in azione bulk prima di metterlo in spool
+                   (necessaria se send_chunk non lavora su dizionari)
+        tuner: Se indicato, decide la dimensione di ogni blocco al posto di chunk_size
+               in base a latenza, byte e rifiuti delle richieste precedenti
+        **kwargs: Parametri aggiuntivi passati a streaming_bulk
+
+    Returns:
+        Dizionario con success, failed, retried e spooled
+    """
+    stats = {"success": 0, "failed": 0, "retried": 0, "spooled": 0}
+    pending = list(actions)
+    attempt = 0
+    while pending:
+        retry = []
+        start = 0
+        while start < len(pending):
+            size = tuner.chunk_docs() if tuner is not None else chunk_size
+            chunk = pending[start:start + size]
+            start += len(chunk)
+            if tuner is not None:
+                # Un documento campione per blocco basta a stimare i byte per documento
+                tuner.sample(_action_size(to_action(chunk[0]) if to_action else chunk[0]))
+            began = time.perf_counter()
+            rejected = 0
+            for action, ok, status, error in send_chunk(es, chunk, **kwargs):
+                # Una delete è idempotente: documento già assente = obiettivo raggiunto
+                if ok or is_already_deleted(action, status):
+                    stats["success"] += 1
+                    continue
+                METRICS.rejections.inc()
+                if is_retryable(status):
+                    retry.append(action)
+                    rejected += 1
+                else:
+                    stats["failed"] += 1
+                    if spool is not None:
+                        spool.reject(to_action(action) if to_action else action, error)
+            if tuner is not None:
+                tuner.observe(len(chunk), time.perf_counter() - began, rejected)
+        if not retry:
+            break
+        if attempt >= max_retries:
+            if spool is not None:
+                spool.append([to_action(item) for item in retry] if to_action else retry)
+                stats["spooled"] += len(retry)
+            else:
+                stats["failed"] += len(retry)
+            break
+        attempt += 1
+        stats["retried"] += len(retry)
+        METRICS.bulk_item_retries.inc(len(retry))
+        sleep(backoff_delay(attempt, initial_backoff, max_backoff))
+        pending = retry
+
+    METRICS.bulk_docs.inc(stats["success"], result="success")
+    METRICS.bulk_docs.inc(stats["failed"], result="failed")
+    METRICS.bulk_docs.inc(stats["spooled"], result="spooled")
+    return stats
@@ -0,0 +1,6 @@
+"""
+CLI unificata per gli strumenti ELK del repository (conversione CSV, simulatore
+di log, shipper, query, ES|QL, export e benchmark).
+
+Uso: python -m elk_cli <comando> [opzioni]
+"""
@@ -0,0 +1,5 @@
+import sys
+
+from elk_cli.cli import main
+
+sys.exit(main())
@@ -0,0 +1,342 @@
+"""
+Entry point della CLI unificata.
+
+Il parser e la configurazione usano solo la libreria standard (più le opzioni di
+metriche e profiling, leggere): il client elasticsearch e i moduli dei singoli
+comandi vengono importati solo quando il comando scelto li richiede, così
+"--help" e i comandi che non parlano con il cluster partono in pochi millisecondi.
+"""
+import argparse
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from elk_cli.config import connect, load_config
+from elk_metrics import MetricsExport, add_metrics_arguments
+from elk_profiling import ProfileSession, add_profiling_arguments
+
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def _load_script(filename: str):
+    """Importa uno script del repository con un nome non importabile (es. py-movies.py)"""
+    path = REPO_DIR / filename
+    spec = importlib.util.spec_from_file_location(path.stem.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _connection_kwargs(config: Dict) -> Dict:
+    return {key: config[key] for key in ("host", "port", "username", "password", "api_key")}
+
+
+def _cmd_convert(args, config: Dict) -> int:
+    from csv_to_json import csv_to_json
+
+    if not Path(args.csv_file).exists():
+        print(f"Errore: Il file {args.csv_file} non esiste")
+        return 1
+    with MetricsExport(args), ProfileSession(args) as profiler:
+        data = csv_to_json(
+            csv_file=args.csv_file,
+            output_file=args.output,
+            delimiter=args.delimiter,
+            indent=args.indent,
+            print_output=args.print_output,
+            profiler=profiler,
+            compression_level=args.compression_level
+        )
+    if not data:
+        return 1
+    print(f"\nConversione completata: {len(data)} record processati")
+    return 0
+
+
+def _cmd_simulate(args, config: Dict) -> int:
+    from elk_log_simulator import ElkLogSimulator
+    from elk_rollup import RollupAggregator
+
+    simulator = ElkLogSimulator(quiet=args.quiet, spool_dir=args.spool_dir,
+                                max_retries=args.max_retries, auto_tune=args.auto_tune,
+                                target_latency=args.target_latency, tuning_file=args.tuning_file,
+                                **_connection_kwargs(config))
+    rollup = None
+    if args.rollup:
+        rollup = RollupAggregator(simulator.es, raw_sample_rate=args.raw_sample_rate,
+                                  raw_index=args.index, spool=simulator.spool,
+                                  max_retries=simulator.max_retries)
+        rollup.ensure_template()
+    with MetricsExport(args), ProfileSession(args) as profiler:
+        simulator.simulate_and_send(count=args.count, index_name=args.index, use_bulk=True,
+                                    profiler=profiler, fast_path=not args.no_fast_path,
+                                    rollup=rollup, chunk_size=args.chunk_size)
+        if args.stats:
+            # Attendi un momento per permettere l'indicizzazione
+            time.sleep(2)
+            with profiler.phase("statistics"):
+                if rollup is not None:
+                    stats = simulator.get_rollup_statistics()
+                else:
+                    stats = simulator.get_log_statistics()
+            print(json.dumps(stats, indent=2, ensure_ascii=False))
+    return 0
+
+
+def _cmd_ship(args, config: Dict) -> int:
+    from elk_bulk import ChunkTuner
+    from elk_rollup import RollupAggregator
+    from elk_send_json import FileShipper
+
+    elastic = connect(config)
+    shipper = FileShipper(
+        elastic, args.files, index_name=args.index, checkpoint_file=args.checkpoint,
+        batch_size=args.batch_size, flush_interval=args.flush_interval,
+        poll_interval=args.poll_interval, use_inotify=args.inotify, spool_dir=args.spool_dir
+    )
+    if args.rollup:
+        shipper.rollup = RollupAggregator(elastic, raw_sample_rate=args.raw_sample_rate,
+                                          raw_index=args.index, chunk_size=args.batch_size,
+                                          spool=shipper.spool, merge_existing=False)
+        shipper.rollup.ensure_template()
+    if args.auto_tune:
+        shipper.tuner = ChunkTuner.for_index(args.index or "services-log-*",
+                                             target_latency=args.target_latency,
+                                             state_file=args.tuning_file)
+    with MetricsExport(args), ProfileSession(args) as profiler, profiler.phase("ship"):
+        stats = shipper.run(follow=not args.once)
+    return 1 if stats["failed"] else 0
+
+
+def _cmd_query(args, config: Dict) -> int:
+    from elasticsearch_movie_query import MovieElasticsearchClient
+
+    client = MovieElasticsearchClient(**_connection_kwargs(config))
+    if not client.verify_connection():
+        print("Impossibile connettersi a Elasticsearch. Verifica che il servizio sia attivo.")
+        return 1
+    with MetricsExport(args), ProfileSession(args) as profiler:
+        if args.search:
+            movies = _load_script("py-movies.py")
+            with profiler.phase("search"):
+                response = client.es.search(index=client.index_name, body=movies.actor_query(args.search))
+            print(json.dumps(response.body, indent=2, ensure_ascii=False))
+            return 0
+        if args.refresh_summary or args.actor:
+            status = 0
+            if args.refresh_summary:
+                with profiler.phase("summary"):
+                    status = 1 if client.refresh_actor_summary()["failed"] else 0
+            if args.actor:
+                print(json.dumps(client.get_actor_films(args.actor), ensure_ascii=False, indent=2))
+            return status
+        with profiler.phase("print"):
+            client.print_results(limit=args.limit)
+        if args.export:
+            with profiler.phase("export"):
+                client.export_to_json(args.export)
+    return 0
+
+
+def _cmd_esql(args, config: Dict) -> int:
+    query = args.query or _load_script("py-sample-data.py").ESQL_QUERY
+    elastic = connect(config)
+    with MetricsExport(args), ProfileSession(args) as profiler, profiler.phase("esql"):
+        try:
+            response = elastic.esql.query(query=query)
+        except Exception as e:
+            print(f"Errore durante l'esecuzione della query: {e}")
+            return 1
+    print(json.dumps(response.body, indent=2, ensure_ascii=False))
+    return 0
+
+
+def _cmd_export(args, config: Dict) -> int:
+    from elk_export import IndexExporter
+
+    exporter = IndexExporter(**_connection_kwargs(config))
+    with MetricsExport(args), ProfileSession(args) as profiler, profiler.phase("export"):
+        exporter.export(
+            index=args.index,
+            output_file=args.output,
+            output_format=args.format,
+            fields=args.fields,
+            query=json.loads(args.query) if args.query else None,
+            slices=args.slices,
+            page_size=args.page_size,
+            keep_alive=args.keep_alive,
+            include_meta=args.include_meta
+        )
+    return 0
+
+
+def _cmd_bench(args, config: Dict, extra: List[str]) -> int:
+    import benchmark
+
+    return benchmark.main(extra)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Costruisce il parser con tutti i sottocomandi (senza importare i moduli dei comandi)"""
+    parser = argparse.ArgumentParser(
+        prog="elk",
+        description='Strumenti ELK: conversione CSV, simulazione e invio log, query, export e benchmark',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+        Configurazione della connessione (priorità crescente): file JSON (--config,
+        ELK_CONFIG, ./elk.json o ~/.config/elk/config.json), variabili d'ambiente
+        ELK_HOST, ELK_PORT, ELK_API_KEY, ELK_USERNAME, ELK_PASSWORD, opzioni del comando.
+
+        Esempi d'uso:
+        python -m elk_cli convert datasets/Cleaned_DataSet.csv -o movies.json.gz
+        python -m elk_cli simulate -n 10000 -q --rollup
+        python -m elk_cli simulate -n 200000 -q --auto-tune --target-latency 0.5
+        python -m elk_cli ship /var/log/app/*.ndjson --index services-log-2024-06
+        python -m elk_cli query --search "Vin Diesel"
+        python -m elk_cli esql "FROM sample_data | LIMIT 10"
+        python -m elk_cli export movie_idx -o movies.csv
+        python -m elk_cli bench --only csv_conversion
+        """
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMANDO", required=True)
+
+    connection = argparse.ArgumentParser(add_help=False)
+    group = connection.add_argument_group('connessione')
+    group.add_argument('--config', help='File JSON di configurazione della connessione')
+    group.add_argument('--host', help='Host di Elasticsearch (default: localhost)')
+    group.add_argument('--port', type=int, help='Porta di Elasticsearch (default: 9200)')
+    group.add_argument('--api-key', help='API Key per autenticazione')
+    group.add_argument('--username', help='Username per autenticazione')
+    group.add_argument('--password', help='Password per autenticazione')
+
+    tuning = argparse.ArgumentParser(add_help=False)
+    group = tuning.add_argument_group('dimensione dei blocchi bulk')
+    group.add_argument('--auto-tune', action='store_true',
+                       help='Regola da sola la dimensione delle richieste bulk verso --target-latency')
+    group.add_argument('--target-latency', type=float, default=1.0,
+                       help='Con --auto-tune, latenza obiettivo in secondi per richiesta (default: 1.0)')
+    group.add_argument('--tuning-file', default='.bulk_tuning.json',
+                       help='Con --auto-tune, file delle dimensioni apprese per pattern di indice '
+                            '(default: .bulk_tuning.json)')
+
+    convert = commands.add_parser('convert', help='Converte un file CSV (anche compresso) in JSON')
+    convert.add_argument('csv_file', help='File CSV di input')
+    convert.add_argument('-o', '--output', help='File JSON di output')
+    convert.add_argument('-d', '--delimiter', default=',', help='Delimitatore del CSV (default: ",")')
+    convert.add_argument('-i', '--indent', type=int, default=2, help='Indentazione JSON (default: 2)')
+    convert.add_argument('-p', '--print', action='store_true', dest='print_output',
+                         help='Stampa il JSON su stdout')
+    convert.add_argument('-e', '--encoding', default='utf-8', help='Encoding del file (default: utf-8)')
+    convert.add_argument('-l', '--compression-level', type=int,
+                         help='Livello di compressione per output .gz/.bz2/.xz/.zst')
+    convert.set_defaults(handler=_cmd_convert)
+
+    simulate = commands.add_parser('simulate', parents=[connection, tuning],
+                                   help='Genera log simulati e li invia a Elasticsearch')
+    simulate.add_argument('-n', '--count', type=int, default=50000,
+                          help='Numero di log da generare (default: 50000)')
+    simulate.add_argument('-q', '--quiet', action='store_true',
+                          help='Non stampa una riga per ogni documento inviato')
+    simulate.add_argument('--index', help='Indice di destinazione (default: services-log-AAAA-MM)')
+    simulate.add_argument('--spool-dir', help='Directory dello spool su disco per i documenti non inviati')
+    simulate.add_argument('--max-retries', type=int, default=3,
+                          help='Retry massimi per i documenti rifiutati dal bulk (default: 3)')
+    simulate.add_argument('--no-fast-path', action='store_true',
+                          help='Usa dizionari e json.dumps invece della codifica diretta del corpo _bulk')
+    simulate.add_argument('--rollup', action='store_true',
+                          help='Invia rollup per minuto invece degli eventi grezzi')
+    simulate.add_argument('--raw-sample-rate', type=float, default=0.0,
+                          help='Con --rollup, frazione di eventi grezzi da inviare comunque (default: 0)')
+    simulate.add_argument('--chunk-size', type=int, default=500,
+                          help='Documenti per ogni richiesta bulk (default: 500)')
+    simulate.add_argument('--stats', action='store_true',
+                          help='Al termine mostra le statistiche lette dal cluster')
+    simulate.set_defaults(handler=_cmd_simulate)
+
+    ship = commands.add_parser('ship', parents=[connection, tuning], help='Segue file NDJSON e li invia via bulk')
+    ship.add_argument('files', nargs='+', metavar='FILE', help='File NDJSON da seguire e inviare')
+    ship.add_argument('--index', help='Indice di destinazione (default: services-log-AAAA-MM)')
+    ship.add_argument('--checkpoint', default='.shipper-checkpoint.json',
+                      help='File di checkpoint degli offset (default: .shipper-checkpoint.json)')
+    ship.add_argument('--batch-size', type=int, default=1000, help='Righe per invio bulk (default: 1000)')
+    ship.add_argument('--flush-interval', type=float, default=5.0,
+                      help='Secondi massimi prima di inviare un blocco incompleto (default: 5)')
+    ship.add_argument('--poll-interval', type=float, default=1.0,
+                      help='Secondi tra due controlli dei file (default: 1)')
+    ship.add_argument('--inotify', action='store_true', help='Usa inotify invece del polling')
+    ship.add_argument('--once', action='store_true', help='Invia il contenuto attuale ed esce')
+    ship.add_argument('--spool-dir', help='Directory dello spool su disco per i documenti non inviati')
+    ship.add_argument('--rollup', action='store_true',
+                      help='Invia rollup per minuto invece delle singole righe')
+    ship.add_argument('--raw-sample-rate', type=float, default=0.0,
+                      help='Con --rollup, frazione di righe da inviare comunque (default: 0)')
+    ship.set_defaults(handler=_cmd_ship)
+
+    query = commands.add_parser('query', parents=[connection], help='Interroga movie_idx e actor_films')
+    query.add_argument('--search', metavar='ATTORE',
+                       help='Cerca i film di un attore in movie_idx (con aggregazione per paese)')
+    query.add_argument('--refresh-summary', action='store_true',
+                       help='Aggiorna in modo incrementale l\'indice riepilogativo actor_films')
+    query.add_argument('--actor', help='Mostra i film di un attore leggendo l\'indice actor_films')
+    query.add_argument('--limit', type=int, default=20, help='Attori mostrati nell\'aggregazione (default: 20)')
+    query.add_argument('--export', metavar='FILE',
+                       help='Esporta l\'aggregazione completa dei film per attore in JSON')
+    query.set_defaults(handler=_cmd_query)
+
+    esql = commands.add_parser('esql', parents=[connection], help='Esegue una query ES|QL')
+    esql.add_argument('query', nargs='?', help='Query ES|QL (default: mediana di event_duration su sample_data)')
+    esql.set_defaults(handler=_cmd_esql)
+
+    export = commands.add_parser('export', parents=[connection],
+                                 help='Esporta un indice su file NDJSON, CSV o Parquet')
+    export.add_argument('index', help='Indice o pattern da esportare')
+    export.add_argument('-o', '--output', required=True, help='File di output')
+    export.add_argument('-f', '--format', choices=("ndjson", "csv", "parquet"),
+                        help='Formato di output (default: da estensione)')
+    export.add_argument('--fields', nargs='+', help='Campi di _source da esportare (default: tutti)')
+    export.add_argument('--query', help='Query DSL in JSON per filtrare i documenti')
+    meta = export.add_mutually_exclusive_group()
+    meta.add_argument('--meta', dest='include_meta', action='store_true', default=None,
+                      help='Includi _index e _id in ogni documento (default per NDJSON)')
+    meta.add_argument('--no-meta', dest='include_meta', action='store_false',
+                      help='Esporta solo _source (default per CSV e Parquet)')
+    export.add_argument('--slices', type=int, default=4, help='Slice lette in parallelo (default: 4)')
+    export.add_argument('--page-size', type=int, default=5000, help='Documenti per pagina (default: 5000)')
+    export.add_argument('--keep-alive', default='5m', help='Keep alive del point-in-time (default: 5m)')
+    export.set_defaults(handler=_cmd_export)
+
+    for command in (convert, simulate, ship, query, esql, export):
+        add_metrics_arguments(command)
+        add_profiling_arguments(command)
+
+    # Le opzioni di bench sono quelle di benchmark.py (vedi "bench -h")
+    bench = commands.add_parser('bench', add_help=False,
+                                help='Benchmark contro un server stand-in (opzioni di benchmark.py)')
+    bench.set_defaults(handler=_cmd_bench)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Funzione principale per l'esecuzione da riga di comando."""
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        return args.handler(args, None, extra)
+    if extra:
+        parser.error(f"argomenti non riconosciuti: {' '.join(extra)}")
+
+    config = None
+    if hasattr(args, "host"):
+        try:
+            config = load_config(args.config)
+        except (OSError, ValueError) as e:
+            print(f"Errore nella configurazione: {e}", file=sys.stderr)
+            return 2
+        for key in ("host", "port", "api_key", "username", "password"):
+            if getattr(args, key) is not None:
+                config[key] = getattr(args, key)
+    return args.handler(args, config)
@@ -0,0 +1,79 @@
+"""
+Configurazione della connessione a Elasticsearch per la CLI: valori di default,
+file JSON e variabili d'ambiente (in ordine crescente di priorità; le opzioni
+da riga di comando prevalgono su tutto).
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+
+
+DEFAULTS = {"host": "localhost", "port": 9200, "api_key": None, "username": None, "password": None}
+
+ENV_VARS = {
+    "host": "ELK_HOST",
+    "port": "ELK_PORT",
+    "api_key": "ELK_API_KEY",
+    "username": "ELK_USERNAME",
+    "password": "ELK_PASSWORD",
+}
+
+# File cercati, nell'ordine, se né --config né ELK_CONFIG indicano un file
+CONFIG_FILES = ("elk.json", "~/.config/elk/config.json")
+
+
+def _find_config_file(environ: Mapping[str, str]) -> Optional[Path]:
+    if environ.get("ELK_CONFIG"):
+        return Path(environ["ELK_CONFIG"]).expanduser()
+    for candidate in CONFIG_FILES:
+        path = Path(candidate).expanduser()
+        if path.is_file():
+            return path
+    return None
+
+
+def load_config(config_file: str = None, environ: Mapping[str, str] = os.environ) -> Dict:
+    """
+    Carica la configurazione della connessione
+
+    Args:
+        config_file: File JSON di configurazione (default: ELK_CONFIG, elk.json
+                     o ~/.config/elk/config.json, se esistono)
+        environ: Variabili d'ambiente (default: os.environ)
+
+    Returns:
+        Dizionario con host, port, api_key, username e password
+    """
+    config = dict(DEFAULTS)
+    path = Path(config_file).expanduser() if config_file else _find_config_file(environ)
+    if path is not None:
+        with open(path, 'r', encoding='utf-8') as f:
+            values = json.load(f)
+        unknown = set(values) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Chiavi sconosciute in {path}: {', '.join(sorted(unknown))}")
+        config.update(values)
+    for key, variable in ENV_VARS.items():
+        if environ.get(variable):
+            config[key] = environ[variable]
+    config["port"] = int(config["port"])
+    return config
+
+
+def connect(config: Dict):
+    """
+    Crea un client Elasticsearch strumentato dalla configurazione
+
+    Priorità di autenticazione: API Key > Username/Password > nessuna.
+    """
+    from elasticsearch import Elasticsearch
+    from elk_metrics import instrumented_node_class
+
+    auth = {}
+    if config.get("api_key"):
+        auth["api_key"] = config["api_key"]
+    elif config.get("username") and config.get("password"):
+        auth["basic_auth"] = (config["username"], config["password"])
+    return Elasticsearch([f"http://{config['host']}:{config['port']}"],
+                         node_class=instrumented_node_class(), **auth)
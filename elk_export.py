@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modulo per esportare interi indici Elasticsearch su file (NDJSON, CSV o Parquet)
+usando point-in-time e search_after su _shard_doc, con slice in parallelo.
+"""
+
+import argparse
+import csv
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from elasticsearch import Elasticsearch
+
+from elk_metrics import METRICS, MetricsExport, add_metrics_arguments, instrumented_node_class
+from elk_profiling import ProfileSession, add_profiling_arguments
+
+
+FORMATS = ("ndjson", "csv", "parquet")
+
+# Marcatore di fine slice inserito nella coda dai thread di lettura
+_SLICE_DONE = object()
+
+
+def detect_format(output_file: str) -> str:
+    """
+    Deduce il formato di output dall'estensione del file
+
+    Args:
+        output_file: Percorso del file di output
+
+    Returns:
+        Uno tra "ndjson", "csv" e "parquet" (default: "ndjson")
+    """
+    suffix = Path(output_file).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".parquet", ".pq"):
+        return "parquet"
+    return "ndjson"
+
+
+class _NdjsonWriter:
+    def __init__(self, output_file: str, fields: Optional[List[str]]):
+        self.file = open(output_file, 'w', encoding='utf-8')
+
+    def write(self, documents: List[Dict]):
+        self.file.write("".join(json.dumps(doc, ensure_ascii=False) + "\n" for doc in documents))
+
+    def close(self):
+        self.file.close()
+
+
+def _csv_value(value):
+    """Valore di una cella CSV: oggetti e liste in JSON (rileggibile), il resto invariato"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class _CsvWriter:
+    def __init__(self, output_file: str, fields: Optional[List[str]]):
+        self.file = open(output_file, 'w', encoding='utf-8', newline='')
+        self.fields = fields
+        self.writer = None
+        self.dropped = set()
+
+    def write(self, documents: List[Dict]):
+        if self.writer is None:
+            # Senza campi espliciti l'intestazione è l'unione dei campi della prima pagina
+            fields = self.fields or list(dict.fromkeys(key for doc in documents for key in doc))
+            self.writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction='ignore')
+            self.writer.writeheader()
+        if not self.fields:
+            columns = set(self.writer.fieldnames)
+            extra = {key for doc in documents for key in doc} - columns - self.dropped
+            if extra:
+                self.dropped.update(extra)
+                print(f"⚠️  Campi assenti nella prima pagina, esclusi dal CSV: {', '.join(sorted(extra))} "
+                      f"(usa --fields per sceglierli)")
+        self.writer.writerows({key: _csv_value(value) for key, value in doc.items()}
+                              for doc in documents)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, output_file: str, fields: Optional[List[str]]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Il formato parquet richiede pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.output_file = output_file
+        self.fields = fields
+        self.writer = None
+
+    def write(self, documents: List[Dict]):
+        fields = self.fields or (self.writer.schema.names if self.writer else list(documents[0].keys()))
+        columns = {field: [doc.get(field) for doc in documents] for field in fields}
+        if self.writer is None:
+            table = self.pa.table(columns)
+            self.writer = self.pq.ParquetWriter(self.output_file, table.schema)
+        else:
+            table = self.pa.table(columns, schema=self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+_WRITERS = {"ndjson": _NdjsonWriter, "csv": _CsvWriter, "parquet": _ParquetWriter}
+
+
+def _put(pages: "queue.Queue", item, stop: threading.Event):
+    """Accoda un elemento senza bloccarsi per sempre se l'export è stato interrotto"""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+class IndexExporter:
+    """Classe per esportare interi indici Elasticsearch con point-in-time e search_after"""
+
+    def __init__(self, host: str = "localhost", port: int = 9200,
+                 username: str = None, password: str = None, api_key: str = None):
+        """
+        Inizializza la connessione a Elasticsearch
+
+        Args:
+            host: Host di Elasticsearch
+            port: Porta di Elasticsearch
+            username: Username per autenticazione (opzionale)
+            password: Password per autenticazione (opzionale)
+            api_key: API Key per autenticazione (opzionale, alternativa a username/password)
+        """
+        auth = {}
+        if api_key:
+            auth["api_key"] = api_key
+        elif username and password:
+            auth["basic_auth"] = (username, password)
+        self.es = Elasticsearch([f"http://{host}:{port}"], node_class=instrumented_node_class(), **auth)
+
+    def _read_slice(self, pit_id: str, slice_id: int, slices: int, page_size: int,
+                    fields: Optional[List[str]], query: Optional[Dict], keep_alive: str,
+                    include_meta: bool, pages: "queue.Queue", stop: threading.Event):
+        """Legge tutte le pagine di una slice e le accoda per il writer"""
+        search_after = None
+        try:
+            while not stop.is_set():
+                params = {
+                    "pit": {"id": pit_id, "keep_alive": keep_alive},
+                    "sort": [{"_shard_doc": "asc"}],
+                    "size": page_size,
+                    "track_total_hits": False,
+                }
+                if slices > 1:
+                    params["slice"] = {"id": slice_id, "max": slices}
+                if fields:
+                    params["source"] = fields
+                if query:
+                    params["query"] = query
+                if search_after is not None:
+                    params["search_after"] = search_after
+
+                with METRICS.query_latency.time(query="export_page"):
+                    response = self.es.search(**params)
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
+                pit_id = response.get("pit_id", pit_id)
+                search_after = hits[-1]["sort"]
+                if include_meta:
+                    documents = [{"_index": hit["_index"], "_id": hit["_id"], **hit["_source"]}
+                                 for hit in hits]
+                else:
+                    documents = [hit["_source"] for hit in hits]
+                _put(pages, documents, stop)
+                if len(hits) < page_size:
+                    break
+        finally:
+            _put(pages, _SLICE_DONE, stop)
+
+    def export(self, index: str, output_file: str, output_format: str = None,
+               fields: Optional[List[str]] = None, query: Optional[Dict] = None,
+               slices: int = 4, page_size: int = 5000, keep_alive: str = "5m",
+               include_meta: Optional[bool] = None) -> int:
+        """
+        Esporta tutti i documenti di un indice (o pattern) su file
+
+        Args:
+            index: Nome dell'indice o pattern (es. services-log-*)
+            output_file: File di output
+            output_format: "ndjson", "csv" o "parquet" (default: dedotto dall'estensione)
+            fields: Campi di _source da esportare (default: tutti; nel CSV le colonne sono
+                    i campi della prima pagina, gli altri vengono segnalati ed esclusi)
+            query: Query DSL per filtrare i documenti (default: tutti)
+            slices: Numero di slice lette in parallelo
+            page_size: Documenti per pagina
+            keep_alive: Durata di validità del point-in-time tra due pagine
+            include_meta: Se True ogni documento riporta anche _index e _id (prime colonne
+                          nel CSV/Parquet), così l'export si può reimportare sovrascrivendo
+                          invece di duplicare (default: True per NDJSON, False altrimenti)
+
+        Returns:
+            Numero di documenti esportati
+        """
+        output_format = output_format or detect_format(output_file)
+        if include_meta is None:
+            include_meta = output_format == "ndjson"
+        columns = ["_index", "_id"] + fields if include_meta and fields else fields
+        writer = _WRITERS[output_format](output_file, columns)
+        # Coda limitata: i thread di lettura si fermano se il writer resta indietro
+        pages: "queue.Queue" = queue.Queue(maxsize=slices * 4)
+        stop = threading.Event()
+        pit_id = self.es.open_point_in_time(index=index, keep_alive=keep_alive)["id"]
+        exported = 0
+
+        print(f"📤 Export di {index} in {output_file} ({output_format}, {slices} slice)")
+        try:
+            with ThreadPoolExecutor(max_workers=slices) as executor:
+                futures = [
+                    executor.submit(self._read_slice, pit_id, slice_id, slices, page_size,
+                                    fields, query, keep_alive, include_meta, pages, stop)
+                    for slice_id in range(slices)
+                ]
+                running = slices
+                try:
+                    while running:
+                        page = pages.get()
+                        if page is _SLICE_DONE:
+                            running -= 1
+                            continue
+                        writer.write(page)
+                        exported += len(page)
+                        METRICS.docs_exported.inc(len(page))
+                except BaseException:
+                    # Sblocca i thread di lettura prima di attenderne la chiusura
+                    stop.set()
+                    raise
+                # Propaga eventuali errori dei thread di lettura
+                for future in futures:
+                    future.result()
+        finally:
+            writer.close()
+            try:
+                self.es.close_point_in_time(id=pit_id)
+            except Exception as e:
+                print(f"⚠️  Impossibile chiudere il point-in-time: {e}")
+
+        print(f"✓ Esportati {exported} documenti in {output_file}")
+        return exported
+
+
+def add_meta_arguments(parser: argparse.ArgumentParser):
+    """Aggiunge le opzioni --meta/--no-meta (campi _index e _id nei documenti esportati)"""
+    meta = parser.add_mutually_exclusive_group()
+    meta.add_argument('--meta', dest='include_meta', action='store_true', default=None,
+                      help='Includi _index e _id in ogni documento (default per NDJSON: '
+                           'il file si reimporta senza duplicati)')
+    meta.add_argument('--no-meta', dest='include_meta', action='store_false',
+                      help='Esporta solo _source (default per CSV e Parquet)')
+
+
+def main():
+    """Funzione principale per l'esecuzione da riga di comando."""
+    parser = argparse.ArgumentParser(
+        description='Esporta un indice Elasticsearch su file NDJSON, CSV o Parquet',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+        Esempi d'uso:
+        python elk_export.py movie_idx -o movies.csv --fields movie_title actor_1_name
+        python elk_export.py "services-log-*" -o logs.ndjson --slices 8
+        python elk_export.py movie_idx -o movies.csv --meta   # con le colonne _index e _id
+        python elk_export.py movie_idx -o movies.parquet --query '{"term": {"country.keyword": "USA"}}'
+        """
+    )
+
+    parser.add_argument('index', help='Indice o pattern da esportare')
+    parser.add_argument('-o', '--output', required=True, help='File di output')
+    parser.add_argument('-f', '--format', choices=FORMATS, help='Formato di output (default: da estensione)')
+    parser.add_argument('--fields', nargs='+',
+                        help='Campi di _source da esportare (default: tutti; per il CSV le colonne '
+                             'sono i campi presenti nella prima pagina)')
+    parser.add_argument('--query', help='Query DSL in JSON per filtrare i documenti')
+    add_meta_arguments(parser)
+    parser.add_argument('--slices', type=int, default=4, help='Slice lette in parallelo (default: 4)')
+    parser.add_argument('--page-size', type=int, default=5000, help='Documenti per pagina (default: 5000)')
+    parser.add_argument('--keep-alive', default='5m', help='Keep alive del point-in-time (default: 5m)')
+    parser.add_argument('--host', default='localhost', help='Host di Elasticsearch (default: localhost)')
+    parser.add_argument('--port', type=int, default=9200, help='Porta di Elasticsearch (default: 9200)')
+    parser.add_argument('--api-key', help='API Key per autenticazione')
+    parser.add_argument('--username', help='Username per autenticazione')
+    parser.add_argument('--password', help='Password per autenticazione')
+    add_metrics_arguments(parser)
+    add_profiling_arguments(parser)
+
+    args = parser.parse_args()
+
+    exporter = IndexExporter(host=args.host, port=args.port, username=args.username,
+                             password=args.password, api_key=args.api_key)
+    with MetricsExport(args), ProfileSession(args) as profiler, profiler.phase("export"):
+        exporter.export(
+            index=args.index,
+            output_file=args.output,
+            output_format=args.format,
+            fields=args.fields,
+            query=json.loads(args.query) if args.query else None,
+            slices=args.slices,
+            page_size=args.page_size,
+            keep_alive=args.keep_alive,
+            include_meta=args.include_meta
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modulo per generare carico su Elasticsearch da un solo host con più processi:
+ogni worker ha il proprio simulatore di log e il proprio client, il ritmo
+obiettivo è globale e il report di throughput/latenza è combinato.
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from elk_bulk import bulk_with_retry
+from elk_log_encoder import BulkBodyBuilder
+from elk_profiling import ProfileSession, add_profiling_arguments
+
+
+def _worker(worker_id: int, connection: Dict, index_name: Optional[str], batch_size: int,
+            rate: float, stop, reports):
+    """
+    Processo worker: genera e invia blocchi di log finché non riceve lo stop.
+
+    Args:
+        worker_id: Numero del worker
+        connection: Parametri di connessione per ElkLogSimulator
+        index_name: Indice di destinazione (default: services-log-AAAA-MM)
+        batch_size: Log per ogni richiesta bulk
+        rate: Log al secondo per questo worker (0 = nessun limite)
+        stop: Evento condiviso di arresto
+        reports: Coda su cui inviare (worker, documenti, falliti, latenza) per ogni blocco
+    """
+    # Ctrl-C viene gestito dal processo principale, che chiede lo stop a tutti i worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    import contextlib
+    import io
+    from elk_log_simulator import ElkLogSimulator
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator = ElkLogSimulator(quiet=True, **connection)
+    interval = batch_size / rate if rate else 0
+    builder = None
+    next_batch = time.monotonic()
+    while not stop.is_set():
+        if interval:
+            delay = next_batch - time.monotonic()
+            if delay > 0 and stop.wait(delay):
+                break
+            next_batch = max(next_batch + interval, time.monotonic() - interval)
+        records = simulator.generate_records(batch_size, delay=0)
+        index = index_name or simulator.get_index_name()
+        if builder is None or builder.index_name != index:
+            builder = BulkBodyBuilder(index)
+        # Il blocco in corso viene sempre completato, anche se nel frattempo arriva lo stop
+        start = time.perf_counter()
+        stats = bulk_with_retry(simulator.es, records, chunk_size=batch_size,
+                                max_retries=simulator.max_retries, spool=simulator.spool,
+                                send_chunk=builder.send_chunk, to_action=builder.to_action)
+        latency = time.perf_counter() - start
+        reports.put((worker_id, stats["success"], stats["failed"] + stats["spooled"], latency))
+
+
+class LoadReport:
+    """Aggrega i report dei worker e stampa throughput e latenza combinati"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.total_docs = 0
+        self.total_failed = 0
+        self.window_docs = 0
+        self.window_latencies: List[float] = []
+        self.window_start = self.start
+        self.workers_seen = set()
+
+    def add(self, worker_id: int, docs: int, failed: int, latency: float):
+        self.total_docs += docs
+        self.total_failed += failed
+        self.window_docs += docs
+        self.window_latencies.append(latency)
+        self.workers_seen.add(worker_id)
+
+    def print_window(self):
+        """Stampa le statistiche dell'ultima finestra e ne apre una nuova"""
+        now = time.monotonic()
+        elapsed = now - self.window_start or 1e-9
+        line = (f"⏱  {now - self.start:7.1f}s  {self.window_docs / elapsed:10.0f} docs/s  "
+                f"totale {self.total_docs}  falliti {self.total_failed}  "
+                f"worker attivi {len(self.workers_seen)}")
+        if self.window_latencies:
+            latencies = sorted(self.window_latencies)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            line += f"  latenza p50 {statistics.median(latencies) * 1000:.0f} ms p99 {p99 * 1000:.0f} ms"
+        print(line)
+        self.window_docs = 0
+        self.window_latencies = []
+        self.window_start = now
+
+    def print_summary(self):
+        elapsed = time.monotonic() - self.start or 1e-9
+        print(f"\n{'='*60}")
+        print(f"✓ Inviati {self.total_docs} documenti in {elapsed:.1f}s "
+              f"({self.total_docs / elapsed:.0f} docs/s), {self.total_failed} falliti")
+        print(f"{'='*60}")
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run_load(connection: Dict, workers: int = None, rate: float = 0, duration: float = 0,
+             batch_size: int = 1000, index_name: str = None, report_interval: float = 2.0) -> LoadReport:
+    """
+    Avvia i worker e ne raccoglie i report fino alla scadenza o a Ctrl-C (o SIGTERM).
+
+    Args:
+        connection: Parametri di connessione per ElkLogSimulator (host, port, api_key, ...)
+        workers: Numero di processi (default: numero di CPU)
+        rate: Log al secondo complessivi (0 = nessun limite)
+        duration: Durata in secondi (0 = fino a Ctrl-C)
+        batch_size: Log per ogni richiesta bulk
+        index_name: Indice di destinazione (default: services-log-AAAA-MM)
+        report_interval: Secondi tra due report di throughput
+
+    Returns:
+        Il report finale
+    """
+    workers = workers or os.cpu_count() or 1
+    stop = multiprocessing.Event()
+    reports = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=_worker,
+            args=(i, connection, index_name, batch_size, rate / workers, stop, reports),
+            daemon=True
+        )
+        for i in range(workers)
+    ]
+    report = LoadReport()
+    # SIGTERM (es. kill, systemd) chiude in modo ordinato come Ctrl-C
+    previous_handler = signal.signal(signal.SIGTERM, _interrupt)
+    print(f"🚀 Avvio di {workers} worker (ritmo obiettivo: {rate or 'illimitato'} docs/s)")
+    for process in processes:
+        process.start()
+
+    deadline = report.start + duration if duration else None
+    next_report = report.start + report_interval
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                report.add(*reports.get(timeout=0.2))
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_report:
+                report.print_window()
+                next_report += report_interval
+    except KeyboardInterrupt:
+        print("\n⏹  Interruzione richiesta, attendo il completamento dei blocchi in corso...")
+    finally:
+        stop.set()
+        # Raccoglie i report dei blocchi completati durante l'arresto
+        while any(process.is_alive() for process in processes):
+            try:
+                report.add(*reports.get(timeout=0.2))
+            except queue.Empty:
+                pass
+        while True:
+            try:
+                report.add(*reports.get_nowait())
+            except queue.Empty:
+                break
+        for process in processes:
+            process.join()
+        signal.signal(signal.SIGTERM, previous_handler)
+    report.print_summary()
+    return report
+
+
+def main():
+    """Funzione principale per l'esecuzione da riga di comando."""
+    parser = argparse.ArgumentParser(
+        description='Genera carico su Elasticsearch con più processi',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+        Esempi d'uso:
+        python elk_load_generator.py --workers 16 --rate 100000 --duration 300
+        python elk_load_generator.py --host staging-es --batch-size 5000
+        """
+    )
+    parser.add_argument('-w', '--workers', type=int, help='Numero di processi (default: numero di CPU)')
+    parser.add_argument('-r', '--rate', type=float, default=0,
+                        help='Log al secondo complessivi (default: 0 = nessun limite)')
+    parser.add_argument('-d', '--duration', type=float, default=0,
+                        help='Durata in secondi (default: 0 = fino a Ctrl-C)')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000, help='Log per richiesta bulk (default: 1000)')
+    parser.add_argument('--index', help='Indice di destinazione (default: services-log-AAAA-MM)')
+    parser.add_argument('--report-interval', type=float, default=2.0,
+                        help='Secondi tra due report di throughput (default: 2)')
+    parser.add_argument('--host', default='localhost', help='Host di Elasticsearch (default: localhost)')
+    parser.add_argument('--port', type=int, default=9200, help='Porta di Elasticsearch (default: 9200)')
+    parser.add_argument('--api-key', help='API Key per autenticazione')
+    parser.add_argument('--username', help='Username per autenticazione')
+    parser.add_argument('--password', help='Password per autenticazione')
+    parser.add_argument('--max-retries', type=int, default=3,
+                        help='Retry massimi per i documenti rifiutati dal bulk (default: 3)')
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+
+    connection = {
+        "host": args.host,
+        "port": args.port,
+        "username": args.username,
+        "password": args.password,
+        "api_key": args.api_key,
+        "max_retries": args.max_retries,
+    }
+    with ProfileSession(args) as profiler, profiler.phase("load"):
+        run_load(connection, workers=args.workers, rate=args.rate, duration=args.duration,
+                 batch_size=args.batch_size, index_name=args.index,
+                 report_interval=args.report_interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Modulo per costruire il corpo NDJSON delle richieste _bulk dei log simulati
+direttamente in byte, da template precompilati, senza creare un dizionario
+per ogni documento né passare da json.dumps.
+"""
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class LogRecord:
+    """Log simulato in forma compatta (__slots__, nessun dizionario per istanza)"""
+
+    __slots__ = ("timestamp", "service", "status", "response_time_ms", "request_number",
+                 "environment", "error_message", "error_code")
+
+    def __init__(self, timestamp: str, service: str, status: str, response_time_ms: int,
+                 request_number: int, environment: str,
+                 error_message: Optional[str] = None, error_code: Optional[int] = None):
+        self.timestamp = timestamp
+        self.service = service
+        self.status = status
+        self.response_time_ms = response_time_ms
+        self.request_number = request_number
+        self.environment = environment
+        self.error_message = error_message
+        self.error_code = error_code
+
+    def to_dict(self) -> Dict:
+        """
+        Converte il record nel dizionario prodotto da ElkLogSimulator._generate_service_log
+
+        Returns:
+            Dizionario con i dati del log
+        """
+        log = {
+            "timestamp": self.timestamp,
+            "service": self.service,
+            "status": self.status,
+            "response_time_ms": self.response_time_ms,
+            "request_id": f"req-{self.request_number}",
+            "environment": self.environment
+        }
+        if self.error_message is not None:
+            log["error_message"] = self.error_message
+            log["error_code"] = self.error_code
+        else:
+            log["http_status"] = 200
+        return log
+
+
+class BulkBodyBuilder:
+    """
+    Costruisce il corpo _bulk per un indice in un bytearray riutilizzato.
+
+    La riga di azione è codificata una sola volta; ogni documento è una singola
+    formattazione di un template in byte, con le stringhe ricorrenti (servizio,
+    status, ambiente, messaggi di errore) già codificate in JSON e in cache.
+    """
+
+    # Stesso ordine dei campi di _generate_service_log, così i documenti sono identici
+    OK_TEMPLATE = (b'{"timestamp":"%s","service":%s,"status":%s,"response_time_ms":%d,'
+                   b'"request_id":"req-%d","environment":%s,"http_status":200}\n')
+    ERROR_TEMPLATE = (b'{"timestamp":"%s","service":%s,"status":%s,"response_time_ms":%d,'
+                      b'"request_id":"req-%d","environment":%s,"error_message":%s,"error_code":%d}\n')
+    # La risposta contiene solo quanto serve per sapere quali documenti ritentare
+    FILTER_PATH = "errors,items.*.status,items.*.error"
+
+    def __init__(self, index_name: str):
+        """
+        Args:
+            index_name: Indice di destinazione dei documenti
+        """
+        self.index_name = index_name
+        self._action = (json.dumps({"index": {"_index": index_name}}, separators=(",", ":"))
+                        + "\n").encode("utf-8")
+        self._strings: Dict[str, bytes] = {}
+        self._buffer = bytearray()
+
+    def _string(self, value: str) -> bytes:
+        encoded = self._strings.get(value)
+        if encoded is None:
+            encoded = self._strings[value] = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        return encoded
+
+    def encode(self, records: List[LogRecord]) -> bytes:
+        """
+        Codifica i record nel corpo NDJSON di una richiesta _bulk
+
+        Args:
+            records: Record da inviare
+
+        Returns:
+            Corpo della richiesta (il trasporto richiede bytes: una sola copia del buffer)
+        """
+        buffer = self._buffer
+        del buffer[:]
+        action = self._action
+        string = self._string
+        ok_template = self.OK_TEMPLATE
+        error_template = self.ERROR_TEMPLATE
+        for record in records:
+            buffer += action
+            if record.error_message is None:
+                buffer += ok_template % (
+                    record.timestamp.encode("ascii"), string(record.service), string(record.status),
+                    record.response_time_ms, record.request_number, string(record.environment)
+                )
+            else:
+                buffer += error_template % (
+                    record.timestamp.encode("ascii"), string(record.service), string(record.status),
+                    record.response_time_ms, record.request_number, string(record.environment),
+                    string(record.error_message), record.error_code
+                )
+        return bytes(buffer)
+
+    def to_action(self, record: LogRecord) -> Dict:
+        """Converte un record nell'azione bulk equivalente (per lo spool su disco)"""
+        return {"_index": self.index_name, "_source": record.to_dict()}
+
+    def send_chunk(self, es, records: List[LogRecord],
+                   **kwargs) -> Iterator[Tuple[LogRecord, bool, Optional[int], object]]:
+        """
+        Invia un blocco di record come corpo _bulk grezzo.
+
+        Ha la stessa forma di elk_bulk._send_chunk e si passa a bulk_with_retry
+        come send_chunk: restituisce (record, ok, status, errore) per ognuno.
+        """
+        try:
+            response = es.bulk(operations=self.encode(records), filter_path=self.FILTER_PATH, **kwargs)
+        except Exception as e:
+            # Errore di trasporto (connessione, timeout): tutto il blocco è ritentabile
+            for record in records:
+                yield record, False, None, str(e)
+            return
+        if not response.get("errors"):
+            for record in records:
+                yield record, True, 201, None
+            return
+        for record, item in zip(records, response["items"]):
+            info = next(iter(item.values()))
+            status = info.get("status")
+            yield record, status is not None and 200 <= status < 300, status, info.get("error")
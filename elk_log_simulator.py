@@ -1,17 +1,46 @@
 """
 Modulo per simulare e inviare log a Elasticsearch
 """
+import argparse
 import json
 import random
 import time
 from datetime import datetime, timedelta
 from elasticsearch import Elasticsearch
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from elk_bulk import BulkSpool, ChunkTuner, bulk_with_retry
+from elk_log_encoder import BulkBodyBuilder, LogRecord
+from elk_metrics import METRICS, MetricsExport, add_metrics_arguments, instrumented_node_class
+from elk_rollup import RollupAggregator
+from elk_profiling import NULL_PROFILER, PhaseProfiler, ProfileSession, add_profiling_arguments
 
 
 class ElkLogSimulator:
     """Classe per simulare log di servizi e inviarli a Elasticsearch"""
     
+    SERVICES = [
+        "api-gateway",
+        "auth-service",
+        "payment-service",
+        "notification-service",
+        "user-service",
+        "database-service",
+        "cache-service"
+    ]
+    
+    STATUSES = ["OK", "KO","N.A."]
+    ERROR_MESSAGES = [
+        "Connection timeout",
+        "Invalid credentials",
+        "Resource not found",
+        "Internal server error",
+        "Database connection failed",
+        "Rate limit exceeded"
+    ]
+    ERROR_CODES = [400, 401, 403, 404, 500, 502, 503]
+    ENVIRONMENTS = ["production", "staging", "development"]
+    
     @staticmethod
     def get_index_name(date: datetime = None) -> str:
         """
@@ -28,7 +57,10 @@ class ElkLogSimulator:
         return f"services-log-{date.year}-{date.month:02d}"
     
     def __init__(self, host: str = "localhost", port: int = 9200, 
-                 username: str = None, password: str = None, api_key: str = None):
+                 username: str = None, password: str = None, api_key: str = None,
+                 quiet: bool = False, spool_dir: str = None, max_retries: int = 3,
+                 auto_tune: bool = False, target_latency: float = 1.0,
+                 tuning_file: str = ".bulk_tuning.json"):
         """
         Inizializza la connessione a Elasticsearch
         
@@ -39,22 +71,38 @@ class ElkLogSimulator:
             password: Password per autenticazione (opzionale)
             api_key: API Key per autenticazione (opzionale, alternativa a username/password)
                     Formato: "id:api_key" oppure "base64_encoded_key"
+            quiet: Se True non stampa una riga per ogni documento inviato
+            spool_dir: Directory dello spool su disco per i documenti non inviati (opzionale)
+            max_retries: Numero massimo di retry per i documenti rifiutati dal bulk
+            auto_tune: Se True la dimensione dei blocchi bulk si regola da sola
+                       verso target_latency (chunk_size viene ignorato)
+            target_latency: Latenza obiettivo in secondi per richiesta bulk
+            tuning_file: File in cui salvare la dimensione ottimale per pattern di indice
         """
+        self.quiet = quiet
+        self.max_retries = max_retries
+        self.auto_tune = auto_tune
+        self.target_latency = target_latency
+        self.tuning_file = tuning_file
+        self.spool = BulkSpool(spool_dir) if spool_dir else None
+        node_class = instrumented_node_class()
         # Priorità: API Key > Username/Password > Nessuna autenticazione
         if api_key:
             self.es = Elasticsearch(
                 [f"http://{host}:{port}"],
-                api_key=api_key
+                api_key=api_key,
+                node_class=node_class
             )
             print(f"🔑 Autenticazione tramite API Key")
         elif username and password:
             self.es = Elasticsearch(
                 [f"http://{host}:{port}"],
-                basic_auth=(username, password)
+                basic_auth=(username, password),
+                node_class=node_class
             )
             print(f"🔐 Autenticazione tramite Username/Password")
         else:
-            self.es = Elasticsearch([f"http://{host}:{port}"])
+            self.es = Elasticsearch([f"http://{host}:{port}"], node_class=node_class)
             print(f"⚠️  Connessione senza autenticazione")
         
         # Verifica connessione
@@ -63,6 +111,18 @@ class ElkLogSimulator:
         else:
             print(f"✗ Impossibile connettersi a Elasticsearch su {host}:{port}")
     
+    def _chunk_tuner(self, index_name: str) -> Optional[ChunkTuner]:
+        """Crea il tuner dei blocchi per l'indice, se la regolazione automatica è attiva"""
+        if not self.auto_tune:
+            return None
+        return ChunkTuner.for_index(index_name, target_latency=self.target_latency,
+                                    state_file=self.tuning_file)
+    
+    def _report_tuner(self, tuner: Optional[ChunkTuner]):
+        if tuner is not None:
+            tuner.save()
+            print(f"📐 Blocchi bulk per {tuner.pattern}: {tuner.summary()}")
+    
     def _generate_service_log(self) -> Dict:
         """
         Genera un log simulato di un servizio
@@ -70,28 +130,8 @@ class ElkLogSimulator:
         Returns:
             Dizionario con i dati del log
         """
-        services = [
-            "api-gateway",
-            "auth-service",
-            "payment-service",
-            "notification-service",
-            "user-service",
-            "database-service",
-            "cache-service"
-        ]
-        
-        statuses = ["OK", "KO","N.A."]
-        error_messages = [
-            "Connection timeout",
-            "Invalid credentials",
-            "Resource not found",
-            "Internal server error",
-            "Database connection failed",
-            "Rate limit exceeded"
-        ]
-        
-        status = random.choice(statuses)
-        service = random.choice(services)
+        status = random.choice(self.STATUSES)
+        service = random.choice(self.SERVICES)
         
         
         log = {
@@ -100,24 +140,46 @@ class ElkLogSimulator:
             "status": status,
             "response_time_ms": random.randint(10, 5000),
             "request_id": f"req-{random.randint(100000, 999999)}",
-            "environment": random.choice(["production", "staging", "development"])
+            "environment": random.choice(self.ENVIRONMENTS)
         }
         
         # Aggiungi dettagli in caso di errore
         if status == "ko":
-            log["error_message"] = random.choice(error_messages)
-            log["error_code"] = random.choice([400, 401, 403, 404, 500, 502, 503])
+            log["error_message"] = random.choice(self.ERROR_MESSAGES)
+            log["error_code"] = random.choice(self.ERROR_CODES)
         else:
             log["http_status"] = 200
         
         return log
     
-    def generate_logs(self, count: int = 10) -> List[Dict]:
+    def _generate_service_record(self) -> LogRecord:
+        """
+        Genera un log simulato in forma compatta, con gli stessi valori di _generate_service_log
+        
+        Returns:
+            LogRecord con i dati del log
+        """
+        status = random.choice(self.STATUSES)
+        record = LogRecord(
+            (datetime.now() - timedelta(hours=1)).isoformat(),
+            random.choice(self.SERVICES),
+            status,
+            random.randint(10, 5000),
+            random.randint(100000, 999999),
+            random.choice(self.ENVIRONMENTS)
+        )
+        if status == "ko":
+            record.error_message = random.choice(self.ERROR_MESSAGES)
+            record.error_code = random.choice(self.ERROR_CODES)
+        return record
+    
+    def generate_logs(self, count: int = 10, delay: float = 0.01) -> List[Dict]:
         """
         Genera una lista di log simulati
         
         Args:
             count: Numero di log da generare
+            delay: Pausa in secondi tra un log e il successivo (0 = nessuna pausa)
             
         Returns:
             Lista di dizionari contenenti i log
@@ -125,10 +187,47 @@ class ElkLogSimulator:
         logs = []
         for _ in range(count):
             logs.append(self._generate_service_log())
-            time.sleep(0.01)  # Piccola pausa tra i log
+            if delay:
+                time.sleep(delay)  # Piccola pausa tra i log
         
+        METRICS.docs_generated.inc(count)
         return logs
     
+    def generate_records(self, count: int = 10, delay: float = 0.01) -> List[LogRecord]:
+        """
+        Genera una lista di log simulati in forma compatta
+        
+        Args:
+            count: Numero di log da generare
+            delay: Pausa in secondi tra un log e il successivo (0 = nessuna pausa)
+            
+        Returns:
+            Lista di LogRecord
+        """
+        generate = self._generate_service_record
+        if delay:
+            records = []
+            for _ in range(count):
+                records.append(generate())
+                time.sleep(delay)
+        else:
+            records = [generate() for _ in range(count)]
+        METRICS.docs_generated.inc(count)
+        return records
+    
+    @staticmethod
+    def serialize_log(log: Dict) -> str:
+        """
+        Serializza un log in JSON compatto, pronto per il bulk
+        
+        Args:
+            log: Dizionario contenente il log
+            
+        Returns:
+            Stringa JSON del documento
+        """
+        return json.dumps(log, ensure_ascii=False, separators=(",", ":"))
+    
     def send_log(self, log: Dict, index_name: str = None) -> bool:
         """
         Invia un singolo log a Elasticsearch
@@ -144,26 +243,32 @@ class ElkLogSimulator:
             index_name = self.get_index_name()
         try:
             response = self.es.index(index=index_name, document=log)
-            print(f"✓ Log inviato: {log['service']} - {log['status']} (ID: {response['_id']})")
+            if not self.quiet:
+                print(f"✓ Log inviato: {log['service']} - {log['status']} (ID: {response['_id']})")
             return True
         except Exception as e:
             print(f"✗ Errore nell'invio del log: {e}")
             return False
     
-    def send_logs_bulk(self, logs: List[Dict], index_name: str = None) -> Dict:
+    def send_logs_bulk(self, logs: List[Dict], index_name: str = None,
+                       chunk_size: int = 500) -> Dict:
         """
         Invia multipli log a Elasticsearch usando bulk API
         
         Args:
-            logs: Lista di dizionari contenenti i log
+            logs: Lista di log, come dizionari o come stringhe JSON già serializzate
             index_name: Nome dell'indice Elasticsearch (default: services-log-AAAA-MM)
+            chunk_size: Numero di documenti per ogni richiesta bulk (default: 500,
+                        ignorato con la regolazione automatica)
+            
+        I documenti rifiutati vengono ritentati singolarmente con backoff; quelli
+        che falliscono ancora finiscono nello spool su disco, se configurato.
             
         Returns:
             Dizionario con statistiche sull'invio
         """
         if index_name is None:
             index_name = self.get_index_name()
-        from elasticsearch.helpers import bulk
         
         # Prepara i documenti per bulk insert
         actions = [
@@ -174,18 +279,83 @@ class ElkLogSimulator:
             for log in logs
         ]
         
+        tuner = self._chunk_tuner(index_name)
         try:
-            success, failed = bulk(self.es, actions, stats_only=True)
-            print(f"\n✓ Bulk insert completato: {success} successi, {failed} fallimenti")
-            return {"success": success, "failed": failed}
+            stats = bulk_with_retry(self.es, actions, chunk_size=chunk_size,
+                                    max_retries=self.max_retries, spool=self.spool, tuner=tuner)
+            print(f"\n✓ Bulk insert completato: {stats['success']} successi, {stats['failed']} fallimenti"
+                  f" ({stats['retried']} retry, {stats['spooled']} in spool)")
+            self._report_tuner(tuner)
+            return stats
         except Exception as e:
             print(f"✗ Errore nel bulk insert: {e}")
+            METRICS.bulk_docs.inc(len(logs), result="failed")
             return {"success": 0, "failed": len(logs)}
     
+    def send_records_bulk(self, records: List[LogRecord], index_name: str = None,
+                          chunk_size: int = 500) -> Dict:
+        """
+        Invia log in forma compatta con bulk API, codificandoli direttamente in NDJSON
+        
+        Stessi retry e stesso spool di send_logs_bulk, ma senza dizionari di azione
+        né serializzazione JSON per ogni documento.
+        
+        Args:
+            records: Lista di LogRecord
+            index_name: Nome dell'indice Elasticsearch (default: services-log-AAAA-MM)
+            chunk_size: Numero di documenti per ogni richiesta bulk (default: 500,
+                        ignorato con la regolazione automatica)
+            
+        Returns:
+            Dizionario con statistiche sull'invio
+        """
+        if index_name is None:
+            index_name = self.get_index_name()
+        builder = BulkBodyBuilder(index_name)
+        tuner = self._chunk_tuner(index_name)
+        stats = bulk_with_retry(self.es, records, chunk_size=chunk_size,
+                                max_retries=self.max_retries, spool=self.spool,
+                                send_chunk=builder.send_chunk, to_action=builder.to_action,
+                                tuner=tuner)
+        print(f"\n✓ Bulk insert completato: {stats['success']} successi, {stats['failed']} fallimenti"
+              f" ({stats['retried']} retry, {stats['spooled']} in spool)")
+        self._report_tuner(tuner)
+        return stats
+    
+    def drain_spool(self, chunk_size: int = 500) -> Dict:
+        """
+        Reinvia i documenti rimasti nello spool da esecuzioni precedenti
+        
+        Args:
+            chunk_size: Numero di documenti per ogni richiesta bulk (default: 500)
+            
+        Returns:
+            Dizionario con statistiche sull'invio
+        """
+        totals = {"success": 0, "failed": 0, "retried": 0, "spooled": 0}
+        if self.spool is None:
+            return totals
+        pending = self.spool.pending()
+        if not pending:
+            return totals
+        print(f"📦 Reinvio di {pending} documenti dallo spool {self.spool.directory}")
+        for batch in self.spool.drain(batch_size=chunk_size):
+            stats = bulk_with_retry(self.es, batch, chunk_size=chunk_size,
+                                    max_retries=self.max_retries, spool=self.spool)
+            for key in totals:
+                totals[key] += stats[key]
+        print(f"✓ Spool svuotato: {totals['success']} successi, {totals['failed']} fallimenti, "
+              f"{totals['spooled']} ancora in spool")
+        return totals
+    
     def simulate_and_send(
         self, count: int = 20, 
         index_name: str = None,
-        use_bulk: bool = True):
+        use_bulk: bool = True,
+        profiler: PhaseProfiler = NULL_PROFILER,
+        fast_path: bool = True,
+        rollup: RollupAggregator = None,
+        chunk_size: int = 500):
         """
         Genera e invia log simulati a Elasticsearch
         
@@ -193,29 +363,73 @@ class ElkLogSimulator:
             count: Numero di log da generare
             index_name: Nome dell'indice Elasticsearch (default: services-log-AAAA-MM)
             use_bulk: Se True usa bulk API, altrimenti invia uno per uno
+            profiler: Profiler delle fasi generate/serialize/send (default: disattivato)
+            fast_path: Se True (e use_bulk) genera LogRecord e li codifica direttamente
+                       nel corpo _bulk, senza dizionari né json.dumps per documento
+            rollup: Se indicato, invia rollup per minuto (più gli eventi grezzi campionati)
+                    invece di tutti gli eventi
+            chunk_size: Documenti per ogni richiesta bulk (ignorato con auto_tune)
         """
         if index_name is None:
             index_name = self.get_index_name()
+        
+        # Prima i documenti rimasti in sospeso dalle esecuzioni precedenti
+        if self.spool is not None:
+            with profiler.phase("drain"):
+                self.drain_spool()
+        
         print(f"\n{'='*60}")
         print(f"Generazione di {count} log simulati...")
         print(f"{'='*60}\n")
         
-        logs = self.generate_logs(count)
+        fast_path = fast_path and use_bulk
+        with profiler.phase("generate"):
+            if fast_path:
+                records = self.generate_records(count)
+                logs = [record.to_dict() for record in records[:3]]
+            else:
+                logs = self.generate_logs(count)
         
         # Stampa alcuni log di esempio
         print("\nEsempi di log generati:")
         print(json.dumps(logs[:3], indent=2, ensure_ascii=False))
         
+        if rollup is not None:
+            print(f"\n{'='*60}")
+            print(f"Invio rollup per minuto a Elasticsearch (indice: {rollup.TEMPLATE_NAME}-AAAA-MM)...")
+            print(f"{'='*60}\n")
+            with profiler.phase("rollup"):
+                if fast_path:
+                    for record in records:
+                        rollup.add_record(record)
+                else:
+                    for log in logs:
+                        rollup.add_log(log)
+            with profiler.phase("send"):
+                stats = rollup.flush(force=True)
+            print(f"✓ {rollup.stats['events']} eventi aggregati in {rollup.stats['rollups']} rollup "
+                  f"({rollup.stats['raw_sampled']} eventi grezzi campionati): "
+                  f"{stats['success']} documenti inviati, {stats['failed']} fallimenti")
+            return
+        
         print(f"\n{'='*60}")
         print(f"Invio log a Elasticsearch (indice: {index_name})...")
         print(f"{'='*60}\n")
         
-        if use_bulk:
-            self.send_logs_bulk(logs, index_name)
+        if fast_path:
+            # La codifica avviene blocco per blocco durante l'invio
+            with profiler.phase("send"):
+                self.send_records_bulk(records, index_name, chunk_size=chunk_size)
+        elif use_bulk:
+            with profiler.phase("serialize"):
+                documents = [self.serialize_log(log) for log in logs]
+            with profiler.phase("send"):
+                self.send_logs_bulk(documents, index_name, chunk_size=chunk_size)
         else:
-            for log in logs:
-                self.send_log(log, index_name)
-                time.sleep(0.01)
+            with profiler.phase("send"):
+                for log in logs:
+                    self.send_log(log, index_name)
+                    time.sleep(0.01)
     
     def get_log_statistics(self, index_name: str = None) -> Dict:
         """
@@ -243,7 +457,8 @@ class ElkLogSimulator:
                 }
             }
             
-            result = self.es.search(index=index_name, body=query)
+            with METRICS.query_latency.time(query="log_statistics"):
+                result = self.es.search(index=index_name, body=query)
             
             stats = {
                 "total_logs": result['hits']['total']['value'],
@@ -261,10 +476,86 @@ class ElkLogSimulator:
         except Exception as e:
             print(f"✗ Errore nel recupero delle statistiche: {e}")
             return {}
+    
+    def get_rollup_statistics(self, index_name: str = None) -> Dict:
+        """
+        Recupera le stesse statistiche di get_log_statistics dagli indici di rollup
+        
+        Args:
+            index_name: Nome dell'indice o pattern (default: services-rollup-*)
+            
+        Returns:
+            Dizionario con le statistiche
+        """
+        if index_name is None:
+            index_name = f"{RollupAggregator.TEMPLATE_NAME}-*"
+        try:
+            # Ogni documento di rollup vale "count" eventi: si sommano i conteggi
+            query = {
+                "size": 0,
+                "aggs": {
+                    "total_logs": {"sum": {"field": "count"}},
+                    "status_counts": {
+                        "terms": {"field": "status"},
+                        "aggs": {"events": {"sum": {"field": "count"}}}
+                    },
+                    "service_counts": {
+                        "terms": {"field": "service"},
+                        "aggs": {"events": {"sum": {"field": "count"}}}
+                    }
+                }
+            }
+            
+            with METRICS.query_latency.time(query="rollup_statistics"):
+                result = self.es.search(index=index_name, body=query)
+            
+            aggregations = result['aggregations']
+            return {
+                "total_logs": int(aggregations['total_logs']['value']),
+                "status_breakdown": {
+                    bucket['key']: int(bucket['events']['value'])
+                    for bucket in aggregations['status_counts']['buckets']
+                },
+                "service_breakdown": {
+                    bucket['key']: int(bucket['events']['value'])
+                    for bucket in aggregations['service_counts']['buckets']
+                }
+            }
+        except Exception as e:
+            print(f"✗ Errore nel recupero delle statistiche: {e}")
+            return {}
 
 
 def main():
     """Funzione principale per demo"""
+    parser = argparse.ArgumentParser(description='Simula log di servizi e li invia a Elasticsearch')
+    parser.add_argument('-n', '--count', type=int, default=50000,
+                        help='Numero di log da generare (default: 50000)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Non stampa una riga per ogni documento inviato')
+    parser.add_argument('--spool-dir',
+                        help='Directory dello spool su disco per i documenti non inviati')
+    parser.add_argument('--max-retries', type=int, default=3,
+                        help='Retry massimi per i documenti rifiutati dal bulk (default: 3)')
+    parser.add_argument('--no-fast-path', action='store_true',
+                        help='Usa dizionari e json.dumps invece della codifica diretta del corpo _bulk')
+    parser.add_argument('--rollup', action='store_true',
+                        help='Invia rollup per minuto (services-rollup-AAAA-MM) invece degli eventi grezzi')
+    parser.add_argument('--raw-sample-rate', type=float, default=0.0,
+                        help='Con --rollup, frazione di eventi grezzi da inviare comunque (default: 0)')
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help='Documenti per ogni richiesta bulk (default: 500)')
+    parser.add_argument('--auto-tune', action='store_true',
+                        help='Regola da sola la dimensione dei blocchi bulk verso --target-latency')
+    parser.add_argument('--target-latency', type=float, default=1.0,
+                        help='Con --auto-tune, latenza obiettivo in secondi per richiesta (default: 1.0)')
+    parser.add_argument('--tuning-file', default='.bulk_tuning.json',
+                        help='Con --auto-tune, file delle dimensioni apprese per pattern di indice '
+                             '(default: .bulk_tuning.json)')
+    add_metrics_arguments(parser)
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    
     # Configurazione connessione (modifica questi parametri)
     HOST = "20.105.91.235"
     PORT = 9200
@@ -284,25 +575,44 @@ def main():
         port=PORT, 
         username=USERNAME, 
         password=PASSWORD,
-        api_key=API_KEY
+        api_key=API_KEY,
+        quiet=args.quiet,
+        spool_dir=args.spool_dir,
+        max_retries=args.max_retries,
+        auto_tune=args.auto_tune,
+        target_latency=args.target_latency,
+        tuning_file=args.tuning_file
     )
     
     # Mostra l'indice che verrà utilizzato
     current_index = simulator.get_index_name()
     print(f"\nIndice corrente: {current_index}\n")
     
-    # Genera e invia 50 log (usa automaticamente il pattern services-log-AAAA-MM)
-    simulator.simulate_and_send(count=50000, use_bulk=True)
+    rollup = None
+    if args.rollup:
+        rollup = RollupAggregator(simulator.es, raw_sample_rate=args.raw_sample_rate,
+                                  spool=simulator.spool, max_retries=simulator.max_retries)
+        rollup.ensure_template()
     
-    # Attendi un momento per permettere l'indicizzazione
-    time.sleep(2)
-    
-    # Mostra statistiche (cerca in tutti gli indici services-log-*)
-    print(f"\n{'='*60}")
-    print("Statistiche dei log inviati:")
-    print(f"{'='*60}\n")
-    stats = simulator.get_log_statistics()  # Usa il pattern services-log-*
-    print(json.dumps(stats, indent=2, ensure_ascii=False))
+    with MetricsExport(args), ProfileSession(args) as profiler:
+        # Genera e invia i log (usa automaticamente il pattern services-log-AAAA-MM)
+        simulator.simulate_and_send(count=args.count, use_bulk=True, profiler=profiler,
+                                    fast_path=not args.no_fast_path, rollup=rollup,
+                                    chunk_size=args.chunk_size)
+        
+        # Attendi un momento per permettere l'indicizzazione
+        time.sleep(2)
+        
+        # Mostra statistiche (cerca in tutti gli indici services-log-*)
+        print(f"\n{'='*60}")
+        print("Statistiche dei log inviati:")
+        print(f"{'='*60}\n")
+        with profiler.phase("statistics"):
+            if rollup is not None:
+                stats = simulator.get_rollup_statistics()  # Usa il pattern services-rollup-*
+            else:
+                stats = simulator.get_log_statistics()  # Usa il pattern services-log-*
+        print(json.dumps(stats, indent=2, ensure_ascii=False))
 
 
 if __name__ == "__main__":
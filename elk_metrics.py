@@ -0,0 +1,381 @@
+"""
+Modulo di metriche per gli strumenti ELK: contatori e istogrammi di latenza
+esportabili in formato testo Prometheus o come snapshot NDJSON periodici.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Status HTTP per cui il transport Elasticsearch ripete la richiesta
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: Tuple[str, ...], key: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Contatore monotono con etichette opzionali"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """Incrementa il contatore della quantità indicata"""
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Restituisce il valore corrente per le etichette indicate"""
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {",".join(key) or "": value for key, value in self._values.items()}
+
+
+class Histogram:
+    """Istogramma a bucket fissi (cumulativi in esportazione) con etichette opzionali"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per ogni serie: [conteggi per bucket (+Inf incluso), somma, numero osservazioni]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """Registra un'osservazione"""
+        key = _label_key(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> "_Timer":
+        """Context manager che osserva la durata del blocco in secondi"""
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(self.labelnames, labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                ",".join(key) or "": {
+                    "count": count,
+                    "sum": total,
+                    "buckets": dict(zip([repr(b) for b in self.buckets] + ["+Inf"], counts))
+                }
+                for key, (counts, total, count) in self._series.items()
+            }
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    """Registro delle metriche: crea (o restituisce se esistenti) contatori e istogrammi"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text, labelnames)
+            return self._metrics[name]
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, labelnames, buckets)
+            return self._metrics[name]
+
+    def render_prometheus(self) -> str:
+        """Restituisce tutte le metriche nel formato testo di Prometheus"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """Restituisce una fotografia serializzabile in JSON di tutte le metriche"""
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "metrics": {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+        }
+
+
+# Registro globale usato di default da simulatore, client e convertitore
+REGISTRY = MetricsRegistry()
+
+
+class ElkMetrics:
+    """Metriche dei percorsi critici, definite una volta sola su un registro"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        self.registry = registry
+        self.docs_generated = registry.counter(
+            "elk_docs_generated_total", "Log simulati generati")
+        self.bulk_docs = registry.counter(
+            "elk_bulk_docs_total", "Documenti inviati via bulk per esito", ("result",))
+        self.request_latency = registry.histogram(
+            "elk_es_request_duration_seconds", "Latenza delle richieste HTTP a Elasticsearch",
+            ("endpoint",))
+        self.bytes_sent = registry.counter(
+            "elk_es_request_bytes_total", "Byte inviati a Elasticsearch", ("endpoint",))
+        self.retries = registry.counter(
+            "elk_es_request_retries_total",
+            "Richieste fallite con errore o status ritentabile dal transport", ("endpoint",))
+        self.rejections = registry.counter(
+            "elk_bulk_rejections_total", "Documenti rifiutati dalle richieste bulk")
+        self.bulk_item_retries = registry.counter(
+            "elk_bulk_item_retries_total", "Documenti reinviati dopo un rifiuto del bulk")
+        self.bulk_spooled = registry.counter(
+            "elk_bulk_spooled_total", "Documenti salvati nello spool su disco")
+        self.query_latency = registry.histogram(
+            "elk_query_duration_seconds", "Durata delle interrogazioni incluso il post-processing",
+            ("query",))
+        self.docs_exported = registry.counter(
+            "elk_docs_exported_total", "Documenti esportati dagli indici")
+        self.csv_rows = registry.counter(
+            "elk_csv_rows_total", "Righe CSV convertite")
+        self.csv_bytes = registry.counter(
+            "elk_csv_bytes_total", "Byte CSV letti")
+        self.csv_duration = registry.histogram(
+            "elk_csv_phase_duration_seconds", "Durata delle fasi di conversione CSV", ("phase",))
+        self.rollup_docs = registry.counter(
+            "elk_rollup_docs_total", "Documenti di rollup per minuto inviati")
+
+
+METRICS = ElkMetrics()
+
+
+def endpoint_of(target: str) -> str:
+    """
+    Riduce il path di una richiesta Elasticsearch a un'etichetta a bassa cardinalità
+
+    Args:
+        target: Path della richiesta (es. /services-log-2024-06/_bulk?refresh=false)
+
+    Returns:
+        L'ultima API "_xxx" del path (es. "_bulk"), "root" per il path vuoto, altrimenti "other"
+    """
+    parts = [part for part in target.split("?", 1)[0].split("/") if part]
+    for part in reversed(parts):
+        if part.startswith("_"):
+            return part
+    return "root" if not parts else "other"
+
+
+_node_class = None
+
+
+def instrumented_node_class():
+    """
+    Restituisce una classe di nodo HTTP per il client Elasticsearch che misura latenza,
+    byte inviati e retry di ogni richiesta. Da passare come node_class a Elasticsearch().
+    """
+    global _node_class
+    if _node_class is None:
+        from elastic_transport import Urllib3HttpNode
+
+        class InstrumentedHttpNode(Urllib3HttpNode):
+            def perform_request(self, method, target, body=None, headers=None, **kwargs):
+                endpoint = endpoint_of(target)
+                if body:
+                    METRICS.bytes_sent.inc(len(body), endpoint=endpoint)
+                start = time.perf_counter()
+                try:
+                    response = super().perform_request(method, target, body=body,
+                                                       headers=headers, **kwargs)
+                except Exception:
+                    METRICS.retries.inc(endpoint=endpoint)
+                    raise
+                finally:
+                    METRICS.request_latency.observe(time.perf_counter() - start, endpoint=endpoint)
+                if response.meta.status in RETRY_STATUSES:
+                    METRICS.retries.inc(endpoint=endpoint)
+                return response
+
+        _node_class = InstrumentedHttpNode
+    return _node_class
+
+
+_handler_class = None
+
+
+def _metrics_handler_class():
+    """Classe dell'handler HTTP di /metrics, creata solo se l'endpoint viene avviato"""
+    global _handler_class
+    if _handler_class is None:
+        from http.server import BaseHTTPRequestHandler
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = self.server.registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        _handler_class = MetricsHandler
+    return _handler_class
+
+
+def start_http_server(port: int, host: str = "0.0.0.0",
+                      registry: MetricsRegistry = REGISTRY) -> "ThreadingHTTPServer":
+    """
+    Espone le metriche su http://host:port/metrics in un thread in background
+
+    Returns:
+        Il server avviato (chiamare shutdown() per fermarlo)
+    """
+    # Import differito: http.server pesa quanto il resto del modulo
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _metrics_handler_class())
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class SnapshotWriter:
+    """Scrive periodicamente uno snapshot NDJSON delle metriche su file"""
+
+    def __init__(self, path: str, interval: float = 10.0, registry: MetricsRegistry = REGISTRY):
+        """
+        Args:
+            path: File NDJSON a cui accodare gli snapshot
+            interval: Intervallo in secondi tra due snapshot
+            registry: Registro delle metriche da esportare
+        """
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "SnapshotWriter":
+        self._thread.start()
+        return self
+
+    def write_snapshot(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.registry.snapshot(), ensure_ascii=False) + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write_snapshot()
+
+    def stop(self):
+        """Ferma il thread e scrive uno snapshot finale"""
+        self._stop.set()
+        self._thread.join()
+        self.write_snapshot()
+
+
+def add_metrics_arguments(parser):
+    """Aggiunge a un parser argparse le opzioni di esportazione delle metriche"""
+    group = parser.add_argument_group('metriche')
+    group.add_argument('--metrics-port', type=int,
+                       help='Espone le metriche Prometheus su http://0.0.0.0:PORT/metrics')
+    group.add_argument('--metrics-file',
+                       help='File NDJSON su cui scrivere snapshot periodici delle metriche')
+    group.add_argument('--metrics-interval', type=float, default=10.0,
+                       help='Intervallo in secondi tra gli snapshot NDJSON (default: 10)')
+
+
+class MetricsExport:
+    """Context manager che avvia e ferma gli export richiesti da riga di comando"""
+
+    def __init__(self, args, registry: MetricsRegistry = REGISTRY):
+        self.args = args
+        self.registry = registry
+        self._server = None
+        self._writer: Optional[SnapshotWriter] = None
+
+    def __enter__(self) -> "MetricsExport":
+        if getattr(self.args, "metrics_port", None):
+            self._server = start_http_server(self.args.metrics_port, registry=self.registry)
+            print(f"📈 Metriche esposte su http://0.0.0.0:{self.args.metrics_port}/metrics")
+        if getattr(self.args, "metrics_file", None):
+            self._writer = SnapshotWriter(self.args.metrics_file, self.args.metrics_interval,
+                                          self.registry).start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._writer is not None:
+            self._writer.stop()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
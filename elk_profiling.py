@@ -0,0 +1,174 @@
+"""
+Modulo di profiling per gli entry point da riga di comando: cProfile/pstats,
+campionamento dello stack in formato "folded" per flamegraph, picchi di memoria
+con tracemalloc e ripartizione dei tempi per fase.
+"""
+import cProfile
+import contextlib
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+def add_profiling_arguments(parser):
+    """Aggiunge a un parser argparse le opzioni di profiling"""
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', metavar='FILE',
+                       help='Esegue con cProfile e salva le statistiche pstats in FILE')
+    group.add_argument('--profile-sort', default='cumulative',
+                       help='Ordinamento del riepilogo cProfile (default: cumulative)')
+    group.add_argument('--profile-top', type=int, default=25,
+                       help='Funzioni mostrate nel riepilogo cProfile (default: 25)')
+    group.add_argument('--flamegraph', metavar='FILE',
+                       help='Campiona lo stack e salva in FILE il formato "folded" '
+                            '(flamegraph.pl, speedscope)')
+    group.add_argument('--sample-interval', type=float, default=0.005,
+                       help='Intervallo di campionamento in secondi per --flamegraph (default: 0.005)')
+    group.add_argument('--profile-memory', action='store_true',
+                       help='Misura con tracemalloc il picco di memoria di ogni fase')
+    group.add_argument('--profile-phases', action='store_true',
+                       help='Stampa la ripartizione dei tempi per fase')
+
+
+class PhaseProfiler:
+    """Registra durata e (opzionalmente) picco di memoria di fasi con nome"""
+
+    def __init__(self, enabled: bool = True, track_memory: bool = False):
+        """
+        Args:
+            enabled: Se False le fasi non vengono registrate
+            track_memory: Se True misura il picco di memoria con tracemalloc
+                          (tracemalloc deve essere già avviato)
+        """
+        self.enabled = enabled
+        self.track_memory = track_memory
+        self.phases: List[Dict] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Context manager che misura la fase indicata (le fasi non vanno annidate)"""
+        if not self.enabled:
+            yield
+            return
+        memory_start = 0
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {"phase": name, "seconds": time.perf_counter() - start}
+            if self.track_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record["peak_bytes"] = peak - memory_start
+                record["net_bytes"] = current - memory_start
+            self.phases.append(record)
+
+    def report(self):
+        """Stampa la ripartizione dei tempi (e della memoria) per fase"""
+        if not self.phases:
+            return
+        total = sum(p["seconds"] for p in self.phases) or 1.0
+        print(f"\n{'='*60}")
+        print("Ripartizione per fase")
+        print(f"{'='*60}\n")
+        for p in self.phases:
+            line = f"  {p['phase']:<16} {p['seconds']:>10.3f} s  {p['seconds'] / total * 100:5.1f}%"
+            if "peak_bytes" in p:
+                line += f"  picco {p['peak_bytes'] / (1024 * 1024):9.2f} MB"
+                line += f"  netto {p['net_bytes'] / (1024 * 1024):+9.2f} MB"
+            print(line)
+
+
+# Profiler inattivo usato quando il chiamante non ne passa uno
+NULL_PROFILER = PhaseProfiler(enabled=False)
+
+
+class StackSampler:
+    """
+    Profiler a campionamento: ogni intervallo registra lo stack del thread principale
+    e alla fine scrive i conteggi in formato "folded" (una riga per stack).
+    """
+
+    def __init__(self, output_file: str, interval: float = 0.005):
+        self.output_file = output_file
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Ferma il campionamento e scrive il file folded"""
+        self._stop.set()
+        self._thread.join()
+        with open(self.output_file, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"🔥 {sum(self.samples.values())} campioni salvati in {self.output_file}")
+
+
+class ProfileSession:
+    """
+    Context manager che attiva il profiling richiesto da riga di comando e
+    restituisce il PhaseProfiler da passare alle funzioni instrumentate.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+        self._started_tracemalloc = False
+        self.profiler = NULL_PROFILER
+
+    def __enter__(self) -> PhaseProfiler:
+        args = self.args
+        track_memory = bool(getattr(args, "profile_memory", False))
+        enabled = track_memory or any(
+            getattr(args, name, None) for name in ("profile", "flamegraph", "profile_phases")
+        )
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if enabled:
+            self.profiler = PhaseProfiler(track_memory=track_memory)
+        if getattr(args, "flamegraph", None):
+            self._sampler = StackSampler(args.flamegraph, args.sample_interval).start()
+        if getattr(args, "profile", None):
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        return self.profiler
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.args.profile)
+            print(f"\n📊 Statistiche cProfile salvate in {self.args.profile}")
+            # Import differito: pstats (con inspect e dataclasses) serve solo qui
+            import pstats
+            stats = pstats.Stats(self._cprofile)
+            stats.sort_stats(self.args.profile_sort).print_stats(self.args.profile_top)
+        if self._sampler is not None:
+            self._sampler.stop()
+        self.profiler.report()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
@@ -0,0 +1,434 @@
+"""
+Modulo per la pre-aggregazione lato client dei log: rollup per minuto per
+servizio, status e ambiente (conteggio, errori, somma/min/max della latenza e
+sketch dei quantili fondibile), inviati a un indice separato insieme a un
+campione opzionale degli eventi grezzi.
+"""
+import hashlib
+import json
+import math
+import random
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from elasticsearch import NotFoundError
+
+from elk_bulk import BulkSpool, bulk_with_retry
+from elk_metrics import METRICS
+
+
+class DDSketch:
+    """
+    Sketch dei quantili con errore relativo garantito (DDSketch).
+
+    Ogni valore positivo finisce nel bucket ceil(log_gamma(valore)); il quantile
+    restituito differisce dal valore esatto al più di relative_accuracy in
+    termini relativi. Due sketch con la stessa accuratezza si fondono sommando
+    i bucket, quindi rollup parziali dello stesso minuto restano combinabili.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        """
+        Args:
+            relative_accuracy: Errore relativo massimo dei quantili (default: 1%)
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        """Aggiunge un valore (i valori <= 0 finiscono nel bucket dello zero)"""
+        if value > 0:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+        else:
+            self.zero_count += count
+        self.count += count
+
+    def merge(self, other: "DDSketch"):
+        """Fonde un altro sketch in questo; le accuratezze devono coincidere"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Impossibile fondere sketch con accuratezza diversa")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Stima il quantile richiesto
+
+        Args:
+            q: Quantile tra 0 e 1 (es. 0.99)
+
+        Returns:
+            Valore stimato, o None se lo sketch è vuoto
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self) -> Dict:
+        """Serializza lo sketch (indici e conteggi come array, per non creare campi dinamici)"""
+        indexes = sorted(self.bins)
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero_count": self.zero_count,
+            "indexes": indexes,
+            "counts": [self.bins[index] for index in indexes]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DDSketch":
+        """Ricostruisce uno sketch serializzato con to_dict"""
+        sketch = cls(data["relative_accuracy"])
+        sketch.bins = dict(zip(data["indexes"], data["counts"]))
+        sketch.zero_count = data["zero_count"]
+        sketch.count = sketch.zero_count + sum(data["counts"])
+        return sketch
+
+
+class Rollup:
+    """Statistiche aggregate di un minuto per una combinazione servizio/status/ambiente"""
+
+    __slots__ = ("count", "error_count", "latency_sum", "latency_min", "latency_max", "sketch")
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.count = 0
+        self.error_count = 0
+        self.latency_sum = 0.0
+        self.latency_min = None
+        self.latency_max = None
+        self.sketch = DDSketch(relative_accuracy)
+
+    def add(self, latency: Optional[float], is_error: bool):
+        self.count += 1
+        if is_error:
+            self.error_count += 1
+        if latency is None:
+            return
+        self.latency_sum += latency
+        self.latency_min = latency if self.latency_min is None else min(self.latency_min, latency)
+        self.latency_max = latency if self.latency_max is None else max(self.latency_max, latency)
+        self.sketch.add(latency)
+
+    def merge(self, other: "Rollup"):
+        """Fonde un altro rollup della stessa chiave in questo"""
+        self.count += other.count
+        self.error_count += other.error_count
+        self.latency_sum += other.latency_sum
+        for value in (other.latency_min, other.latency_max):
+            if value is not None:
+                self.latency_min = value if self.latency_min is None else min(self.latency_min, value)
+                self.latency_max = value if self.latency_max is None else max(self.latency_max, value)
+        self.sketch.merge(other.sketch)
+
+    @classmethod
+    def from_document(cls, doc: Dict) -> "Rollup":
+        """Ricostruisce un rollup da un documento inviato a Elasticsearch"""
+        sketch = DDSketch.from_dict(doc["latency_sketch"])
+        rollup = cls(sketch.relative_accuracy)
+        rollup.count = doc["count"]
+        rollup.error_count = doc["error_count"]
+        rollup.latency_sum = doc["latency_sum"]
+        rollup.latency_min = doc["latency_min"]
+        rollup.latency_max = doc["latency_max"]
+        rollup.sketch = sketch
+        return rollup
+
+
+# Chiave di un rollup: (minuto, servizio, status, ambiente)
+RollupKey = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+
+def rollup_id(key: RollupKey) -> str:
+    """_id deterministico del documento di rollup di una chiave"""
+    return hashlib.sha1(json.dumps(list(key), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class RollupAggregator:
+    """
+    Pre-aggregazione in memoria dei log in rollup per minuto.
+
+    I documenti di rollup vanno in services-rollup-AAAA-MM, uno per chiave, con
+    _id deterministico (rollup_id): ogni scrittura di una chiave sostituisce la
+    precedente con l'aggregato completo tenuto in memoria. Un flush normale invia
+    solo i minuti chiusi e li toglie dalla memoria; un flush forzato invia anche i
+    minuti aperti ma li conserva, così la scrittura successiva li completa.
+
+    Un documento già presente nell'indice viene letto e fuso (merge_rollup_documents)
+    solo per gli eventi in ritardo (minuto già chiuso) e, con merge_existing, alla
+    prima scrittura di ogni chiave (più produttori indipendenti sullo stesso minuto).
+    Una frazione degli eventi grezzi può essere inviata comunque all'indice dei log.
+    """
+
+    TEMPLATE_NAME = "services-rollup"
+    MAPPINGS = {
+        "properties": {
+            "@timestamp": {"type": "date"},
+            "service": {"type": "keyword"},
+            "status": {"type": "keyword"},
+            "environment": {"type": "keyword"},
+            "count": {"type": "long"},
+            "error_count": {"type": "long"},
+            "latency_sum": {"type": "double"},
+            "latency_min": {"type": "double"},
+            "latency_max": {"type": "double"},
+            "latency_p50": {"type": "double"},
+            "latency_p95": {"type": "double"},
+            "latency_p99": {"type": "double"},
+            # Lo sketch serve solo per la fusione lato client: non viene indicizzato
+            "latency_sketch": {"type": "object", "enabled": False}
+        }
+    }
+
+    def __init__(self, es, raw_sample_rate: float = 0.0, raw_index: str = None,
+                 relative_accuracy: float = 0.01, chunk_size: int = 500,
+                 spool: Optional[BulkSpool] = None, max_retries: int = 3,
+                 merge_existing: bool = True):
+        """
+        Args:
+            es: Client Elasticsearch
+            raw_sample_rate: Frazione degli eventi grezzi da inviare comunque (0 = nessuno)
+            raw_index: Indice degli eventi grezzi campionati (default: services-log-AAAA-MM)
+            relative_accuracy: Errore relativo degli sketch dei quantili
+            chunk_size: Documenti per ogni richiesta bulk
+            spool: Spool su disco per i documenti non inviati (opzionale)
+            max_retries: Numero massimo di retry per i documenti rifiutati dal bulk
+            merge_existing: Se True la prima scrittura di ogni chiave si somma al documento
+                            già presente; False se chi invia rilegge da sé gli eventi dei
+                            minuti aperti dopo un riavvio (lo shipper, col suo checkpoint)
+        """
+        self.es = es
+        self.raw_sample_rate = raw_sample_rate
+        self.raw_index = raw_index
+        self.relative_accuracy = relative_accuracy
+        self.chunk_size = chunk_size
+        self.spool = spool
+        self.max_retries = max_retries
+        self.merge_existing = merge_existing
+        self.stats = {"events": 0, "rollups": 0, "raw_sampled": 0}
+        self._rollups: Dict[RollupKey, Rollup] = {}
+        # Documenti già presenti nell'indice, letti alla prima scrittura della chiave
+        self._base: Dict[RollupKey, Optional[Rollup]] = {}
+        # Chiavi nate dopo la chiusura del loro minuto (eventi in ritardo)
+        self._late: Set[RollupKey] = set()
+        # Eventi grezzi campionati e non ancora scritti, con il loro _id
+        self._raw: List[Tuple[object, str]] = []
+        self._watermark: Optional[str] = None
+
+    def ensure_template(self):
+        """Installa il template degli indici services-rollup-*"""
+        self.es.indices.put_index_template(
+            name=self.TEMPLATE_NAME,
+            index_patterns=[f"{self.TEMPLATE_NAME}-*"],
+            template={"mappings": self.MAPPINGS}
+        )
+
+    @staticmethod
+    def minute_of(timestamp) -> str:
+        """Minuto (AAAA-MM-GGTHH:MM:00) di un timestamp ISO 8601; l'ora corrente se assente"""
+        # Timestamp ISO 8601 (come quelli del simulatore): basta troncare ai minuti
+        if isinstance(timestamp, str) and len(timestamp) >= 16 and timestamp[10] == "T":
+            return timestamp[:16] + ":00"
+        return datetime.now().strftime("%Y-%m-%dT%H:%M:00")
+
+    def add(self, timestamp, service: Optional[str], status: Optional[str],
+            environment: Optional[str], latency: Optional[float], is_error: bool,
+            raw: Optional[Dict] = None, raw_id: Optional[str] = None):
+        """
+        Aggiunge un evento al rollup del suo minuto
+
+        Args:
+            timestamp: Timestamp ISO 8601 dell'evento (se assente si usa l'ora corrente)
+            service: Servizio
+            status: Status
+            environment: Ambiente
+            latency: Tempo di risposta in millisecondi (opzionale)
+            is_error: True se l'evento è un errore
+            raw: Evento grezzo, inviato se estratto dal campionamento (opzionale)
+            raw_id: _id stabile dell'evento grezzo (opzionale); se indicato anche il
+                    campionamento è deterministico, così rileggere lo stesso evento dopo
+                    un riavvio lo riscrive invece di duplicarlo o di estrarne un altro
+        """
+        minute = self.minute_of(timestamp)
+        key = (minute, service, status, environment)
+        rollup = self._rollups.get(key)
+        if rollup is None:
+            rollup = self._rollups[key] = Rollup(self.relative_accuracy)
+            if self._watermark is not None and minute < self._watermark:
+                self._late.add(key)
+        rollup.add(latency, is_error)
+        self.stats["events"] += 1
+        if self._watermark is None or minute > self._watermark:
+            self._watermark = minute
+        if raw is not None and self._sampled(raw_id):
+            # Senza raw_id l'_id si fissa all'estrazione: un reinvio dopo un errore sovrascrive
+            self._raw.append((raw, raw_id or uuid.uuid4().hex))
+
+    def _sampled(self, raw_id: Optional[str]) -> bool:
+        if not self.raw_sample_rate:
+            return False
+        if raw_id is None:
+            return random.random() < self.raw_sample_rate
+        digest = hashlib.sha1(raw_id.encode("utf-8")).hexdigest()
+        return int(digest[:8], 16) / 2 ** 32 < self.raw_sample_rate
+
+    def add_log(self, log: Dict, raw=None, raw_id: Optional[str] = None):
+        """
+        Aggiunge un log in forma di dizionario (simulatore o righe NDJSON dello shipper)
+
+        Args:
+            log: Log con timestamp, service, status, environment e response_time_ms
+            raw: Forma da inviare se il log viene campionato (default: il dizionario stesso)
+            raw_id: _id stabile dell'evento grezzo (vedi add)
+        """
+        status = log.get("status")
+        is_error = "error_code" in log or (isinstance(status, str) and status.upper() == "KO")
+        self.add(log.get("timestamp"), log.get("service"), status, log.get("environment"),
+                 log.get("response_time_ms"), is_error, log if raw is None else raw, raw_id)
+
+    def add_record(self, record):
+        """Aggiunge un LogRecord del simulatore (il dizionario viene creato solo se campionato)"""
+        is_error = record.error_message is not None or record.status.upper() == "KO"
+        self.add(record.timestamp, record.service, record.status, record.environment,
+                 record.response_time_ms, is_error, record)
+
+    def open_minutes(self) -> Set[str]:
+        """Minuti con eventi ancora in memoria (non inviati o inviati solo in parte)"""
+        return {key[0] for key in self._rollups}
+
+    def _index(self, minute: str) -> str:
+        return f"{self.TEMPLATE_NAME}-{minute[:7]}"
+
+    def _existing(self, keys: List[RollupKey]) -> Dict[RollupKey, Rollup]:
+        """Legge i documenti già presenti per le chiavi indicate"""
+        by_index: Dict[str, List[RollupKey]] = {}
+        for key in keys:
+            by_index.setdefault(self._index(key[0]), []).append(key)
+        documents = []
+        for index, index_keys in by_index.items():
+            try:
+                response = self.es.mget(index=index, ids=[rollup_id(key) for key in index_keys])
+            except NotFoundError:
+                continue
+            documents.extend(doc["_source"] for doc in response["docs"] if doc.get("found"))
+        return merge_rollup_documents(documents)
+
+    def _total(self, key: RollupKey) -> Rollup:
+        """Aggregato da scrivere: quello in memoria più l'eventuale documento preesistente"""
+        rollup = self._rollups[key]
+        base = self._base.get(key)
+        if base is None:
+            return rollup
+        total = Rollup(base.sketch.relative_accuracy)
+        total.merge(base)
+        total.merge(rollup)
+        return total
+
+    def _document(self, key: RollupKey, rollup: Rollup) -> Dict:
+        minute, service, status, environment = key
+        return {
+            "_index": self._index(minute),
+            "_id": rollup_id(key),
+            "_source": {
+                "@timestamp": minute,
+                "service": service,
+                "status": status,
+                "environment": environment,
+                "count": rollup.count,
+                "error_count": rollup.error_count,
+                "latency_sum": rollup.latency_sum,
+                "latency_min": rollup.latency_min,
+                "latency_max": rollup.latency_max,
+                "latency_p50": rollup.sketch.quantile(0.5),
+                "latency_p95": rollup.sketch.quantile(0.95),
+                "latency_p99": rollup.sketch.quantile(0.99),
+                "latency_sketch": rollup.sketch.to_dict()
+            }
+        }
+
+    def _raw_action(self, raw, raw_id: str) -> Dict:
+        if not isinstance(raw, (dict, str)):
+            raw = raw.to_dict()
+        index = self.raw_index
+        if index is None:
+            timestamp = raw.get("timestamp") if isinstance(raw, dict) else None
+            month = self.minute_of(timestamp)[:7]
+            index = f"services-log-{month}"
+        return {"_index": index, "_id": raw_id, "_source": raw}
+
+    def flush(self, force: bool = False) -> Dict:
+        """
+        Invia i rollup e gli eventi grezzi campionati
+
+        Args:
+            force: Se True invia anche i rollup dei minuti ancora aperti (che restano in
+                   memoria); altrimenti solo quelli dei minuti chiusi, cioè precedenti
+                   all'ultimo minuto visto negli eventi
+
+        I rollup dei minuti chiusi e gli eventi grezzi escono dalla memoria solo se
+        l'invio è riuscito o i falliti sono finiti nello spool; altrimenti restano e
+        vengono riscritti (con gli stessi _id) al flush successivo.
+
+        Returns:
+            Statistiche dell'invio (come bulk_with_retry)
+        """
+        keys = [key for key in self._rollups if force or key[0] < self._watermark]
+        missing = [key for key in keys
+                   if key not in self._base and (self.merge_existing or key in self._late)]
+        if missing:
+            existing = self._existing(missing)
+            for key in missing:
+                self._base[key] = existing.get(key)
+        actions = [self._document(key, self._total(key)) for key in keys]
+        actions.extend(self._raw_action(raw, raw_id) for raw, raw_id in self._raw)
+        if not actions:
+            return {"success": 0, "failed": 0, "retried": 0, "spooled": 0}
+        stats = bulk_with_retry(self.es, actions, chunk_size=self.chunk_size,
+                                max_retries=self.max_retries, spool=self.spool)
+        if stats["failed"] and self.spool is None:
+            return stats
+        for key in keys:
+            if key[0] < self._watermark:
+                del self._rollups[key]
+                self._base.pop(key, None)
+                self._late.discard(key)
+        METRICS.rollup_docs.inc(len(keys))
+        self.stats["rollups"] += len(keys)
+        self.stats["raw_sampled"] += len(self._raw)
+        self._raw = []
+        return stats
+
+
+def merge_rollup_documents(documents: List[Dict]) -> Dict[Tuple, Rollup]:
+    """
+    Fonde i documenti di rollup (anche parziali) per minuto/servizio/status/ambiente
+
+    Args:
+        documents: _source dei documenti letti da services-rollup-*
+
+    Returns:
+        Dizionario chiave -> Rollup combinato
+    """
+    merged: Dict[Tuple, Rollup] = {}
+    for doc in documents:
+        key = (doc["@timestamp"], doc["service"], doc["status"], doc["environment"])
+        rollup = Rollup.from_document(doc)
+        if key in merged:
+            merged[key].merge(rollup)
+        else:
+            merged[key] = rollup
+    return merged
@@ -1,18 +1,27 @@
 """
-Modulo per simulare e inviare log a Elasticsearch
+Modulo per simulare e inviare log a Elasticsearch, anche seguendo file NDJSON (modalità shipper)
 """
+import argparse
+import hashlib
 import json
+import os
 import random
 import time
 from datetime import datetime, timedelta
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
-from typing import Dict, List
+from typing import Dict, List, Optional
 from pprint import pprint
 
+from elk_bulk import BulkSpool, ChunkTuner, bulk_with_retry
+from elk_log_simulator import ElkLogSimulator
+from elk_metrics import MetricsExport, add_metrics_arguments, instrumented_node_class
+from elk_profiling import ProfileSession, add_profiling_arguments
+from elk_rollup import RollupAggregator
 
 
-def main():
+
+def run():
     """Funzione principale per demo"""
     # Configurazione connessione (modifica questi parametri)
     PROTOCOL = "http"
@@ -93,5 +102,457 @@ def main():
    
 
 
+class _TailedFile:
+    """
+    Stato di un file seguito dallo shipper: handle aperto, inode, offset letto e
+    generazione, che aumenta a ogni rotazione, troncamento o riscrittura del file
+    (l'inode da solo non basta: copy-and-truncate lo conserva e il sistema lo riusa).
+    """
+    
+    # Byte iniziali del file la cui impronta identifica il contenuto già letto
+    HEAD_BYTES = 256
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.handle = None
+        self.inode = None
+        self.offset = 0
+        self.buffer = b""
+        self.generation = 0
+        self.head = None
+        self.head_len = 0
+        # Offset della prima riga del blocco non ancora inviato (None se non ce ne sono)
+        self.unsent_offset: Optional[int] = None
+        # Modalità rollup: minuto -> offset della prima riga di quel minuto
+        self.minute_offsets: Dict[str, int] = {}
+    
+    def open(self, offset: int = 0) -> bool:
+        """Apre il file posizionandosi all'offset indicato; False se non esiste"""
+        try:
+            self.handle = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        self.inode = os.fstat(self.handle.fileno()).st_ino
+        self.handle.seek(offset)
+        self.offset = offset
+        self.buffer = b""
+        self.head = None
+        self.head_len = 0
+        self.unsent_offset = None
+        self.minute_offsets = {}
+        return True
+    
+    def fingerprint(self, length: int) -> str:
+        """Impronta SHA-1 dei primi length byte del file"""
+        return hashlib.sha1(os.pread(self.handle.fileno(), length, 0)).hexdigest()
+    
+    def update_head(self):
+        """Estende l'impronta iniziale ai byte già letti (fino a HEAD_BYTES)"""
+        length = min(self.HEAD_BYTES, self.offset)
+        if length > self.head_len:
+            self.head = self.fingerprint(length)
+            self.head_len = length
+    
+    def same_head(self) -> bool:
+        """False se l'inizio del file non è più quello già letto (file riscritto)"""
+        return not self.head_len or self.fingerprint(self.head_len) == self.head
+    
+    def restart(self):
+        """Riparte dall'inizio dello stesso file come nuova generazione"""
+        self.handle.seek(0)
+        self.offset = 0
+        self.buffer = b""
+        self.head = None
+        self.head_len = 0
+        self.minute_offsets = {}
+        self.generation += 1
+    
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class FileShipper:
+    """
+    Classe per seguire uno o più file NDJSON (anche attraverso la rotazione) e
+    inviarne le righe a Elasticsearch via bulk, con un checkpoint persistente
+    dell'offset in byte di ogni file.
+    """
+    
+    def __init__(self, es: Elasticsearch, files: List[str], index_name: str = None,
+                 checkpoint_file: str = ".shipper-checkpoint.json", batch_size: int = 1000,
+                 read_size: int = 1024 * 1024, flush_interval: float = 5.0,
+                 poll_interval: float = 1.0, use_inotify: bool = False, spool_dir: str = None,
+                 rollup: RollupAggregator = None, tuner: ChunkTuner = None):
+        """
+        Inizializza lo shipper
+        
+        Args:
+            es: Client Elasticsearch
+            files: File NDJSON da seguire
+            index_name: Indice di destinazione (default: services-log-AAAA-MM)
+            checkpoint_file: File JSON con gli offset già inviati
+            batch_size: Numero di righe per ogni invio bulk
+            read_size: Byte letti per volta da ogni file
+            flush_interval: Secondi massimi di attesa prima di inviare un blocco incompleto
+            poll_interval: Secondi tra due controlli dei file in modalità polling
+            use_inotify: Se True usa inotify (richiede inotify_simple) invece del polling
+            spool_dir: Directory dello spool su disco per i documenti non inviati (opzionale)
+            rollup: Se indicato, le righe vengono aggregate in rollup per minuto invece di
+                    essere inviate una per una (salvo gli eventi grezzi campionati); va
+                    creato con merge_existing=False, perché al riavvio lo shipper rilegge
+                    da sé le righe dei minuti aperti
+            tuner: Se indicato, regola la dimensione delle richieste bulk (entro batch_size
+                   righe per invio) verso la sua latenza obiettivo
+        """
+        self.es = es
+        self.index_name = index_name
+        self.checkpoint_file = checkpoint_file
+        self.batch_size = batch_size
+        self.read_size = read_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.spool = BulkSpool(spool_dir) if spool_dir else None
+        self.rollup = rollup
+        self.tuner = tuner
+        self.files = [_TailedFile(path) for path in files]
+        self.stats = {"lines": 0, "invalid": 0, "success": 0, "failed": 0, "spooled": 0}
+        self._batch: List[Dict] = []
+        # True se l'ultimo invio del blocco è fallito: si smette di leggere finché non riesce
+        self._unsent = False
+        self._last_flush = time.monotonic()
+        self._inotify = self._setup_inotify() if use_inotify else None
+        self._restore_checkpoint()
+    
+    def _setup_inotify(self):
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            print("⚠️  inotify_simple non installato: uso il polling")
+            return None
+        inotify = INotify()
+        mask = flags.MODIFY | flags.CREATE | flags.MOVED_TO | flags.CLOSE_WRITE
+        for directory in {os.path.dirname(os.path.abspath(f.path)) for f in self.files}:
+            inotify.add_watch(directory, mask)
+        return inotify
+    
+    def _restore_checkpoint(self):
+        """Riprende dagli offset salvati se il file è ancora lo stesso (stesso inode)"""
+        checkpoint = {}
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        for tailed in self.files:
+            saved = checkpoint.get(tailed.path)
+            if saved:
+                tailed.generation = saved.get("generation", 0)
+            if not tailed.open() or not saved:
+                continue
+            if saved["inode"] != tailed.inode:
+                # Ruotato mentre lo shipper era fermo: il nuovo file si legge da capo
+                tailed.generation += 1
+                continue
+            size = os.fstat(tailed.handle.fileno()).st_size
+            head_len = saved.get("head_len", 0)
+            if saved["offset"] > size or (head_len and tailed.fingerprint(head_len) != saved["head"]):
+                # Troncato o riscritto mentre lo shipper era fermo: si riparte da capo
+                print(f"⚠️  {tailed.path} è stato troncato o riscritto: rilettura dall'inizio")
+                tailed.restart()
+                continue
+            tailed.handle.seek(saved["offset"])
+            tailed.offset = saved["offset"]
+            tailed.head = saved.get("head")
+            tailed.head_len = head_len
+    
+    def _checkpoint_offset(self, tailed: _TailedFile) -> int:
+        """
+        Offset da salvare: la prima riga del blocco non ancora inviato e, in modalità
+        rollup, dei minuti ancora in memoria, così dopo un riavvio si rileggono
+        """
+        if tailed.unsent_offset is not None:
+            return tailed.unsent_offset
+        if self.rollup is None:
+            return tailed.offset
+        open_minutes = self.rollup.open_minutes()
+        tailed.minute_offsets = {minute: offset for minute, offset in tailed.minute_offsets.items()
+                                 if minute in open_minutes}
+        return min(tailed.minute_offsets.values(), default=tailed.offset)
+    
+    def _save_checkpoint(self):
+        checkpoint = {
+            tailed.path: {"inode": tailed.inode, "offset": self._checkpoint_offset(tailed),
+                          "generation": tailed.generation,
+                          "head": tailed.head, "head_len": tailed.head_len}
+            for tailed in self.files if tailed.inode is not None
+        }
+        tmp = self.checkpoint_file + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_file)
+    
+    def _read_available(self, tailed: _TailedFile) -> bool:
+        """
+        Legge le righe complete disponibili; True se ha letto qualcosa. Non legge
+        finché c'è un blocco il cui invio è fallito (la memoria resta limitata)
+        """
+        read_any = False
+        while not self._unsent:
+            chunk = tailed.handle.read(self.read_size)
+            if not chunk:
+                break
+            read_any = True
+            lines = (tailed.buffer + chunk).split(b"\n")
+            # L'ultima parte è una riga incompleta (o vuota): resta nel buffer
+            tailed.buffer = lines.pop()
+            for line in lines:
+                line_offset = tailed.offset
+                tailed.offset += len(line) + 1
+                self._add_line(tailed, line, line_offset)
+        return read_any
+    
+    @staticmethod
+    def _line_id(tailed: _TailedFile, line_offset: int) -> str:
+        # _id derivato da file, generazione e posizione: un reinvio dopo un crash
+        # sovrascrive, non duplica, e il contenuto di un file ruotato non sovrascrive il vecchio
+        return f"{tailed.inode}-{tailed.generation}-{line_offset}"
+    
+    def _add_line(self, tailed: _TailedFile, line: bytes, line_offset: int):
+        line = line.strip()
+        if not line:
+            return
+        self.stats["lines"] += 1
+        try:
+            text = line.decode("utf-8")
+            document = json.loads(text)
+        except ValueError:
+            self.stats["invalid"] += 1
+            return
+        if self.rollup is not None:
+            if not isinstance(document, dict):
+                self.stats["invalid"] += 1
+                return
+            tailed.minute_offsets.setdefault(self.rollup.minute_of(document.get("timestamp")), line_offset)
+            self.rollup.add_log(document, raw=text, raw_id=self._line_id(tailed, line_offset))
+            return
+        self._batch.append({
+            "_index": self.index_name or ElkLogSimulator.get_index_name(),
+            "_id": self._line_id(tailed, line_offset),
+            "_source": text
+        })
+        if tailed.unsent_offset is None:
+            tailed.unsent_offset = line_offset
+        if len(self._batch) >= self.batch_size and not self._unsent:
+            self.flush()
+    
+    def _check_rotation(self, tailed: _TailedFile):
+        """Gestisce rotazione (nuovo inode), troncamento e riscrittura del file"""
+        if self._unsent:
+            # Le righe del blocco in sospeso appartengono al file attuale: prima vanno inviate
+            return
+        try:
+            stat = os.stat(tailed.path)
+        except FileNotFoundError:
+            return
+        if tailed.handle is None:
+            tailed.open()
+        elif stat.st_ino != tailed.inode:
+            # Completa la lettura del vecchio file prima di passare al nuovo
+            self._read_available(tailed)
+            if tailed.buffer:
+                self._add_line(tailed, tailed.buffer, tailed.offset)
+            tailed.close()
+            tailed.generation += 1
+            tailed.open()
+        elif stat.st_size < tailed.offset or not tailed.same_head():
+            tailed.restart()
+    
+    def flush(self, final: bool = False):
+        """
+        Invia il blocco corrente e salva il checkpoint
+        
+        Il checkpoint di un file avanza oltre le righe del blocco solo se tutte sono
+        state indicizzate o messe nello spool; altrimenti blocco e offset restano
+        e l'invio viene ritentato al flush successivo (con lo stesso _id per riga).
+        
+        Args:
+            final: Se True (all'arresto) invia anche i rollup dei minuti ancora aperti
+        """
+        if self._batch:
+            stats = bulk_with_retry(self.es, self._batch, chunk_size=self.batch_size, spool=self.spool,
+                                    tuner=self.tuner)
+            # Con lo spool anche i rifiutati in modo definitivo restano su disco (rejected.ndjson)
+            if stats["failed"] == 0 or self.spool is not None:
+                for key in ("success", "failed", "spooled"):
+                    self.stats[key] += stats[key]
+                self._batch = []
+                self._unsent = False
+                for tailed in self.files:
+                    tailed.unsent_offset = None
+            else:
+                self._unsent = True
+                print(f"✗ {stats['failed']} righe non inviate: il blocco di {len(self._batch)} righe "
+                      f"verrà ritentato e il checkpoint resta fermo")
+        if self.rollup is not None:
+            # Solo i minuti chiusi (all'arresto anche gli aperti, con lo stesso _id): il
+            # checkpoint resta alla prima riga dei minuti aperti, che al riavvio si rileggono.
+            # Se l'invio fallisce i minuti chiusi restano in memoria e quindi nel checkpoint
+            stats = self.rollup.flush(force=final)
+            if stats["failed"] == 0 or self.rollup.spool is not None:
+                for key in ("success", "failed", "spooled"):
+                    self.stats[key] += stats[key]
+            else:
+                print(f"✗ {stats['failed']} rollup non inviati: verranno ritentati al prossimo flush")
+                if final:
+                    self.stats["failed"] += stats["failed"]
+        self._save_checkpoint()
+        self._last_flush = time.monotonic()
+    
+    def drain_spool(self) -> Dict:
+        """
+        Reinvia i documenti rimasti nello spool da esecuzioni precedenti
+        
+        Returns:
+            Dizionario con statistiche sull'invio
+        """
+        totals = {"success": 0, "failed": 0, "retried": 0, "spooled": 0}
+        if self.spool is None:
+            return totals
+        pending = self.spool.pending()
+        if not pending:
+            return totals
+        print(f"📦 Reinvio di {pending} documenti dallo spool {self.spool.directory}")
+        for batch in self.spool.drain(batch_size=self.batch_size):
+            stats = bulk_with_retry(self.es, batch, chunk_size=self.batch_size, spool=self.spool,
+                                    tuner=self.tuner)
+            for key in totals:
+                totals[key] += stats[key]
+        for key in ("success", "failed", "spooled"):
+            self.stats[key] += totals[key]
+        print(f"✓ Spool svuotato: {totals['success']} successi, {totals['failed']} fallimenti, "
+              f"{totals['spooled']} ancora in spool")
+        return totals
+    
+    def _wait(self):
+        if self._inotify is not None:
+            self._inotify.read(timeout=int(self.poll_interval * 1000))
+        else:
+            time.sleep(self.poll_interval)
+    
+    def ship_once(self) -> bool:
+        """Legge una volta tutti i file; True se ha trovato nuove righe"""
+        read_any = False
+        for tailed in self.files:
+            self._check_rotation(tailed)
+            if tailed.handle is not None:
+                read_any = self._read_available(tailed) or read_any
+                tailed.update_head()
+        return read_any
+    
+    def run(self, follow: bool = True):
+        """
+        Avvia lo shipper
+        
+        Args:
+            follow: Se True continua a seguire i file finché non viene interrotto (Ctrl-C),
+                    altrimenti invia il contenuto attuale ed esce
+        """
+        print(f"🚚 Shipper avviato su {len(self.files)} file")
+        try:
+            # Prima i documenti rimasti in sospeso dalle esecuzioni precedenti
+            self.drain_spool()
+            while True:
+                read_any = self.ship_once()
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    self.flush()
+                if not follow:
+                    break
+                if not read_any:
+                    self._wait()
+        except KeyboardInterrupt:
+            print("\n⏹  Interruzione richiesta, invio dei documenti in sospeso...")
+        finally:
+            self.flush(final=True)
+            # Il blocco non inviato verrà riletto dal checkpoint alla prossima esecuzione
+            self.stats["failed"] += len(self._batch)
+            for tailed in self.files:
+                tailed.close()
+            if self.tuner is not None:
+                self.tuner.save()
+                print(f"📐 Blocchi bulk per {self.tuner.pattern}: {self.tuner.summary()}")
+        print(f"✓ Shipper terminato: {self.stats['success']} inviati, {self.stats['failed']} falliti, "
+              f"{self.stats['spooled']} in spool, {self.stats['invalid']} righe non valide")
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Invia un log di prova a Elasticsearch o, con --ship, segue file NDJSON",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+        Esempi d'uso:
+        python elk_send_json.py
+        python elk_send_json.py --ship /var/log/app/*.ndjson --index services-log-2024-06
+        python elk_send_json.py --ship json/service.json --once --host localhost
+        python elk_send_json.py --ship /var/log/app/*.ndjson --rollup --raw-sample-rate 0.01
+        python elk_send_json.py --ship /var/log/app/*.ndjson --batch-size 20000 --auto-tune
+        """
+    )
+    parser.add_argument('--ship', nargs='+', metavar='FILE', help='File NDJSON da seguire e inviare')
+    parser.add_argument('--index', help='Indice di destinazione (default: services-log-AAAA-MM)')
+    parser.add_argument('--checkpoint', default='.shipper-checkpoint.json',
+                        help='File di checkpoint degli offset (default: .shipper-checkpoint.json)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Righe per invio bulk (default: 1000)')
+    parser.add_argument('--flush-interval', type=float, default=5.0,
+                        help='Secondi massimi prima di inviare un blocco incompleto (default: 5)')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help='Secondi tra due controlli dei file (default: 1)')
+    parser.add_argument('--inotify', action='store_true', help='Usa inotify invece del polling')
+    parser.add_argument('--once', action='store_true', help='Invia il contenuto attuale ed esce')
+    parser.add_argument('--spool-dir', help='Directory dello spool su disco per i documenti non inviati')
+    parser.add_argument('--rollup', action='store_true',
+                        help='Invia rollup per minuto (services-rollup-AAAA-MM) invece delle singole righe')
+    parser.add_argument('--raw-sample-rate', type=float, default=0.0,
+                        help='Con --rollup, frazione di righe da inviare comunque (default: 0)')
+    parser.add_argument('--auto-tune', action='store_true',
+                        help='Regola da sola la dimensione delle richieste bulk verso --target-latency')
+    parser.add_argument('--target-latency', type=float, default=1.0,
+                        help='Con --auto-tune, latenza obiettivo in secondi per richiesta (default: 1.0)')
+    parser.add_argument('--tuning-file', default='.bulk_tuning.json',
+                        help='Con --auto-tune, file delle dimensioni apprese per pattern di indice '
+                             '(default: .bulk_tuning.json)')
+    parser.add_argument('--host', default='localhost', help='Host di Elasticsearch (default: localhost)')
+    parser.add_argument('--port', type=int, default=9200, help='Porta di Elasticsearch (default: 9200)')
+    parser.add_argument('--api-key', help='API Key per autenticazione')
+    add_metrics_arguments(parser)
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    
+    with MetricsExport(args), ProfileSession(args) as profiler, profiler.phase("run"):
+        if not args.ship:
+            run()
+            return
+        auth = {"api_key": args.api_key} if args.api_key else {}
+        elastic = Elasticsearch([f"http://{args.host}:{args.port}"],
+                                node_class=instrumented_node_class(), **auth)
+        shipper = FileShipper(
+            elastic, args.ship, index_name=args.index, checkpoint_file=args.checkpoint,
+            batch_size=args.batch_size, flush_interval=args.flush_interval,
+            poll_interval=args.poll_interval, use_inotify=args.inotify, spool_dir=args.spool_dir
+        )
+        if args.auto_tune:
+            shipper.tuner = ChunkTuner.for_index(args.index or "services-log-*",
+                                                 target_latency=args.target_latency,
+                                                 state_file=args.tuning_file)
+        if args.rollup:
+            shipper.rollup = RollupAggregator(elastic, raw_sample_rate=args.raw_sample_rate,
+                                              raw_index=args.index, chunk_size=args.batch_size,
+                                              spool=shipper.spool, merge_existing=False)
+            shipper.rollup.ensure_template()
+        shipper.run(follow=not args.once)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,319 @@
+"""
+Modulo con un server HTTP locale che simula le API Elasticsearch usate dagli script
+(ping, index, get, _mget, _bulk, _search, point-in-time), per benchmark e prove senza un cluster reale.
+"""
+import fnmatch
+import json
+import random
+import threading
+import time
+import uuid
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Gestore delle richieste HTTP del server stand-in"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Silenzia il log di accesso di http.server
+        pass
+
+    def _send_json(self, status: int, payload: Optional[Dict] = None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.server.stats["bytes_received"] += len(body)
+        return body
+
+    def _path_parts(self) -> List[str]:
+        path = self.path.split("?", 1)[0]
+        return [unquote(part) for part in path.split("/") if part]
+
+    def do_HEAD(self):
+        self._send_json(200)
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if not parts:
+            self._send_json(200, {
+                "name": "standin",
+                "cluster_name": "standin",
+                "version": {"number": "9.0.0"},
+                "tagline": "You Know, for Search"
+            })
+        elif parts[-1] == "_search":
+            self._handle_search(parts, self._read_body())
+        elif len(parts) == 3 and parts[1] == "_doc":
+            document = self.server.indices.get(parts[0], {}).get(parts[2])
+            payload = {"_index": parts[0], "_id": parts[2], "found": document is not None}
+            if document is not None:
+                payload["_source"] = document
+            self._send_json(200 if document is not None else 404, payload)
+        else:
+            self._send_json(404, {"error": "not found", "status": 404})
+
+    def do_POST(self):
+        parts = self._path_parts()
+        body = self._read_body()
+        if parts and parts[-1] == "_bulk":
+            self._handle_bulk(parts, body)
+        elif parts and parts[-1] == "_search":
+            self._handle_search(parts, body)
+        elif len(parts) == 2 and parts[1] == "_mget":
+            documents = self.server.indices.get(parts[0], {})
+            docs = []
+            for doc_id in json.loads(body)["ids"]:
+                doc = {"_index": parts[0], "_id": doc_id, "found": doc_id in documents}
+                if doc_id in documents:
+                    doc["_source"] = documents[doc_id]
+                docs.append(doc)
+            self._send_json(200, {"docs": docs})
+        elif len(parts) == 2 and parts[1] == "_pit":
+            pit_id = self.server.open_pit(parts[0])
+            self._send_json(200, {"id": pit_id})
+        elif len(parts) >= 2 and parts[1] == "_doc":
+            self._handle_index(parts, body)
+        else:
+            self._send_json(404, {"error": "not found", "status": 404})
+
+    def do_PUT(self):
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == "_index_template":
+            self.server.templates[parts[1]] = json.loads(self._read_body() or b"{}")
+            self._send_json(200, {"acknowledged": True})
+            return
+        self.do_POST()
+
+    def do_DELETE(self):
+        parts = self._path_parts()
+        body = self._read_body()
+        if parts == ["_pit"]:
+            closed = self.server.pits.pop(json.loads(body or b"{}").get("id"), None) is not None
+            self._send_json(200, {"succeeded": closed, "num_freed": int(closed)})
+        else:
+            self._send_json(404, {"error": "not found", "status": 404})
+
+    def _handle_index(self, parts: List[str], body: bytes):
+        index = parts[0]
+        doc_id = parts[2] if len(parts) > 2 else uuid.uuid4().hex
+        self.server.store(index, doc_id, json.loads(body or b"{}"))
+        self.server.stats["documents"] += 1
+        self.server.stats["requests"] += 1
+        self._send_json(201, {"_index": index, "_id": doc_id, "result": "created"})
+
+    def _handle_bulk(self, parts: List[str], body: bytes):
+        default_index = parts[0] if len(parts) > 1 else None
+        lines = body.splitlines()
+        items = []
+        errors = False
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            i += 1
+            if not line.strip():
+                continue
+            action_line = json.loads(line)
+            op_type, meta = next(iter(action_line.items()))
+            index = meta.get("_index", default_index)
+            doc_id = meta.get("_id") or uuid.uuid4().hex
+            source = None
+            if op_type != "delete":
+                source = lines[i]
+                i += 1
+            status, result = self.server.apply(op_type, index, doc_id, source)
+            item = {"_index": index, "_id": doc_id, "status": status}
+            if status >= 300:
+                errors = True
+                item["error"] = {"type": result, "reason": result}
+            else:
+                item["result"] = result
+            items.append({op_type: item})
+        self.server.stats["documents"] += len(items)
+        self.server.stats["requests"] += 1
+        if self.server.bulk_latency_per_mb:
+            time.sleep(len(body) / (1024 * 1024) * self.server.bulk_latency_per_mb)
+        self._send_json(200, {"took": 0, "errors": errors, "items": items})
+
+    def _handle_search(self, parts: List[str], body: bytes = b""):
+        self.server.stats["searches"] += 1
+        request = json.loads(body) if body else {}
+        if "pit" in request:
+            self._send_json(200, self.server.search_pit(request))
+        elif "terms" in request.get("query", {}) and len(parts) == 2:
+            self._send_json(200, self.server.search_terms(parts[0], request))
+        elif self.server.search_response is not None:
+            self._send_json(200, self.server.search_response)
+        else:
+            self._send_json(200, {
+                "took": 0,
+                "timed_out": False,
+                "hits": {"total": {"value": 0, "relation": "eq"}, "hits": []}
+            })
+
+
+class EsStandInServer(ThreadingHTTPServer):
+    """
+    Server HTTP locale che risponde come un nodo Elasticsearch minimale.
+
+    Utilizzabile come context manager: all'ingresso avvia il server in un thread
+    in background, all'uscita lo arresta.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, store_documents: bool = False,
+                 reject_rate: float = 0.0, bulk_latency_per_mb: float = 0.0):
+        """
+        Inizializza il server stand-in
+
+        Args:
+            host: Indirizzo su cui mettersi in ascolto
+            port: Porta di ascolto (0 = porta libera scelta dal sistema)
+            store_documents: Se True conserva in memoria i documenti ricevuti
+            reject_rate: Frazione di azioni bulk rifiutate con status 429 (simula un cluster sotto carico)
+            bulk_latency_per_mb: Secondi di attesa per ogni MB di corpo _bulk (simula la latenza
+                                 di indicizzazione, che cresce con la dimensione della richiesta)
+        """
+        super().__init__((host, port), _StandInHandler)
+        self.store_documents = store_documents
+        self.reject_rate = reject_rate
+        self.bulk_latency_per_mb = bulk_latency_per_mb
+        self.indices: Dict[str, Dict[str, Dict]] = {}
+        self.search_response: Optional[Dict] = None
+        self.pits: Dict[str, str] = {}
+        self.templates: Dict[str, Dict] = {}
+        self.stats = {"requests": 0, "documents": 0, "searches": 0, "bytes_received": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def store(self, index: str, doc_id: str, document: Dict):
+        """Salva un documento nell'archivio in memoria (se abilitato)"""
+        if not self.store_documents:
+            return
+        with self._lock:
+            self.indices.setdefault(index, {})[doc_id] = document
+
+    def apply(self, op_type: str, index: str, doc_id: str, source: Optional[bytes]) -> Tuple[int, str]:
+        """
+        Applica una singola azione bulk e restituisce (status HTTP, risultato)
+        """
+        if self.reject_rate and random.random() < self.reject_rate:
+            return 429, "es_rejected_execution_exception"
+        if op_type == "delete":
+            if self.store_documents:
+                with self._lock:
+                    found = self.indices.get(index, {}).pop(doc_id, None) is not None
+                return (200, "deleted") if found else (404, "not_found")
+            return 200, "deleted"
+        if self.store_documents:
+            document = json.loads(source)
+            if op_type == "update":
+                document = document.get("doc", document)
+            self.store(index, doc_id, document)
+        return 201, "created"
+
+    def open_pit(self, index: str) -> str:
+        """Apre un point-in-time sugli indici che corrispondono al pattern indicato"""
+        pit_id = uuid.uuid4().hex
+        self.pits[pit_id] = index
+        return pit_id
+
+    def search_pit(self, request: Dict) -> Dict:
+        """
+        Esegue una ricerca su un point-in-time con ordinamento _shard_doc,
+        search_after, slice e filtro _source (query ignorata: match_all)
+        """
+        pattern = self.pits[request["pit"]["id"]]
+        with self._lock:
+            documents = [
+                (index, doc_id, document)
+                for index in sorted(self.indices)
+                if any(fnmatch.fnmatch(index, p) for p in pattern.split(","))
+                for doc_id, document in sorted(self.indices[index].items())
+            ]
+        slice_spec = request.get("slice")
+        after = request.get("search_after", [-1])[0]
+        size = request.get("size", 10)
+        fields = request.get("_source")
+        hits = []
+        for position, (index, doc_id, document) in enumerate(documents):
+            if position <= after:
+                continue
+            if slice_spec and position % slice_spec["max"] != slice_spec["id"]:
+                continue
+            source = document
+            if isinstance(fields, list):
+                source = {k: v for k, v in document.items() if k in fields}
+            hits.append({"_index": index, "_id": doc_id, "_source": source, "sort": [position]})
+            if len(hits) >= size:
+                break
+        return {
+            "pit_id": request["pit"]["id"],
+            "took": 0,
+            "timed_out": False,
+            "hits": {"total": {"value": len(documents), "relation": "eq"}, "hits": hits}
+        }
+
+    def search_terms(self, index: str, request: Dict) -> Dict:
+        """Esegue una query "terms" su un campo (valore singolo o lista) dell'indice"""
+        field, values = next(iter(request["query"]["terms"].items()))
+        values = set(values)
+        hits = []
+        with self._lock:
+            for doc_id, document in self.indices.get(index, {}).items():
+                value = document.get(field)
+                candidates = value if isinstance(value, list) else [value]
+                if values.intersection(candidates):
+                    hits.append({"_index": index, "_id": doc_id, "_source": document})
+        size = request.get("size", 10)
+        return {
+            "took": 0,
+            "timed_out": False,
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits[:size]}
+        }
+
+    def start(self) -> "EsStandInServer":
+        """Avvia il server in un thread in background"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Arresta il server e libera la porta"""
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "EsStandInServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modulo per caricare il catalogo film (CSV) in movie_idx in modo idempotente:
+_id stabile derivato da movie_imdb_link, hash del contenuto di ogni riga e
+manifest locale, così da inviare solo righe nuove o modificate e cancellare
+quelle rimosse.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from elasticsearch import Elasticsearch
+
+from csv_to_json import read_csv_to_dict
+from elk_bulk import bulk_with_retry
+from elk_metrics import MetricsExport, add_metrics_arguments, instrumented_node_class
+from elk_profiling import NULL_PROFILER, PhaseProfiler, ProfileSession, add_profiling_arguments
+
+
+IMDB_ID_PATTERN = re.compile(r"/title/(tt\d+)")
+HASH_FIELD = "content_hash"
+UPDATED_FIELD = "updated_at"
+
+
+def movie_id(row: Dict) -> str:
+    """
+    Deriva un _id stabile dal link IMDb del film
+
+    Args:
+        row: Riga del CSV
+
+    Returns:
+        L'identificativo IMDb (es. tt0232500) oppure, se assente, l'hash SHA-1 del link
+    """
+    link = row.get("movie_imdb_link", "")
+    match = IMDB_ID_PATTERN.search(link)
+    if match:
+        return match.group(1)
+    return hashlib.sha1(link.encode("utf-8")).hexdigest()
+
+
+def content_hash(row: Dict) -> str:
+    """Calcola l'hash SHA-256 del contenuto di una riga (indipendente dall'ordine dei campi)"""
+    payload = json.dumps(row, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest_file: str) -> Dict[str, str]:
+    """Legge il manifest _id -> hash dell'ultimo caricamento riuscito"""
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, str], manifest_file: str):
+    """Salva il manifest in modo atomico"""
+    tmp = manifest_file + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp, manifest_file)
+
+
+def diff_catalog(rows: List[Dict], manifest: Dict[str, str]) -> Tuple[Dict[str, Dict], List[str], Dict[str, str]]:
+    """
+    Confronta le righe del CSV con il manifest
+
+    Args:
+        rows: Righe del CSV
+        manifest: Manifest _id -> hash del caricamento precedente
+
+    Returns:
+        Tupla (righe nuove o modificate per _id, _id rimossi, nuovo manifest)
+    """
+    current = {}
+    rows_by_id = {}
+    for row in rows:
+        # A parità di link l'ultima riga del CSV prevale
+        doc_id = movie_id(row)
+        rows_by_id[doc_id] = row
+        current[doc_id] = content_hash(row)
+    changed = {doc_id: rows_by_id[doc_id] for doc_id, digest in current.items()
+               if manifest.get(doc_id) != digest}
+    removed = [doc_id for doc_id in manifest if doc_id not in current]
+    return changed, removed, current
+
+
+class MovieCatalogLoader:
+    """Classe per caricare il catalogo film in Elasticsearch inviando solo le differenze"""
+
+    def __init__(self, es: Elasticsearch, index_name: str = "movie_idx",
+                 manifest_file: str = ".movie_manifest.json", chunk_size: int = 500,
+                 max_delete_fraction: float = 0.25):
+        """
+        Args:
+            es: Client Elasticsearch
+            index_name: Indice dei film (default: movie_idx)
+            manifest_file: File del manifest locale degli hash
+            chunk_size: Documenti per ogni richiesta bulk
+            max_delete_fraction: Quota massima del manifest cancellabile in un caricamento
+                                 senza allow_mass_delete (default: 0.25)
+        """
+        self.es = es
+        self.index_name = index_name
+        self.manifest_file = manifest_file
+        self.chunk_size = chunk_size
+        self.max_delete_fraction = max_delete_fraction
+
+    def load(self, csv_file: str, dry_run: bool = False, update_summary: bool = False,
+             profiler: PhaseProfiler = NULL_PROFILER, allow_mass_delete: bool = False) -> Dict[str, int]:
+        """
+        Carica il CSV inviando solo righe nuove/modificate (index) e rimosse (delete)
+
+        Args:
+            csv_file: CSV del catalogo
+            dry_run: Se True calcola le differenze senza inviarle
+            update_summary: Se True aggiorna anche l'indice riepilogativo actor_films
+            profiler: Profiler delle fasi read/diff/send (default: disattivato)
+            allow_mass_delete: Se True consente di cancellare più di max_delete_fraction
+                               dei film del manifest
+
+        Returns:
+            Dizionario con il numero di righe invariate, indicizzate e cancellate
+
+        Raises:
+            OSError: Se il CSV non si può leggere (nessuna cancellazione inviata)
+            ValueError: Se il CSV è vuoto o le cancellazioni superano la soglia
+        """
+        with profiler.phase("read"):
+            rows = read_csv_to_dict(csv_file, raise_errors=True)
+        if not rows:
+            # Un CSV vuoto cancellerebbe l'intero catalogo
+            raise ValueError(f"Nessuna riga nel catalogo {csv_file}: caricamento annullato")
+        with profiler.phase("diff"):
+            manifest = load_manifest(self.manifest_file)
+            changed, removed, current = diff_catalog(rows, manifest)
+        stats = {"unchanged": len(current) - len(changed), "indexed": len(changed),
+                 "deleted": len(removed)}
+        print(f"Catalogo: {stats['unchanged']} invariati, {len(changed)} nuovi/modificati, "
+              f"{len(removed)} rimossi")
+        if (not dry_run and not allow_mass_delete
+                and len(removed) > self.max_delete_fraction * len(manifest)):
+            raise ValueError(
+                f"{len(removed)} film da cancellare su {len(manifest)} (oltre il "
+                f"{self.max_delete_fraction:.0%}): caricamento annullato, usa --allow-mass-delete "
+                f"se è voluto"
+            )
+        if dry_run or not (changed or removed):
+            return stats
+
+        updated_at = datetime.now().isoformat()
+        actions = [
+            {
+                "_index": self.index_name,
+                "_id": doc_id,
+                "_source": dict(row, **{HASH_FIELD: current[doc_id], UPDATED_FIELD: updated_at})
+            }
+            for doc_id, row in changed.items()
+        ]
+        actions.extend(
+            {"_op_type": "delete", "_index": self.index_name, "_id": doc_id}
+            for doc_id in removed
+        )
+        with profiler.phase("send"):
+            result = bulk_with_retry(self.es, actions, chunk_size=self.chunk_size)
+
+        if result["failed"] or result["spooled"]:
+            # Il manifest resta quello precedente: il prossimo caricamento reinvia le differenze
+            print(f"✗ {result['failed'] + result['spooled']} azioni non riuscite, manifest non aggiornato")
+        else:
+            save_manifest(current, self.manifest_file)
+            print(f"✓ Catalogo caricato in {self.index_name}, manifest aggiornato")
+
+        if update_summary:
+            from elasticsearch_movie_query import ActorFilmsSummary
+            with profiler.phase("summary"):
+                summary = ActorFilmsSummary(self.es, movie_index=self.index_name,
+                                            updated_field=UPDATED_FIELD)
+                if removed:
+                    result = summary.remove_movies(removed)
+                    if result["failed"] or result["spooled"]:
+                        print(f"✗ {result['failed'] + result['spooled']} attori non aggiornati "
+                              f"dopo la rimozione dei film")
+                summary.refresh()
+        return stats
+
+
+def main():
+    """Funzione principale per l'esecuzione da riga di comando."""
+    parser = argparse.ArgumentParser(
+        description='Carica il catalogo film in Elasticsearch inviando solo le differenze',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+        Esempi d'uso:
+        python movie_catalog_loader.py datasets/Cleaned_DataSet.csv
+        python movie_catalog_loader.py datasets/Cleaned_DataSet.csv --dry-run
+        python movie_catalog_loader.py datasets/Cleaned_DataSet.csv --update-summary
+        python movie_catalog_loader.py datasets/Cleaned_DataSet.csv --allow-mass-delete
+        """
+    )
+    parser.add_argument('csv_file', help='CSV del catalogo film')
+    parser.add_argument('--index', default='movie_idx', help='Indice dei film (default: movie_idx)')
+    parser.add_argument('--manifest', default='.movie_manifest.json',
+                        help='Manifest locale degli hash (default: .movie_manifest.json)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostra le differenze senza inviarle')
+    parser.add_argument('--update-summary', action='store_true',
+                        help='Aggiorna anche l\'indice riepilogativo actor_films')
+    parser.add_argument('--allow-mass-delete', action='store_true',
+                        help='Consente di cancellare più del 25%% dei film già caricati')
+    parser.add_argument('--host', default='localhost', help='Host di Elasticsearch (default: localhost)')
+    parser.add_argument('--port', type=int, default=9200, help='Porta di Elasticsearch (default: 9200)')
+    parser.add_argument('--api-key', help='API Key per autenticazione')
+    add_metrics_arguments(parser)
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+
+    auth = {"api_key": args.api_key} if args.api_key else {}
+    elastic = Elasticsearch([f"http://{args.host}:{args.port}"],
+                            node_class=instrumented_node_class(), **auth)
+    loader = MovieCatalogLoader(elastic, index_name=args.index, manifest_file=args.manifest)
+    with MetricsExport(args), ProfileSession(args) as profiler:
+        try:
+            loader.load(args.csv_file, dry_run=args.dry_run, update_summary=args.update_summary,
+                        profiler=profiler, allow_mass_delete=args.allow_mass_delete)
+        except (OSError, ValueError) as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
+import argparse
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
 from pprint import pprint
 
-def main():
+from elk_profiling import ProfileSession, add_profiling_arguments
+
+def run():
     print("Test ELK !")
     
     PROTOCOL = "http"
@@ -63,5 +66,13 @@ def main():
     pprint(response)
     
 
+def main():
+    parser = argparse.ArgumentParser(description="Indicizza un documento di prova su Elasticsearch")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    with ProfileSession(args) as profiler, profiler.phase("run"):
+        run()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,36 @@
+import argparse
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
 from pprint import pprint
 
-def main():
+from elk_profiling import ProfileSession, add_profiling_arguments
+
+def actor_query(actor: str) -> dict:
+    """Query dei film in cui compare l'attore (in uno dei tre ruoli), con aggregazione per paese"""
+    return {
+        "size": 1,
+        "query": {
+            "bool": {
+                "should": [
+                    { "match": { "actor_1_name": actor }},
+                    { "match": { "actor_2_name": actor }},
+                    { "match": { "actor_3_name": actor }}
+                ],
+                "minimum_should_match": 1
+            }
+        },
+        "aggs": {
+            "by_country": {
+                "terms": {
+                    "field": "country",
+                    "size": 50
+                }
+            }
+        }
+    }
+
+
+def run():
     print("Test ELK !")
     
     PROTOCOL = "http"
@@ -45,27 +73,7 @@ def main():
     log = {  
     }
 
-    query = {
-        "size": 1,
-        "query": {
-            "bool": {
-                "should": [
-                    { "match": { "actor_1_name": "Vin Diesel" }},
-                    { "match": { "actor_2_name": "Vin Diesel" }},
-                    { "match": { "actor_3_name": "Vin Diesel" }}
-                ],
-                "minimum_should_match": 1
-            }
-        },
-        "aggs": {
-            "by_country": {
-                "terms": {
-                    "field": "country",
-                    "size": 50
-                }
-            }
-        }
-    }
+    query = actor_query("Vin Diesel")
      
      
     # index_name = "test-index"
@@ -85,5 +93,13 @@ def main():
     pprint(response)
     
 
+def main():
+    parser = argparse.ArgumentParser(description="Cerca i film di un attore sull'indice movie_idx")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    with ProfileSession(args) as profiler, profiler.phase("run"):
+        run()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,16 @@
+import argparse
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
 from pprint import pprint
 
-def main():
+from elk_profiling import ProfileSession, add_profiling_arguments
+
+ESQL_QUERY = """
+    FROM sample_data
+    | STATS median_duration = MEDIAN(event_duration) by client_ip
+    """
+
+def run():
     print("Test ELK !")
     
     PROTOCOL = "http"
@@ -45,10 +53,7 @@ def main():
     log = {  
     }
 
-    query =  """
-    FROM sample_data
-    | STATS median_duration = MEDIAN(event_duration) by client_ip
-    """
+    query = ESQL_QUERY
     
     
     response = None
@@ -64,5 +69,13 @@ def main():
     pprint(response)
     
 
+def main():
+    parser = argparse.ArgumentParser(description="Esegue una query ES|QL sull'indice sample_data")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    with ProfileSession(args) as profiler, profiler.phase("run"):
+        run()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
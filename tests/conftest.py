@@ -0,0 +1,29 @@
+"""
+Fixture comuni dei test: i moduli del progetto sono nella radice del repository
+e i test girano contro il server stand-in di es_standin.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from elasticsearch import Elasticsearch  # noqa: E402
+
+from es_standin import EsStandInServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """Server stand-in che conserva i documenti ricevuti"""
+    with EsStandInServer(store_documents=True) as standin:
+        yield standin
+
+
+@pytest.fixture
+def es(server):
+    """Client Elasticsearch collegato al server stand-in"""
+    client = Elasticsearch([server.url])
+    yield client
+    client.close()
@@ -0,0 +1,25 @@
+import os
+
+from elasticsearch_movie_query import ActorFilmsSummary
+
+
+def _summary(es, tmp_path) -> ActorFilmsSummary:
+    return ActorFilmsSummary(es, checkpoint_file=str(tmp_path / "checkpoint.json"))
+
+
+def test_checkpoint_does_not_advance_when_actor_writes_fail(es, server, tmp_path):
+    server.store("movie_idx", "tt1", {"movie_title": "Film", "actor_1_name": "Vin Diesel",
+                                      "updated_at": "2024-06-01T10:00:00"})
+    server.reject_rate = 1.0
+
+    stats = _summary(es, tmp_path).refresh()
+
+    assert stats["failed"] == 1
+    assert not os.path.exists(tmp_path / "checkpoint.json")
+
+    server.reject_rate = 0.0
+    stats = _summary(es, tmp_path).refresh()
+
+    assert stats == {"movies": 1, "actors": 1, "failed": 0}
+    assert server.indices["actor_films"]["Vin Diesel"]["movie_ids"] == ["tt1"]
+    assert os.path.exists(tmp_path / "checkpoint.json")
@@ -0,0 +1,54 @@
+from elk_bulk import BulkSpool, bulk_with_retry
+
+
+def _actions(count: int) -> list:
+    return [{"_index": "logs", "_id": str(i), "_source": {"n": i}} for i in range(count)]
+
+
+def test_rejected_documents_are_retried_until_indexed(es, server):
+    server.reject_rate = 0.3
+
+    stats = bulk_with_retry(es, _actions(200), chunk_size=50, max_retries=20, sleep=lambda s: None)
+
+    assert stats["success"] == 200
+    assert stats["retried"] > 0
+    assert len(server.indices["logs"]) == 200
+
+
+def test_documents_still_rejected_go_to_spool_and_drain_later(es, server, tmp_path):
+    spool = BulkSpool(str(tmp_path / "spool"))
+    server.reject_rate = 1.0
+
+    stats = bulk_with_retry(es, _actions(10), max_retries=1, spool=spool, sleep=lambda s: None)
+
+    assert stats["spooled"] == 10
+    assert spool.pending() == 10
+
+    server.reject_rate = 0.0
+    for batch in spool.drain(batch_size=4):
+        assert bulk_with_retry(es, batch, spool=spool)["success"] == len(batch)
+    assert spool.pending() == 0
+    assert len(server.indices["logs"]) == 10
+
+
+def test_interrupted_drain_resumes_after_last_handled_batch(tmp_path):
+    spool = BulkSpool(str(tmp_path / "spool"))
+    spool.append(_actions(5))
+
+    batches = spool.drain(batch_size=2)
+    next(batches)
+    next(batches)  # Chiedere il blocco successivo conferma il precedente
+    batches.close()
+
+    assert BulkSpool(str(tmp_path / "spool")).pending() == 3
+
+
+def test_permanently_rejected_documents_are_not_retried(es, server, tmp_path):
+    spool = BulkSpool(str(tmp_path / "spool"))
+    server.apply = lambda op_type, index, doc_id, source: (400, "mapper_parsing_exception")
+
+    stats = bulk_with_retry(es, _actions(3), spool=spool, sleep=lambda s: None)
+
+    assert stats == {"success": 0, "failed": 3, "retried": 0, "spooled": 0}
+    assert spool.pending() == 0
+    assert (tmp_path / "spool" / BulkSpool.REJECTED_FILE).read_text().count("\n") == 3
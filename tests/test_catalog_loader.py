@@ -0,0 +1,67 @@
+import csv
+
+import pytest
+
+from movie_catalog_loader import MovieCatalogLoader, load_manifest
+
+FIELDS = ["movie_title", "actor_1_name", "movie_imdb_link"]
+ROWS = [
+    {"movie_title": "Film A", "actor_1_name": "Vin Diesel",
+     "movie_imdb_link": "http://www.imdb.com/title/tt0000001/"},
+    {"movie_title": "Film B", "actor_1_name": "Paul Walker",
+     "movie_imdb_link": "http://www.imdb.com/title/tt0000002/"},
+]
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_delete_of_missing_document_still_saves_manifest(es, server, tmp_path):
+    csv_file = tmp_path / "movies.csv"
+    manifest_file = str(tmp_path / "manifest.json")
+    loader = MovieCatalogLoader(es, manifest_file=manifest_file)
+    _write_csv(csv_file, ROWS)
+    loader.load(str(csv_file))
+
+    # Il film rimosso dal CSV non esiste più nemmeno nell'indice: la delete restituisce 404
+    _write_csv(csv_file, ROWS[:1])
+    del server.indices["movie_idx"]["tt0000002"]
+    assert loader.load(str(csv_file), allow_mass_delete=True)["deleted"] == 1
+    assert set(load_manifest(manifest_file)) == {"tt0000001"}
+
+    requests = server.stats["requests"]
+    assert loader.load(str(csv_file)) == {"unchanged": 1, "indexed": 0, "deleted": 0}
+    assert server.stats["requests"] == requests
+
+
+def test_unreadable_csv_deletes_nothing(es, server, tmp_path):
+    csv_file = tmp_path / "movies.csv"
+    manifest_file = str(tmp_path / "manifest.json")
+    loader = MovieCatalogLoader(es, manifest_file=manifest_file)
+    _write_csv(csv_file, ROWS)
+    loader.load(str(csv_file))
+
+    with pytest.raises(FileNotFoundError):
+        loader.load(str(tmp_path / "missing.csv"))
+
+    assert len(server.indices["movie_idx"]) == 2
+    assert len(load_manifest(manifest_file)) == 2
+
+
+def test_mass_delete_requires_explicit_flag(es, server, tmp_path):
+    csv_file = tmp_path / "movies.csv"
+    loader = MovieCatalogLoader(es, manifest_file=str(tmp_path / "manifest.json"))
+    _write_csv(csv_file, ROWS)
+    loader.load(str(csv_file))
+
+    _write_csv(csv_file, ROWS[:1])
+    with pytest.raises(ValueError):
+        loader.load(str(csv_file))
+    assert len(server.indices["movie_idx"]) == 2
+
+    assert loader.load(str(csv_file), allow_mass_delete=True)["deleted"] == 1
+    assert list(server.indices["movie_idx"]) == ["tt0000001"]
@@ -0,0 +1,88 @@
+from elk_bulk import ChunkTuner, index_pattern
+
+
+def _tuner(tmp_path, **kwargs) -> ChunkTuner:
+    return ChunkTuner(state_file=str(tmp_path / "tuning.json"), **kwargs)
+
+
+def test_slow_or_rejected_requests_halve_the_chunk(tmp_path):
+    tuner = _tuner(tmp_path, initial_docs=400)
+    tuner.observe(400, latency=2.0, rejected=0)
+    assert tuner.docs == 200
+
+    tuner.observe(200, latency=0.5, rejected=10)
+    assert tuner.docs == 100
+    assert tuner.stats["decreases"] == 2
+
+
+def test_decrease_never_goes_below_minimum(tmp_path):
+    tuner = _tuner(tmp_path, initial_docs=15, min_docs=10)
+    tuner.observe(15, latency=5.0, rejected=0)
+    tuner.observe(10, latency=5.0, rejected=0)
+    assert tuner.docs == 10
+
+
+def test_fast_full_chunks_grow_by_a_step(tmp_path):
+    tuner = _tuner(tmp_path, initial_docs=500, docs_step=250, max_docs=800)
+    tuner.observe(500, latency=0.1, rejected=0)
+    assert tuner.docs == 750
+
+    tuner.observe(750, latency=0.1, rejected=0)
+    assert tuner.docs == 800
+    assert tuner.stats["increases"] == 2
+
+
+def test_partial_chunk_or_latency_near_target_keeps_size(tmp_path):
+    tuner = _tuner(tmp_path, initial_docs=500)
+    tuner.observe(100, latency=0.1, rejected=0)
+    tuner.observe(500, latency=0.9, rejected=0)
+    assert tuner.docs == 500
+    assert tuner.stats["increases"] == tuner.stats["decreases"] == 0
+
+
+def test_chunk_docs_is_capped_by_bytes(tmp_path):
+    tuner = _tuner(tmp_path, initial_docs=1000, initial_bytes=100 * 1024, min_docs=10)
+    assert tuner.chunk_docs() == 1000
+
+    tuner.sample(1024)
+    assert tuner.chunk_docs() == 100
+
+    tuner.sample(1024 * 1024)
+    assert tuner.chunk_docs() == 10
+
+
+def test_decrease_starts_from_the_byte_limit(tmp_path):
+    tuner = _tuner(tmp_path, initial_docs=1000, initial_bytes=100 * 1024)
+    tuner.sample(1024)
+    tuner.observe(100, latency=2.0, rejected=0)
+    assert tuner.docs == 50
+
+
+def test_index_pattern_strips_date_suffix():
+    assert index_pattern("services-log-2024-06") == "services-log-*"
+    assert index_pattern("services-log-2024.06.01") == "services-log-*"
+    assert index_pattern("logs_2024") == "logs_*"
+    assert index_pattern("movie_idx") == "movie_idx"
+
+
+def test_learned_size_is_saved_per_pattern(tmp_path):
+    tuner = ChunkTuner.for_index("services-log-2024-06", initial_docs=500,
+                                 state_file=str(tmp_path / "tuning.json"))
+    for _ in range(20):
+        tuner.observe(tuner.chunk_docs(), latency=2.0, rejected=0)
+    tuner.save()
+
+    restored = ChunkTuner.for_index("services-log-2024-07", initial_docs=500,
+                                    state_file=str(tmp_path / "tuning.json"))
+    assert restored.pattern == "services-log-*"
+    assert restored.docs == int(tuner._learned_docs)
+    assert restored.docs < 500
+
+    other = ChunkTuner.for_index("movie_idx", initial_docs=500, state_file=str(tmp_path / "tuning.json"))
+    assert other.docs == 500
+
+
+def test_save_without_requests_writes_nothing(tmp_path):
+    tuner = ChunkTuner.for_index("logs", state_file=str(tmp_path / "tuning.json"))
+    tuner.save()
+    assert not (tmp_path / "tuning.json").exists()
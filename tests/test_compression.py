@@ -0,0 +1,46 @@
+import importlib.util
+
+import pytest
+
+from csv_to_json import csv_to_json, detect_compression, open_input, open_output
+
+SUFFIXES = [".gz", ".bz2", ".xz"]
+if importlib.util.find_spec("zstandard") is not None:
+    SUFFIXES.append(".zst")
+
+TEXT = "titolo,anno\n" + "La vita è bella,1997\n" * 1000
+
+
+@pytest.mark.parametrize("suffix", SUFFIXES)
+def test_open_output_and_open_input_round_trip(tmp_path, suffix):
+    path = str(tmp_path / f"data.csv{suffix}")
+    with open_output(path, compression_level=1) as f:
+        f.write(TEXT)
+
+    with open(path, 'rb') as f:
+        assert len(f.read()) < len(TEXT)
+    with open_input(path) as f:
+        assert f.read() == TEXT
+
+
+def test_uncompressed_path_is_plain_text(tmp_path):
+    path = str(tmp_path / "data.csv")
+    assert detect_compression(path) is None
+    with open_output(path) as f:
+        f.write(TEXT)
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == TEXT
+
+
+@pytest.mark.parametrize("suffix", SUFFIXES)
+def test_csv_to_json_reads_and_writes_compressed_files(tmp_path, suffix):
+    source = str(tmp_path / f"movies.csv{suffix}")
+    with open_output(source) as f:
+        f.write(TEXT)
+
+    output = str(tmp_path / f"movies.json{suffix}")
+    rows = csv_to_json(source, output)
+
+    assert len(rows) == 1000
+    with open_input(output) as f:
+        assert f.read().count("La vita") == 1000
@@ -0,0 +1,52 @@
+import csv
+import json
+
+from elk_export import IndexExporter
+
+
+def _exporter(server) -> IndexExporter:
+    return IndexExporter(host=server.host, port=server.port)
+
+
+def test_csv_encodes_nested_values_as_json(server, tmp_path):
+    server.store("docs", "1", {"name": "a", "x": {"a": 1}, "tags": ["t1", "t2"]})
+    output = tmp_path / "docs.csv"
+
+    _exporter(server).export("docs", str(output), slices=1)
+
+    with open(output, newline='', encoding='utf-8') as f:
+        row = next(csv.DictReader(f))
+    assert json.loads(row["x"]) == {"a": 1}
+    assert json.loads(row["tags"]) == ["t1", "t2"]
+
+
+def test_csv_warns_about_fields_missing_from_first_page(server, tmp_path, capsys):
+    server.store("docs", "1", {"name": "a"})
+    server.store("docs", "2", {"name": "b", "late": 1})
+    output = tmp_path / "docs.csv"
+
+    _exporter(server).export("docs", str(output), slices=1, page_size=1)
+
+    assert "late" in capsys.readouterr().out
+    with open(output, newline='', encoding='utf-8') as f:
+        assert next(csv.reader(f)) == ["name"]
+
+
+def test_ndjson_keeps_index_and_id_by_default(server, tmp_path):
+    server.store("docs", "doc-1", {"name": "a"})
+    output = tmp_path / "docs.ndjson"
+
+    _exporter(server).export("docs", str(output), slices=1)
+
+    with open(output, encoding='utf-8') as f:
+        assert json.loads(f.readline()) == {"_index": "docs", "_id": "doc-1", "name": "a"}
+
+
+def test_csv_meta_columns_precede_requested_fields(server, tmp_path):
+    server.store("docs", "doc-1", {"name": "a", "other": 1})
+    output = tmp_path / "docs.csv"
+
+    _exporter(server).export("docs", str(output), fields=["name"], slices=1, include_meta=True)
+
+    with open(output, newline='', encoding='utf-8') as f:
+        assert list(csv.reader(f)) == [["_index", "_id", "name"], ["docs", "doc-1", "a"]]
@@ -0,0 +1,29 @@
+import json
+
+from elk_log_encoder import BulkBodyBuilder, LogRecord
+
+
+def _records() -> list:
+    return [
+        LogRecord("2024-06-01T10:00:00", "api", "OK", 120, 1, "production"),
+        LogRecord("2024-06-01T10:00:01", "pagamenti-€", "KO", 900, 2, "staging",
+                  error_message='Timeout "gateway" àèì\n', error_code=504),
+    ]
+
+
+def test_encode_matches_json_dumps_of_to_dict():
+    records = _records()
+    action = json.dumps({"index": {"_index": "logs"}}, separators=(",", ":"))
+    expected = "".join(
+        action + "\n" + json.dumps(record.to_dict(), ensure_ascii=False, separators=(",", ":")) + "\n"
+        for record in records
+    ).encode("utf-8")
+
+    assert BulkBodyBuilder("logs").encode(records) == expected
+
+
+def test_encode_reuses_buffer_between_calls():
+    builder = BulkBodyBuilder("logs")
+    first = builder.encode(_records())
+    builder.encode(_records()[:1])
+    assert builder.encode(_records()) == first
@@ -0,0 +1,105 @@
+import json
+
+from elk_rollup import RollupAggregator, rollup_id
+from elk_send_json import FileShipper
+
+INDEX = "services-rollup-2024-06"
+KEY = ("2024-06-01T10:00:00", "api", "OK", "production")
+
+
+def _log(minute: int, latency: int) -> dict:
+    return {"timestamp": f"2024-06-01T10:{minute:02d}:30", "service": "api", "status": "OK",
+            "environment": "production", "response_time_ms": latency}
+
+
+def _aggregator(es, **kwargs) -> RollupAggregator:
+    return RollupAggregator(es, raw_sample_rate=0.0, **kwargs)
+
+
+def test_forced_flushes_rewrite_one_document_per_key(es, server):
+    rollup = _aggregator(es)
+    rollup.add_log(_log(0, 100))
+    rollup.flush(force=True)
+    rollup.add_log(_log(0, 300))
+    rollup.flush(force=True)
+
+    assert list(server.indices[INDEX]) == [rollup_id(KEY)]
+    document = server.indices[INDEX][rollup_id(KEY)]
+    assert document["count"] == 2
+    assert document["latency_max"] == 300
+
+
+def test_independent_producers_merge_into_existing_document(es, server):
+    for latency in (100, 200):
+        rollup = _aggregator(es)
+        rollup.add_log(_log(0, latency))
+        rollup.flush(force=True)
+
+    document = server.indices[INDEX][rollup_id(KEY)]
+    assert document["count"] == 2
+    assert document["latency_min"] == 100
+
+
+def test_late_events_merge_into_closed_minute(es, server):
+    rollup = _aggregator(es, merge_existing=False)
+    rollup.add_log(_log(0, 100))
+    rollup.add_log(_log(1, 100))
+    rollup.flush()
+    rollup.add_log(_log(0, 500))
+    rollup.flush()
+
+    assert server.indices[INDEX][rollup_id(KEY)]["count"] == 2
+
+
+def test_shipper_restart_rebuilds_open_minutes_without_double_counting(es, server, tmp_path):
+    path = tmp_path / "app.ndjson"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("".join(json.dumps(_log(minute, 100)) + "\n" for minute in (0, 0, 1, 1)))
+
+    def ship():
+        shipper = FileShipper(es, [str(path)], checkpoint_file=str(tmp_path / "checkpoint.json"),
+                              rollup=_aggregator(es, merge_existing=False))
+        shipper.run(follow=False)
+
+    ship()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(_log(1, 100)) + "\n")
+    ship()
+    # Riavvio senza nuove righe (come dopo un crash tra invio e checkpoint)
+    ship()
+
+    counts = sorted(doc["count"] for doc in server.indices[INDEX].values())
+    assert counts == [2, 3]
+
+
+def test_failed_flush_keeps_closed_minutes_until_written(es, server, monkeypatch):
+    monkeypatch.setattr("elk_bulk.time.sleep", lambda seconds: None)
+    rollup = _aggregator(es, merge_existing=False)
+    rollup.add_log(_log(0, 100))
+    rollup.add_log(_log(1, 100))
+    server.reject_rate = 1.0
+    assert rollup.flush()["failed"] == 1
+    assert "2024-06-01T10:00:00" in rollup.open_minutes()
+
+    server.reject_rate = 0.0
+    rollup.flush()
+    assert rollup.open_minutes() == {"2024-06-01T10:01:00"}
+    assert server.indices[INDEX][rollup_id(KEY)]["count"] == 1
+
+
+def test_shipper_raw_samples_are_deterministic_across_restarts(es, server, tmp_path):
+    path = tmp_path / "app.ndjson"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("".join(json.dumps(_log(0, latency)) + "\n" for latency in range(200)))
+
+    def ship():
+        rollup = RollupAggregator(es, raw_sample_rate=0.25, raw_index="raw", merge_existing=False)
+        shipper = FileShipper(es, [str(path)], checkpoint_file=str(tmp_path / "checkpoint.json"),
+                              rollup=rollup)
+        shipper.run(follow=False)
+        return set(server.indices["raw"])
+
+    first = ship()
+    # Il minuto era ancora aperto: al riavvio le righe si rileggono e si ricampionano
+    assert ship() == first
+    assert 0 < len(first) < 200
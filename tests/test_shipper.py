@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from elk_bulk import BulkSpool
+from elk_send_json import FileShipper
+
+
+def _write_lines(path, documents):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("".join(json.dumps(doc) + "\n" for doc in documents))
+
+
+def _ship(es, path, tmp_path, **kwargs) -> FileShipper:
+    shipper = FileShipper(es, [str(path)], index_name="logs",
+                          checkpoint_file=str(tmp_path / "checkpoint.json"), **kwargs)
+    shipper.run(follow=False)
+    return shipper
+
+
+def test_truncated_file_is_reread_on_restart(es, server, tmp_path):
+    path = tmp_path / "app.ndjson"
+    _write_lines(path, [{"n": i, "padding": "x" * 20} for i in range(5)])
+    assert _ship(es, path, tmp_path).stats["success"] == 5
+
+    # Stesso inode, contenuto più corto dell'offset salvato
+    with open(path, 'r+', encoding='utf-8') as f:
+        f.truncate(0)
+        f.write("".join(json.dumps({"n": 100 + i}) + "\n" for i in range(3)))
+
+    assert _ship(es, path, tmp_path).stats["success"] == 3
+
+
+def test_copy_and_truncate_does_not_overwrite_shipped_lines(es, server, tmp_path):
+    path = tmp_path / "app.ndjson"
+    _write_lines(path, [{"n": 0}])
+    shipper = FileShipper(es, [str(path)], index_name="logs",
+                          checkpoint_file=str(tmp_path / "checkpoint.json"))
+    shipper.ship_once()
+    shipper.flush()
+
+    # Copy-and-truncate: stesso inode, stessa lunghezza, contenuto diverso
+    with open(path, 'r+', encoding='utf-8') as f:
+        f.truncate(0)
+        f.write(json.dumps({"n": 1}) + "\n")
+    shipper.ship_once()
+    shipper.flush()
+
+    assert sorted(doc["n"] for doc in server.indices["logs"].values()) == [0, 1]
+
+
+def test_rewritten_file_gets_new_ids_after_restart(es, server, tmp_path):
+    path = tmp_path / "app.ndjson"
+    _write_lines(path, [{"n": 0}, {"n": 1}])
+    _ship(es, path, tmp_path)
+
+    _write_lines(path, [{"n": 2}, {"n": 3}])
+    assert _ship(es, path, tmp_path).stats["success"] == 2
+
+    assert sorted(doc["n"] for doc in server.indices["logs"].values()) == [0, 1, 2, 3]
+
+
+def test_run_drains_spool_left_by_previous_run(es, server, tmp_path):
+    spool_dir = tmp_path / "spool"
+    BulkSpool(str(spool_dir)).append([{"_index": "logs", "_id": "spooled-1", "_source": {"n": 7}}])
+    path = tmp_path / "app.ndjson"
+    _write_lines(path, [])
+
+    shipper = _ship(es, path, tmp_path, spool_dir=str(spool_dir))
+
+    assert shipper.stats["success"] == 1
+    assert server.indices["logs"]["spooled-1"] == {"n": 7}
+    assert BulkSpool(str(spool_dir)).pending() == 0
+
+
+def test_failed_batch_keeps_checkpoint_until_sent(es, server, tmp_path):
+    path = tmp_path / "app.ndjson"
+    _write_lines(path, [{"n": i} for i in range(5)])
+    server.reject_rate = 1.0
+    shipper = FileShipper(es, [str(path)], index_name="logs",
+                          checkpoint_file=str(tmp_path / "checkpoint.json"))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr("elk_bulk.time.sleep", lambda seconds: None)
+        assert shipper.run(follow=False)["failed"] == 5
+
+    with open(tmp_path / "checkpoint.json", encoding='utf-8') as f:
+        assert json.load(f)[str(path)]["offset"] == 0
+
+    server.reject_rate = 0.0
+    assert _ship(es, path, tmp_path).stats["success"] == 5
+    assert len(server.indices["logs"]) == 5